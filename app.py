@@ -1,34 +1,232 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from dotenv import load_dotenv
 import os
 import sys
-import io
-import PyPDF2
+import json
+import itertools
+import threading
+import time
 
 # Adiciona o diretório src ao path para importar os módulos
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
-from nlp_processor import NLPProcessor
+from nlp_processor import NLPRegistry
 from gemini_service import GeminiService
-from supabase_service import SupabaseService
+from supabase_service import SupabaseService, decode_cursor, has_pending_writes
 from email_service import EmailService
+from imap_pool import IMAPConnectionPool
+from sync_state import SyncStateStore
+from local_classifier import LocalClassifier
+from model_health import ModelsUnavailable
+from near_duplicate import NearDuplicateIndex
+from rate_limiter import RateLimitExceeded
+from pdf_extractor import discard_spool, extract_pdf_text, iter_pdf_pages, reset_executor, spool_upload
+import metrics
 
 # Carrega as variáveis de ambiente do arquivo .env no diretório atual
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+import config  # Lê as variáveis já carregadas do .env
 
 app = Flask(__name__)
+# Rejeita uploads e corpos JSON acima do limite enquanto são lidos (413),
+# antes de serem carregados inteiros na memória
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE
 # Habilita CORS para todas as rotas, incluindo /health
 CORS(app, resources={
-    r"/api/*": {"origins": "*"},
+    r"/api/*": {"origins": "*", "expose_headers": ["X-Next-Cursor", "Server-Timing"]},
     r"/health": {"origins": "*"},
     r"/": {"origins": "*"}
 })
 
-# Inicializa os serviços
-nlp = NLPProcessor()
-gemini = GeminiService()
-supabase = SupabaseService()
-email_srv = EmailService()
+# Serviços criados na primeira utilização (e não no import), para um cold start rápido
+_services = {}
+_services_lock = threading.RLock()
+
+def _service(name, factory):
+    if name not in _services:
+        with _services_lock:
+            if name not in _services:
+                _services[name] = factory()
+    return _services[name]
+
+def _create_nlp():
+    # Um processador por idioma (RSLP para pt, Snowball para en/es), criados sob demanda
+    processor = NLPRegistry(config.SUPPORTED_LANGUAGES, stem_cache_size=int(os.getenv("STEM_CACHE_SIZE", 10000)),
+                            timer=metrics.span)
+    # STEM_CACHE_WARMUP_FILE com {lang} (ex.: freq_{lang}.txt) aquece cada idioma com a sua lista
+    if os.getenv("STEM_CACHE_WARMUP_FILE"):
+        processor.warm_stem_cache(os.getenv("STEM_CACHE_WARMUP_FILE"))
+    return processor
+
+def _create_local_classifier():
+    # Classificador local (train_classifier.py): resolve os emails óbvios sem chamar o Gemini
+    if os.getenv("LOCAL_CLASSIFIER", "true").lower() != "true":
+        return None
+    return LocalClassifier.load(config.CLASSIFIER_MODEL_PATH, config.VECTORIZER_PATH)
+
+def _create_near_duplicates():
+    # Índice SimHash de emails já analisados pelo Gemini (cópias de newsletters, recibos, alertas)
+    if os.getenv("NEAR_DUP_ENABLED", "true").lower() != "true":
+        return None
+    return NearDuplicateIndex(
+        path=os.getenv("NEAR_DUP_INDEX_PATH", os.path.join("data", "near_duplicates.sqlite3")),
+        max_distance=int(os.getenv("NEAR_DUP_MAX_DISTANCE", 8)),
+        max_entries=int(os.getenv("NEAR_DUP_MAX_ENTRIES", 50000))
+    )
+
+def get_nlp():
+    return _service("nlp", _create_nlp)
+
+def get_gemini():
+    return _service("gemini", GeminiService)
+
+def get_supabase():
+    return _service("supabase", SupabaseService)
+
+def get_imap_pool():
+    # Pool de sessões IMAP autenticadas, compartilhado entre requisições da mesma conta
+    return _service("imap_pool", lambda: IMAPConnectionPool(
+        max_per_account=int(os.getenv("IMAP_POOL_MAX_PER_ACCOUNT", 2)),
+        idle_timeout=float(os.getenv("IMAP_POOL_IDLE_TIMEOUT", 300)),
+        keepalive_interval=float(os.getenv("IMAP_POOL_KEEPALIVE", 60))
+    ))
+
+def get_email_service():
+    return _service("email_srv", lambda: EmailService(pool=get_imap_pool()))
+
+def get_sync_state():
+    # Checkpoints da sincronização incremental (último UID visto por caixa)
+    return _service("sync_state", lambda: SyncStateStore(
+        os.getenv("IMAP_SYNC_STATE_PATH", os.path.join("data", "imap_sync.sqlite3"))
+    ))
+
+def get_local_classifier():
+    return _service("local_classifier", _create_local_classifier)
+
+def get_near_duplicates():
+    return _service("near_duplicates", _create_near_duplicates)
+
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", 0.9))
+# Similaridade mínima para reaproveitar a resposta sugerida escrita para outro email
+NEAR_DUP_REPLY_SIMILARITY = float(os.getenv("NEAR_DUP_REPLY_SIMILARITY", 0.98))
+
+# Serviços com sockets, pools HTTP ou threads: nunca herdados do processo master
+_PER_PROCESS_SERVICES = ("gemini", "supabase", "imap_pool", "email_srv", "near_duplicates")
+
+WARMUP_TEXT = "Olá equipe, podem confirmar a reunião de amanhã e enviar o relatório atualizado?"
+
+def warm_up():
+    """
+    Carrega o estado somente leitura antes do fork dos workers (gunicorn com
+    preload_app): recursos do NLTK, cache de stems e classificador local ficam
+    em páginas compartilhadas por copy-on-write
+    """
+    nlp = get_nlp()
+    nlp.warm_up()
+    nlp.process_all(WARMUP_TEXT)
+    get_local_classifier()
+
+def reset_after_fork():
+    """Descarta no worker os clientes de rede e pools herdados do master; são recriados no primeiro uso"""
+    global _services_lock
+    _services_lock = threading.RLock()
+    for name in _PER_PROCESS_SERVICES:
+        _services.pop(name, None)
+    reset_executor()
+    replay_pending_writes()
+
+def replay_pending_writes():
+    """
+    Cria o SupabaseService do worker se o journal da fila write-behind tiver
+    análises pendentes: o serviço é criado sob demanda e, sem isso, um worker
+    que nunca grava nada nunca reenviaria o journal
+    """
+    if has_pending_writes():
+        get_supabase()
+
+def local_analysis(stemmed_text, need_reply=True):
+    """Análise do classificador local, ou None quando o email deve ir para o Gemini"""
+    local_classifier = get_local_classifier()
+    if local_classifier is None:
+        return None
+    return local_classifier.decide(stemmed_text, LOCAL_CLASSIFIER_THRESHOLD, need_reply)
+
+def near_duplicate_analysis(stems, need_reply=True, user=None):
+    """Análise reaproveitada de um email quase idêntico já analisado para o mesmo usuário, ou None"""
+    index = get_near_duplicates()
+    if index is None:
+        return None
+    # Só análises do próprio usuário: resposta e justificativa citam o conteúdo do email original
+    match = index.lookup(stems, owner=user)
+    if match is None:
+        return None
+    analysis = match["analysis"]
+    if analysis.get("classification") == "produtivo" and need_reply \
+            and match["similarity"] < NEAR_DUP_REPLY_SIMILARITY:
+        return None
+    return {
+        **analysis,
+        "model_used": f"near_duplicate:{analysis.get('model_used')}",
+        "near_duplicate": {"id": match["id"], "similarity": match["similarity"]}
+    }
+
+def fast_path_analysis(nlp_result, need_reply=True, user=None):
+    """Análise sem chamar o Gemini (quase-duplicata do usuário ou classificador local), ou None"""
+    return near_duplicate_analysis(nlp_result["stems"], need_reply, user) \
+        or local_analysis(nlp_result["stemmed_text"], need_reply)
+
+def remember_analysis(nlp_result, analysis, user=None):
+    """Indexa uma análise nova do Gemini para reaproveitá-la em quase-duplicatas do mesmo usuário"""
+    index = get_near_duplicates()
+    if index is None or analysis.get("classification") not in ("produtivo", "improdutivo"):
+        return
+    # Análises que já vieram do cache, do modelo local ou do próprio índice não são indexadas de novo
+    if str(analysis.get("model_used", "")).startswith(("cache:", "local", "near_duplicate:")):
+        return
+    index.add(nlp_result["stems"], {
+        key: analysis.get(key) for key in ("classification", "suggested_response", "reasoning", "model_used")
+    }, owner=user)
+
+def limit_text(text):
+    """Corta o texto em MAX_TEXT_LENGTH caracteres antes do NLP e do prompt"""
+    if len(text) <= config.MAX_TEXT_LENGTH:
+        return text, False
+    return text[:config.MAX_TEXT_LENGTH], True
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"error": f"Arquivo ou texto excede o limite de {config.MAX_FILE_SIZE} bytes"}), 413
+
+@app.errorhandler(RateLimitExceeded)
+def rate_limit_exceeded(e):
+    # Limite de chamadas ao Gemini (por usuário ou global): o cliente deve tentar depois
+    return jsonify({"error": str(e), "retry_after": e.retry_after_seconds}), 429, \
+        {"Retry-After": str(e.retry_after_seconds)}
+
+@app.errorhandler(ModelsUnavailable)
+def models_unavailable(e):
+    # Todos os circuitos abertos: o Gemini não é chamado até o primeiro cooldown acabar
+    return jsonify({"error": str(e), "retry_after": e.retry_after_seconds}), 503, \
+        {"Retry-After": str(e.retry_after_seconds)}
+
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    # Etapas medidas durante a requisição (NLP, Gemini, Supabase, IMAP, PDF) e o total
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    response.headers['Server-Timing'] = metrics.finish_request(request.method, endpoint, response.status_code, elapsed)
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def home():
@@ -38,6 +236,14 @@ def home():
 def health():
     return jsonify({"status": "healthy"})
 
+@app.route('/api/models/health', methods=['GET'])
+def models_health():
+    return jsonify(get_gemini().get_model_stats())
+
+@app.route('/api/write-queue', methods=['GET'])
+def write_queue_stats():
+    return jsonify(get_supabase().write_queue_stats())
+
 @app.route('/api/fetch-emails', methods=['GET'])
 def fetch_emails():
     try:
@@ -50,16 +256,24 @@ def fetch_emails():
             return jsonify({"error": "Configurações de email não encontradas. Por favor, configure seu email e senha de app no painel de configurações."}), 400
         
         limit = request.args.get('limit', default=10, type=int)
+        # Modo leve: apenas cabeçalhos e o início do corpo
+        preview = request.args.get('preview', 'false').lower() == 'true'
+        # Incremental: apenas emails com UID maior que o último já retornado
+        incremental = request.args.get('incremental', 'false').lower() == 'true'
         
         # Instancia um novo serviço se houver credenciais dinâmicas
         if request.args.get('email_user'):
-            temp_srv = EmailService()
-            temp_srv.user = user
-            temp_srv.password = password
-            temp_srv.host = host
-            emails = temp_srv.fetch_latest_emails(limit=limit)
+            srv = EmailService(pool=get_imap_pool())
+            srv.user = user
+            srv.password = password
+            srv.host = host
+        else:
+            srv = get_email_service()
+        
+        if incremental:
+            emails = srv.fetch_new_emails(get_sync_state(), limit=limit, preview=preview)
         else:
-            emails = email_srv.fetch_latest_emails(limit=limit)
+            emails = srv.fetch_latest_emails(limit=limit, preview=preview)
             
         return jsonify(emails)
     except Exception as e:
@@ -73,22 +287,69 @@ def get_history():
             return jsonify([]) # Retorna vazio se não houver email configurado
             
         limit = request.args.get('limit', default=20, type=int)
-        history = supabase.get_history(user_email, limit=limit)
-        return jsonify(history)
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except Exception:
+                return jsonify({"error": "Invalid cursor"}), 400
+        # Projeção opcional: ?fields=subject,sender,classification (sem original_text)
+        fields = request.args.get('fields')
+        
+        page = get_supabase().get_history_page(
+            user_email,
+            limit=limit,
+            cursor=cursor,
+            fields=fields.split(',') if fields else None,
+            classification=request.args.get('classification'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to')
+        )
+        
+        # O corpo continua sendo a lista; o cursor da próxima página vai no cabeçalho
+        response = jsonify(page["items"])
+        if page["next_cursor"]:
+            response.headers['X-Next-Cursor'] = page["next_cursor"]
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/history/<id>', methods=['DELETE'])
 def delete_history_item(id):
     try:
-        success = supabase.delete_analysis(id)
+        success = get_supabase().delete_analysis(id)
         if success:
             return jsonify({"message": "Item deleted successfully"}), 200
+        elif success is False:
+            return jsonify({"error": "Item not found"}), 404
         else:
             return jsonify({"error": "Failed to delete item"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/history', methods=['DELETE'])
+def delete_history_items():
+    try:
+        data = request.get_json(silent=True) or {}
+        user_email = data.get('email_user') or os.getenv("EMAIL_USER")
+        if not user_email:
+            return jsonify({"error": "Usuário não identificado. Configure seu email."}), 400
+        
+        ids = data.get('ids')
+        if ids is not None and not isinstance(ids, list):
+            return jsonify({"error": "ids must be a list"}), 400
+        filters = {key: data.get(key) for key in ('sender', 'classification', 'older_than')}
+        # Sem ids nem filtros o delete removeria todo o histórico do usuário
+        if ids is None and not any(filters.values()):
+            return jsonify({"error": "Provide ids or at least one filter (sender, classification, older_than)"}), 400
+        
+        deleted = get_supabase().delete_analyses(user_email, ids=ids, **filters)
+        if deleted is None:
+            return jsonify({"error": "Failed to delete items"}), 500
+        return jsonify({"deleted": deleted})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/process-file', methods=['POST'])
 def process_file():
     try:
@@ -99,60 +360,210 @@ def process_file():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
 
-        if file.filename.endswith('.pdf'):
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return jsonify({"text": text})
-        else:
+        if not file.filename.endswith('.pdf'):
             return jsonify({"error": "Unsupported file format"}), 400
+        
+        max_pages = request.args.get('max_pages', type=int)
+        max_chars = min(request.args.get('max_chars', default=config.MAX_TEXT_LENGTH, type=int),
+                        config.MAX_TEXT_LENGTH)
+        stream = request.args.get('stream', 'false').lower() == 'true'
+        
+        # Uploads grandes vão para um arquivo temporário em vez de ficar na memória
+        source = spool_upload(file.stream, spool_dir=config.UPLOAD_DIR)
+        
+        # Um caractere além do limite indica se o texto do PDF foi cortado
+        if not stream:
+            try:
+                with metrics.span("pdf.extract"):
+                    text = extract_pdf_text(source, max_pages, max_chars + 1)
+                return jsonify({"text": text[:max_chars], "truncated": len(text) > max_chars})
+            finally:
+                discard_spool(source)
+        
+        # Streaming NDJSON: uma linha por página, assim que ela é extraída
+        def generate():
+            pages = 0
+            total_chars = 0
+            truncated = False
+            started = time.perf_counter()
+            try:
+                for number, text in iter_pdf_pages(source, max_pages, max_chars + 1):
+                    if total_chars + len(text) > max_chars:
+                        text, truncated = text[:max_chars - total_chars], True
+                    total_chars += len(text)
+                    pages = number
+                    yield json.dumps({"page": number, "text": text}, ensure_ascii=False) + "\n"
+                metrics.observe("pdf.extract", time.perf_counter() - started)
+                yield json.dumps({"done": True, "pages": pages, "truncated": truncated}) + "\n"
+            except Exception as e:
+                metrics.observe("pdf.extract", time.perf_counter() - started, error=True)
+                yield json.dumps({"error": str(e)}) + "\n"
+            finally:
+                discard_spool(source)
+        
+        response = Response(generate(), mimetype='application/x-ndjson')
+        # O finally do gerador não roda se o cliente desconectar antes da primeira página
+        response.call_on_close(lambda: discard_spool(source))
+        return response
             
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def parse_process_request(data):
+    """
+    Valida e normaliza o corpo de /api/process (compartilhado com o modo ASGI)
+
+    Returns:
+        Tupla (campos da requisição, None) ou (None, mensagem de erro)
+    """
+    if not data or 'text' not in data:
+        return None, "No text provided"
+    
+    text, truncated = limit_text(data['text'])
+    user_email = data.get('email_user') or os.getenv("EMAIL_USER")
+    if not user_email:
+        return None, "Usuário não identificado. Configure seu email."
+    
+    return {
+        "text": text,
+        "truncated": truncated,
+        "subject": data.get('subject', 'Manual Input'),
+        "sender": data.get('sender', 'User'),
+        "user_email": user_email,
+        # Sem resposta sugerida, emails produtivos também podem ficar no modelo local
+        "suggest_reply": data.get('suggest_reply', True) is not False
+    }, None
+
+def analysis_record(fields, gemini_analysis):
+    # Análise com os metadados do email, no formato salvo no Supabase
+    return {
+        **gemini_analysis,
+        "subject": fields["subject"],
+        "sender": fields["sender"]
+    }
+
+def build_process_result(fields, nlp_result, gemini_analysis):
+    return {
+        "original_text": fields["text"],
+        "truncated": fields["truncated"],
+        **nlp_result,
+        "gemini_analysis": gemini_analysis
+    }
+
+def local_stream_events(analysis):
+    # Eventos equivalentes aos do streaming do Gemini para uma análise já pronta
+    return [("classification", analysis["classification"]), ("done", analysis)]
+
+def sse_event(fields, nlp_result, event, value):
+    """
+    Formata um evento do streaming de /api/process como SSE
+
+    O evento final (done) traz o mesmo corpo da resposta não streaming e agenda
+    a gravação do histórico.
+    """
+    if event == "done":
+        remember_analysis(nlp_result, value, fields["user_email"])
+        get_supabase().enqueue_analysis(fields["text"], analysis_record(fields, value), fields["user_email"])
+        data = build_process_result(fields, nlp_result, value)
+    elif event == "token":
+        data = {"text": value}
+    else:
+        data = {event: value}
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
 @app.route('/api/process', methods=['POST'])
 def process_email():
+    try:
+        fields, error = parse_process_request(request.get_json())
+        if error:
+            return jsonify({"error": error}), 400
+        text = fields["text"]
+            
+        # Pipeline de processamento em uma única passada
+        nlp_result = get_nlp().process_all(text)
+        
+        # Streaming (SSE): classificação assim que lida, depois a resposta sugerida aos pedaços
+        if request.args.get('stream', 'false').lower() == 'true':
+            local = fast_path_analysis(nlp_result, fields["suggest_reply"], fields["user_email"])
+            events = iter(local_stream_events(local)) if local \
+                else get_gemini().analyze_email_stream(nlp_result["stemmed_text"], text, fields["user_email"])
+            # Primeiro evento antes de abrir o stream: limite de chamadas ainda vira um 429 (ou 503)
+            events = itertools.chain([next(events)], events)
+            
+            def generate():
+                for event, value in events:
+                    yield sse_event(fields, nlp_result, event, value)
+            
+            return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+        
+        # Quase-duplicatas e classificador local primeiro; o Gemini só recebe os casos incertos
+        gemini_analysis = fast_path_analysis(nlp_result, fields["suggest_reply"], fields["user_email"])
+        if gemini_analysis is None:
+            gemini_analysis = get_gemini().analyze_email(nlp_result["stemmed_text"], text, fields["user_email"])
+            remember_analysis(nlp_result, gemini_analysis, fields["user_email"])
+
+        # Salva no Supabase com metadados e vínculo do usuário (em segundo plano)
+        get_supabase().enqueue_analysis(text, analysis_record(fields, gemini_analysis), fields["user_email"])
+        
+        return jsonify(build_process_result(fields, nlp_result, gemini_analysis))
+    except (RequestEntityTooLarge, RateLimitExceeded, ModelsUnavailable):
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/process-batch', methods=['POST'])
+def process_batch():
     try:
         data = request.get_json()
-        if not data or 'text' not in data:
-            return jsonify({"error": "No text provided"}), 400
+        if not data or not isinstance(data.get('emails'), list) or not data['emails']:
+            return jsonify({"error": "No emails provided"}), 400
         
-        text = data['text']
-        subject = data.get('subject', 'Manual Input')
-        sender = data.get('sender', 'User')
-        user_email = data.get('email_user') or os.getenv("EMAIL_USER")
+        emails = data['emails']
+        max_batch = int(os.getenv("BATCH_MAX_EMAILS", 100))
+        if len(emails) > max_batch:
+            return jsonify({"error": f"Máximo de {max_batch} emails por lote"}), 400
+        if any(not isinstance(item, dict) or not item.get('text') for item in emails):
+            return jsonify({"error": "Each email must provide a text"}), 400
         
+        user_email = data.get('email_user') or os.getenv("EMAIL_USER")
         if not user_email:
             return jsonify({"error": "Usuário não identificado. Configure seu email."}), 400
-            
-        # Pipeline de processamento passo a passo
-        cleaned_text = nlp.clean_text(text)
-        text_no_stopwords = nlp.remove_stopwords(cleaned_text)
-        stemmed_text = nlp.apply_stemming(text_no_stopwords)
-        
-        # Análise com Gemini
-        gemini_analysis = gemini.analyze_email(stemmed_text, text)
-
-        # Salva no Supabase com metadados e vínculo do usuário
-        analysis_to_save = {
-            **gemini_analysis,
-            "subject": subject,
-            "sender": sender
-        }
-        supabase.save_analysis(text, analysis_to_save, user_email)
-
-        result = {
-            "original_text": text,
-            "cleaned_text": cleaned_text,
-            "text_no_stopwords": text_no_stopwords,
-            "stemmed_text": stemmed_text,
-            "stems": stemmed_text.split(),
-            "gemini_analysis": gemini_analysis
-        }
-        
-        return jsonify(result)
+        
+        # Mesmos campos de /api/process para cada email (texto cortado, assunto e remetente padrão)
+        suggest_reply = data.get('suggest_reply', True)
+        batch = [parse_process_request({**item, 'email_user': user_email, 'suggest_reply': suggest_reply})[0]
+                 for item in emails]
+        
+        nlp = get_nlp()
+        nlp_results = [nlp.process_all(fields['text']) for fields in batch]
+        
+        # Quase-duplicatas e classificador local primeiro; os demais vão ao Gemini agrupados por chamada
+        analyses = [fast_path_analysis(nlp_result, fields['suggest_reply'], user_email)
+                    for fields, nlp_result in zip(batch, nlp_results)]
+        escalated = [i for i, analysis in enumerate(analyses) if analysis is None]
+        if escalated:
+            remote = get_gemini().analyze_batch([
+                (nlp_results[i]["stemmed_text"], batch[i]['text']) for i in escalated
+            ], user=user_email)
+            for i, analysis in zip(escalated, remote):
+                analyses[i] = analysis
+                remember_analysis(nlp_results[i], analysis, user_email)
+        
+        # Agenda a gravação das análises (a fila agrupa os inserts)
+        get_supabase().enqueue_analyses([
+            (fields['text'], analysis_record(fields, analysis)) for fields, analysis in zip(batch, analyses)
+        ], user_email)
+        
+        return jsonify([
+            build_process_result(fields, nlp_result, analysis)
+            for fields, nlp_result, analysis in zip(batch, nlp_results, analyses)
+        ])
+    except (RequestEntityTooLarge, RateLimitExceeded, ModelsUnavailable):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,159 @@
+"""
+Modo de servidor assíncrono (ASGI) do AutoU Backend
+
+/api/process roda como view assíncrona: o NLP vai para um pool de threads, o
+Gemini usa o cliente assíncrono e o histórico vai para a fila write-behind (ou
+para o cliente assíncrono do Supabase), de modo que um único worker atende
+muitas classificações em andamento. As demais rotas são servidas pelo app
+Flask existente, com os mesmos serviços.
+
+Execução:
+    uvicorn asgi:app --host 0.0.0.0 --port 10000
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import metrics
+from model_health import ModelsUnavailable
+from rate_limiter import RateLimitExceeded
+from app import (SSE_HEADERS, app as flask_app, analysis_record, build_process_result, config, get_gemini,
+                 get_nlp, get_supabase, fast_path_analysis, local_stream_events, parse_process_request,
+                 remember_analysis, sse_event)
+
+# Pool para o trabalho de CPU do NLP, fora do event loop
+nlp_executor = ThreadPoolExecutor(max_workers=int(os.getenv("NLP_THREADS", 4)))
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class InvalidRequest(Exception):
+    pass
+
+
+async def read_limited_body(request):
+    """Lê o corpo em streaming, abortando assim que passar de MAX_FILE_SIZE"""
+    content_length = request.headers.get("content-length")
+    if content_length:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise InvalidRequest("Invalid Content-Length")
+        if declared > config.MAX_FILE_SIZE:
+            raise RequestTooLarge()
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > config.MAX_FILE_SIZE:
+            raise RequestTooLarge()
+    return bytes(body)
+
+
+async def stream_events(fields, nlp_result, local, first=None, events=None):
+    # Mesmo protocolo SSE do app Flask, com o streaming assíncrono do Gemini
+    if local:
+        for event, value in local_stream_events(local):
+            yield sse_event(fields, nlp_result, event, value)
+        return
+    yield sse_event(fields, nlp_result, *first)
+    async for event, value in events:
+        yield sse_event(fields, nlp_result, event, value)
+
+
+async def process_email(request):
+    metrics.start_request()
+    started = time.perf_counter()
+    response = await handle_process(request)
+    response.headers["Server-Timing"] = metrics.finish_request(
+        "POST", "/api/process", response.status_code, time.perf_counter() - started)
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+async def handle_process(request):
+    try:
+        body = await read_limited_body(request)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            return JSONResponse({"error": "Invalid JSON"}, status_code=400)
+
+        fields, error = parse_process_request(data)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+        text = fields["text"]
+
+        loop = asyncio.get_running_loop()
+        # Copia o contexto para que os spans do NLP entrem no Server-Timing desta requisição
+        context = contextvars.copy_context()
+        nlp_result = await loop.run_in_executor(nlp_executor, context.run, get_nlp().process_all, text)
+
+        local = fast_path_analysis(nlp_result, fields["suggest_reply"], fields["user_email"])
+        if request.query_params.get("stream", "false").lower() == "true":
+            first = events = None
+            if not local:
+                events = get_gemini().analyze_email_stream_async(
+                    nlp_result["stemmed_text"], text, fields["user_email"])
+                # Primeiro evento antes de abrir o stream: limite de chamadas ainda vira um 429 (ou 503)
+                first = await anext(events)
+            return StreamingResponse(stream_events(fields, nlp_result, local, first, events),
+                                     media_type="text/event-stream", headers=SSE_HEADERS)
+
+        gemini_analysis = local
+        if gemini_analysis is None:
+            gemini_analysis = await get_gemini().analyze_email_async(nlp_result["stemmed_text"], text,
+                                                                     fields["user_email"])
+            remember_analysis(nlp_result, gemini_analysis, fields["user_email"])
+
+        # Gravação do histórico fica na fila write-behind, fora do caminho da resposta
+        record = analysis_record(fields, gemini_analysis)
+        supabase = get_supabase()
+        if supabase.write_queue is not None:
+            supabase.enqueue_analysis(text, record, fields["user_email"])
+        else:
+            await supabase.save_analysis_async(text, record, fields["user_email"])
+
+        return JSONResponse(build_process_result(fields, nlp_result, gemini_analysis))
+    except InvalidRequest as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except RequestTooLarge:
+        return JSONResponse(
+            {"error": f"Arquivo ou texto excede o limite de {config.MAX_FILE_SIZE} bytes"},
+            status_code=413
+        )
+    except RateLimitExceeded as e:
+        return JSONResponse({"error": str(e), "retry_after": e.retry_after_seconds}, status_code=429,
+                            headers={"Retry-After": str(e.retry_after_seconds)})
+    except ModelsUnavailable as e:
+        return JSONResponse({"error": str(e), "retry_after": e.retry_after_seconds}, status_code=503,
+                            headers={"Retry-After": str(e.retry_after_seconds)})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/process', process_email, methods=['POST']),
+        # Demais rotas continuam no Flask (executadas em threads pelo a2wsgi)
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=config.CORS_ORIGINS, allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["X-Next-Cursor", "Server-Timing"])
+    ]
+)
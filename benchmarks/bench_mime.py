@@ -0,0 +1,81 @@
+"""
+Benchmark da extração do corpo de emails: extrator antigo (primeira parte
+text/plain decodificada inteira) comparado com mime_body.extract_body, sobre
+um diretório de arquivos .eml
+
+Além do tempo, mede a cobertura: quantos emails têm corpo não vazio e, quando
+o arquivo traz o cabeçalho X-Expected-Text, quantos contêm o trecho esperado.
+
+Uso:
+    python benchmarks/bench_mime.py [diretorio_eml] [repeticoes]
+"""
+
+import email
+import glob
+import os
+import sys
+import time
+from email.header import decode_header, make_header
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+from mime_body import extract_body
+
+
+def legacy_extract_body(msg):
+    # Extrator usado antes de mime_body (mantido aqui só para comparação)
+    body = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain":
+                payload = part.get_payload(decode=True) or b""
+                body = payload.decode(errors="replace")
+                break
+    else:
+        payload = msg.get_payload(decode=True) or b""
+        body = payload.decode(errors="replace")
+    return body[:5000]
+
+
+def coverage(extractor, messages):
+    non_empty = matched = with_expected = 0
+    for msg in messages:
+        body = extractor(msg)
+        non_empty += bool(body.strip())
+        if msg["X-Expected-Text"]:
+            with_expected += 1
+            matched += str(make_header(decode_header(msg["X-Expected-Text"]))) in body
+    return non_empty, matched, with_expected
+
+
+def bench(label, extractor, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for msg in messages:
+            extractor(msg)
+    elapsed = time.perf_counter() - start
+    non_empty, matched, with_expected = coverage(extractor, messages)
+    print(f"{label:<14} {elapsed * 1e6 / (repeat * len(messages)):9.1f} µs/email  "
+          f"corpo não vazio {non_empty}/{len(messages)}  trecho esperado {matched}/{with_expected}")
+    return elapsed
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, 'samples', 'eml')
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    messages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.eml'))):
+        with open(path, 'rb') as f:
+            messages.append(email.message_from_bytes(f.read()))
+    if not messages:
+        raise SystemExit(f"Nenhum arquivo .eml em {directory}")
+
+    print(f"{len(messages)} emails de {directory} ({repeat} repetições)")
+    legacy = bench("antigo", legacy_extract_body, messages, repeat)
+    current = bench("extract_body", extract_body, messages, repeat)
+    print(f"speedup: {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
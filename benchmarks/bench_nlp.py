@@ -0,0 +1,64 @@
+"""
+Benchmark do pipeline NLP: cadeia clean_text -> remove_stopwords ->
+apply_stemming comparada com o caminho único process_all.
+
+Uso:
+    python benchmarks/bench_nlp.py [repeticoes]
+"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+from nlp_processor import NLPProcessor
+
+SAMPLE_EMAIL = """
+Olá equipe,
+
+Gostaria de agendar uma reunião para discutir o andamento do projeto AutoU.
+Precisamos revisar o cronograma, os custos e as próximas entregas do time.
+Por favor, confirmem a disponibilidade para amanhã às 14h ou na sexta-feira.
+O relatório completo está disponível em https://example.com/relatorios/2024?id=42.
+
+Atenciosamente,
+João Silva
+joao.silva@example.com
+"""
+
+
+def run_chain(nlp, text):
+    cleaned_text = nlp.clean_text(text)
+    text_no_stopwords = nlp.remove_stopwords(cleaned_text)
+    stemmed_text = nlp.apply_stemming(text_no_stopwords)
+    return {
+        "cleaned_text": cleaned_text,
+        "text_no_stopwords": text_no_stopwords,
+        "stemmed_text": stemmed_text,
+        "stems": stemmed_text.split()
+    }
+
+
+def bench(label, fn, nlp, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(nlp, text)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed * 1000 / repeat:8.3f} ms/email  ({repeat} execuções)")
+    return elapsed
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nlp = NLPProcessor()
+
+    for label, text in (("email curto", SAMPLE_EMAIL), ("texto longo", SAMPLE_EMAIL * 50)):
+        print(f"\n{label} ({len(text)} caracteres)")
+        assert run_chain(nlp, text) == nlp.process_all(text), "process_all divergiu da cadeia"
+        chain = bench("cadeia", run_chain, nlp, text, repeat)
+        fused = bench("process_all", lambda n, t: n.process_all(t), nlp, text, repeat)
+        print(f"speedup: {chain / fused:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
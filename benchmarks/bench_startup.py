@@ -0,0 +1,58 @@
+"""
+Benchmark de cold start: tempo de import do app e latência das primeiras
+requisições, cada rodada em um processo Python novo.
+
+Gemini e Supabase ficam desabilitados (chaves vazias) para medir apenas o
+custo local: imports, criação dos serviços e carga dos recursos do NLTK.
+
+Uso:
+    python benchmarks/bench_startup.py [rodadas]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executado em cada processo filho; imprime os tempos em JSON
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+timings = {"import_app": time.perf_counter() - started}
+client = app.app.test_client()
+for label, call in (
+    ("first_health", lambda: client.get('/health')),
+    ("first_process", lambda: client.post('/api/process', json={"text": "Olá, podem confirmar a reunião de amanhã?", "email_user": "bench@example.com"})),
+    ("second_process", lambda: client.post('/api/process', json={"text": "Segue o relatório solicitado.", "email_user": "bench@example.com"})),
+):
+    started = time.perf_counter()
+    response = call()
+    timings[label] = time.perf_counter() - started
+    assert response.status_code == 200, response.get_data(as_text=True)
+print(json.dumps(timings))
+"""
+
+
+def run_once():
+    env = {**os.environ, "GEMINI_API_KEY": "", "SUPABASE_URL": "", "SUPABASE_KEY": "",
+           "LOCAL_CLASSIFIER": "false"}
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    runs = [run_once() for _ in range(rounds)]
+    print(f"Mediana de {rounds} processos:")
+    for label in runs[0]:
+        values = [run[label] * 1000 for run in runs]
+        print(f"{label:<16} {statistics.median(values):9.1f} ms  (min {min(values):.1f}, max {max(values):.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,8 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", 10000))  # Máximo de caracteres
 SUPPORTED_LANGUAGES = ["pt", "en", "es"]
 
-# Criar diretórios necessários
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(MODEL_DIR, exist_ok=True)
\ No newline at end of file
+
+def ensure_directories():
+    """Cria os diretórios necessários (no provisionamento, não no import)"""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(MODEL_DIR, exist_ok=True)
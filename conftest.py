@@ -0,0 +1,167 @@
+import sys
+import time
+import pytest
+sys.path.append('src')
+
+DEFAULT_REPLY = '{"classification": "produtivo", "suggested_response": "Ok", "reasoning": "Pedido"}'
+
+
+class FakeResponse:
+    """Resposta (ou pedaço do streaming) do genai, sem usage_metadata"""
+
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModels:
+    """
+    Substitui client.models do genai
+
+    Args:
+        reply: Texto da resposta ou função (contents) -> texto
+        failing: Modelos que sempre respondem com erro de cota
+        delay: Segundos de espera em cada chamada
+        chunk_size: Tamanho dos pedaços no streaming
+        fail_after: Posição da resposta em que o streaming é interrompido
+    """
+
+    def __init__(self, reply=DEFAULT_REPLY, failing=(), delay=0, chunk_size=3, fail_after=None):
+        self.reply = reply
+        self.failing = set(failing)
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.fail_after = fail_after
+        self.calls = []
+        self.prompts = []
+
+    def _answer(self, model, contents):
+        self.calls.append(model)
+        self.prompts.append(contents)
+        if model in self.failing:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        if self.delay:
+            time.sleep(self.delay)
+        return self.reply(contents) if callable(self.reply) else self.reply
+
+    def generate_content(self, model, contents, config):
+        return FakeResponse(self._answer(model, contents))
+
+    def generate_content_stream(self, model, contents, config):
+        text = self._answer(model, contents)
+        for i in range(0, len(text), self.chunk_size):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("stream reset")
+            yield FakeResponse(text[i:i + self.chunk_size])
+
+
+class FakeAsyncModels:
+    """client.aio.models: as mesmas respostas de FakeModels, em corrotinas"""
+
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, model, contents, config):
+        return self.models.generate_content(model, contents, config)
+
+    async def generate_content_stream(self, model, contents, config):
+        for chunk in self.models.generate_content_stream(model, contents, config):
+            yield chunk
+
+
+class FakeClient:
+    def __init__(self, models):
+        self.models = models
+        self.aio = type("FakeAio", (), {})()
+        self.aio.models = FakeAsyncModels(models)
+
+
+@pytest.fixture
+def make_gemini():
+    """
+    Fábrica de GeminiService com o cliente do genai substituído por FakeModels
+
+    A fábrica recebe available_models (padrão: só gemini-2.5-flash), cache
+    (padrão: MemoryResultCache novo) e os argumentos de FakeModels.
+    """
+    from gemini_service import GeminiService
+    from result_cache import MemoryResultCache
+
+    def make(available_models=('gemini-2.5-flash',), cache=None, **fake):
+        gemini = GeminiService(api_key="test", cache=cache if cache is not None else MemoryResultCache())
+        gemini.client = FakeClient(FakeModels(**fake))
+        gemini.available_models = list(available_models)
+        return gemini
+    return make
+
+
+class FakeNLP:
+    """Pipeline de NLP sem recursos do NLTK: apenas minúsculas e separação por espaços"""
+
+    def process_all(self, text):
+        cleaned = text.lower()
+        return {"cleaned_text": cleaned, "text_no_stopwords": cleaned, "stemmed_text": cleaned,
+                "stems": cleaned.split(), "language": "pt"}
+
+
+class FakeGeminiAnalyzer:
+    """Substitui o GeminiService nas rotas, registrando os textos recebidos"""
+
+    def __init__(self):
+        self.texts = []
+
+    def _analysis(self, original_text):
+        self.texts.append(original_text)
+        return {"classification": "produtivo", "suggested_response": "Ok", "reasoning": "Pedido",
+                "model_used": "fake"}
+
+    def analyze_email(self, processed_text, original_text, user=None):
+        return self._analysis(original_text)
+
+    async def analyze_email_async(self, processed_text, original_text, user=None):
+        return self._analysis(original_text)
+
+    def analyze_batch(self, items, user=None):
+        return [self._analysis(original_text) for _, original_text in items]
+
+    def analyze_email_stream(self, processed_text, original_text, user=None):
+        analysis = self._analysis(original_text)
+        yield "classification", analysis["classification"]
+        yield "token", analysis["suggested_response"]
+        yield "done", analysis
+
+    async def analyze_email_stream_async(self, processed_text, original_text, user=None):
+        for event in self.analyze_email_stream(processed_text, original_text, user):
+            yield event
+
+
+class FakeSupabase:
+    """Guarda as análises enfileiradas em vez de gravar no Supabase"""
+
+    write_queue = None
+
+    def __init__(self):
+        self.saved = []
+
+    def enqueue_analysis(self, text, record, user_email):
+        self.saved.append((text, record, user_email))
+
+    def enqueue_analyses(self, items, user_email):
+        self.saved.extend((text, record, user_email) for text, record in items)
+
+    async def save_analysis_async(self, text, record, user_email):
+        self.saved.append((text, record, user_email))
+
+
+@pytest.fixture
+def app_services(monkeypatch):
+    """
+    Serviços falsos no registro do app.py (NLP, Gemini e Supabase; sem
+    classificador local nem índice de quase-duplicatas)
+    """
+    import app
+    services = {"nlp": FakeNLP(), "gemini": FakeGeminiAnalyzer(), "supabase": FakeSupabase(),
+                "local_classifier": None, "near_duplicates": None}
+    for name, service in services.items():
+        monkeypatch.setitem(app._services, name, service)
+    return services
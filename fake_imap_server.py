@@ -0,0 +1,208 @@
+"""
+Servidor IMAP falso e mínimo para os testes do EmailService
+Implementa apenas os comandos usados pelo serviço, sem TLS
+"""
+
+import re
+import socketserver
+import threading
+from email.parser import BytesHeaderParser
+
+_FETCH_ITEM_RE = re.compile(
+    r'UID|FLAGS|RFC822|BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?'
+)
+
+
+def _parse_set(value, maximum):
+    numbers = []
+    for part in value.split(','):
+        if ':' in part:
+            start, end = part.split(':')
+            start = maximum if start == '*' else int(start)
+            end = maximum if end == '*' else int(end)
+            if start > end:
+                start, end = end, start
+            numbers.extend(range(start, end + 1))
+        else:
+            numbers.append(maximum if part == '*' else int(part))
+    return numbers
+
+
+class FakeMailbox:
+    def __init__(self, messages, uidvalidity=1, first_uid=1):
+        self.uidvalidity = uidvalidity
+        self.messages = []
+        self.next_uid = first_uid
+        for raw in messages:
+            self.append(raw)
+
+    def append(self, raw):
+        self.messages.append((self.next_uid, raw))
+        self.next_uid += 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, line):
+        if isinstance(line, str):
+            line = line.encode()
+        self.wfile.write(line)
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.send("* OK [CAPABILITY IMAP4rev1] Fake IMAP ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().strip().partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            with server.lock:
+                server.commands.append(rest)
+
+            if command == 'CAPABILITY':
+                self.send("* CAPABILITY IMAP4rev1\r\n")
+            elif command == 'LOGIN':
+                user, password = [a.strip('"') for a in args.split(' ', 1)]
+                if (user, password) != (server.user, server.password):
+                    self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials\r\n")
+                    continue
+            elif command in ('SELECT', 'EXAMINE'):
+                mailbox = server.mailbox
+                self.send(f"* {len(mailbox.messages)} EXISTS\r\n")
+                self.send(f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n")
+                self.send(f"* OK [UIDNEXT {mailbox.next_uid}] Predicted next UID\r\n")
+            elif command == 'NOOP':
+                pass
+            elif command == 'LOGOUT':
+                self.send("* BYE Fake IMAP closing\r\n")
+                self.send(f"{tag} OK LOGOUT completed\r\n")
+                return
+            elif command == 'SEARCH':
+                numbers = ' '.join(str(i) for i in range(1, len(server.mailbox.messages) + 1))
+                self.send(f"* SEARCH {numbers}\r\n".replace(' \r\n', '\r\n'))
+            elif command == 'FETCH':
+                message_set, _, items = args.partition(' ')
+                self.fetch(message_set, items, by_uid=False)
+            elif command == 'UID':
+                sub_command, _, sub_args = args.partition(' ')
+                sub_command = sub_command.upper()
+                if sub_command == 'SEARCH':
+                    self.uid_search(sub_args)
+                elif sub_command == 'FETCH':
+                    message_set, _, items = sub_args.partition(' ')
+                    self.fetch(message_set, items, by_uid=True)
+                else:
+                    self.send(f"{tag} BAD Unsupported UID command\r\n")
+                    continue
+            else:
+                self.send(f"{tag} BAD Unsupported command\r\n")
+                continue
+            self.send(f"{tag} OK {command} completed\r\n")
+
+    def uid_search(self, args):
+        # Suporta apenas "UID n:*" e "ALL"
+        messages = self.server.mailbox.messages
+        uids = [uid for uid, _ in messages]
+        match = re.search(r'UID (\S+)', args, re.IGNORECASE)
+        if match and uids:
+            wanted = set(_parse_set(match.group(1), uids[-1]))
+            uids = [uid for uid in uids if uid in wanted]
+        self.send(("* SEARCH " + ' '.join(str(u) for u in uids)).rstrip() + "\r\n")
+
+    def fetch(self, message_set, items, by_uid):
+        messages = self.server.mailbox.messages
+        with self.server.lock:
+            self.server.fetch_commands += 1
+        if not messages:
+            return
+        if by_uid:
+            wanted = set(_parse_set(message_set, messages[-1][0]))
+            selected = [(seq, uid, raw) for seq, (uid, raw) in enumerate(messages, 1) if uid in wanted]
+        else:
+            wanted = set(_parse_set(message_set, len(messages)))
+            selected = [(seq, uid, raw) for seq, (uid, raw) in enumerate(messages, 1) if seq in wanted]
+
+        names = _FETCH_ITEM_RE.findall(items)
+        if by_uid and 'UID' not in names:
+            names.insert(0, 'UID')
+
+        for seq, uid, raw in selected:
+            self.send(f"* {seq} FETCH (")
+            for position, name in enumerate(names):
+                prefix = ' ' if position else ''
+                if name == 'UID':
+                    self.send(f"{prefix}UID {uid}")
+                elif name == 'FLAGS':
+                    self.send(f"{prefix}FLAGS (\\Seen)")
+                else:
+                    response_name, data = self.section(name, raw)
+                    self.send(f"{prefix}{response_name} {{{len(data)}}}\r\n".encode() + data)
+            self.send(")\r\n")
+
+    def section(self, name, raw):
+        header_end = raw.find(b'\r\n\r\n')
+        header, body = raw[:header_end + 4], raw[header_end + 4:]
+        if name == 'RFC822':
+            return 'RFC822', raw
+
+        name = name.replace('BODY.PEEK', 'BODY')
+        partial = re.search(r'<(\d+)\.(\d+)>$', name)
+        if partial:
+            name = name[:partial.start()]
+
+        if 'HEADER.FIELDS' in name:
+            fields = re.search(r'\(([^)]*)\)', name).group(1).lower().split()
+            parsed = BytesHeaderParser().parsebytes(header)
+            lines = [f"{key}: {value}\r\n" for key, value in parsed.items() if key.lower() in fields]
+            data = (''.join(lines) + "\r\n").encode()
+        elif name == 'BODY[TEXT]':
+            data = body
+        else:
+            data = raw
+
+        if partial:
+            start, length = int(partial.group(1)), int(partial.group(2))
+            return f"{name}<{start}>", data[start:start + length]
+        return name, data
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """
+    Servidor IMAP em uma thread local. Uso:
+
+        with FakeIMAPServer([raw_email_bytes, ...]) as server:
+            service.host, service.port = server.host, server.port
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, messages, user="user@example.com", password="secret", uidvalidity=1):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.mailbox = FakeMailbox(messages, uidvalidity=uidvalidity)
+        self.user = user
+        self.password = password
+        self.lock = threading.Lock()
+        self.commands = []
+        self.connections = 0
+        self.fetch_commands = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,38 @@
+"""
+Configuração do gunicorn (lida automaticamente quando o servidor é iniciado
+na raiz do projeto: gunicorn app:app ou gunicorn asgi:app -k uvicorn.workers.UvicornWorker)
+
+O app é carregado e aquecido uma vez no processo master; os workers herdam
+os recursos do NLP por copy-on-write em vez de carregar cada um a sua cópia.
+"""
+
+import gc
+import os
+import sys
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def when_ready(server):
+    # Executado no master depois do preload e antes do fork dos workers
+    if not preload_app:
+        return
+    import app
+    app.warm_up()
+    # Tira os objetos já carregados do alcance do coletor de lixo, que de outra
+    # forma escreveria nos cabeçalhos deles e copiaria as páginas em cada worker
+    gc.freeze()
+    server.log.info(f"Warmup concluído; {gc.get_freeze_count()} objetos congelados antes do fork")
+
+
+def post_fork(server, worker):
+    app = sys.modules.get("app")
+    if app is not None:
+        app.reset_after_fork()
+
+
+def post_worker_init(worker):
+    # Sem preload o app só é importado no worker: reenvia aqui o journal da fila write-behind
+    if not preload_app:
+        import app
+        app.replay_pending_writes()
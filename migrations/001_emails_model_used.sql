@@ -0,0 +1,8 @@
+-- Origem do rótulo de cada análise (modelo do Gemini, cache:<modelo>, local,
+-- near_duplicate:<modelo>), usada por train_classifier.py para treinar o
+-- classificador local apenas com rótulos do Gemini ou corrigidos à mão.
+-- Linhas antigas ficam com NULL: foram gravadas quando só o Gemini classificava.
+ALTER TABLE emails ADD COLUMN IF NOT EXISTS model_used text;
+
+-- Atualiza o cache de schema do PostgREST para que a coluna seja aceita já nos próximos inserts
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,86 @@
+"""
+Pré-processa em lote uma caixa de emails exportada (mbox) ou um arquivo JSONL,
+usando todos os núcleos, e grava o resultado em JSONL
+
+Uso:
+    python preprocess_emails.py caixa.mbox saida.jsonl
+    python preprocess_emails.py emails.jsonl saida.jsonl --workers 8   # linhas com text/original_text
+
+Cada linha de saída mantém os metadados da entrada (id, subject, sender, ...)
+e acrescenta language, cleaned_text, text_no_stopwords e stemmed_text.
+"""
+
+import argparse
+import json
+import mailbox
+import os
+import sys
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+import config
+from email_service import _decode_header_value
+from mime_body import extract_body
+from nlp_processor import NLPRegistry
+
+OUTPUT_FIELDS = ("language", "cleaned_text", "text_no_stopwords", "stemmed_text")
+
+
+def read_mbox(path):
+    for index, message in enumerate(mailbox.mbox(path, create=False)):
+        yield {
+            "id": _decode_header_value(message.get("Message-ID")) or str(index),
+            "subject": _decode_header_value(message.get("Subject")),
+            "sender": _decode_header_value(message.get("From")),
+            "date": message.get("Date"),
+            "text": extract_body(message, config.MAX_TEXT_LENGTH)
+        }
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                row["text"] = row.get("text") or row.get("original_text") or ""
+                yield row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-processa emails em lote (mbox ou JSONL -> JSONL)")
+    parser.add_argument("input", help="Arquivo .mbox ou .jsonl")
+    parser.add_argument("output", help="Arquivo JSONL de saída")
+    parser.add_argument("--format", choices=("mbox", "jsonl"),
+                        help="Formato da entrada (padrão: pela extensão do arquivo)")
+    parser.add_argument("--workers", type=int, default=None, help="Processos (padrão: número de CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Emails por lote enviado a um processo")
+    args = parser.parse_args()
+
+    input_format = args.format or ("jsonl" if args.input.endswith((".jsonl", ".json")) else "mbox")
+    rows = read_jsonl(args.input) if input_format == "jsonl" else read_mbox(args.input)
+
+    # Os textos vão para o pool enquanto os metadados ficam aqui, na mesma ordem
+    pending = deque()
+
+    def texts():
+        for row in rows:
+            pending.append(row)
+            yield row.pop("text")[:config.MAX_TEXT_LENGTH]
+
+    registry = NLPRegistry(config.SUPPORTED_LANGUAGES)
+    started = time.perf_counter()
+    count = 0
+    with open(args.output, "w", encoding="utf-8") as out:
+        for result in registry.process_many(texts(), workers=args.workers, chunk_size=args.chunk_size):
+            row = pending.popleft()
+            row.update({field: result[field] for field in OUTPUT_FIELDS})
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+
+    elapsed = time.perf_counter() - started
+    print(f"{count} emails processados em {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} emails/s)")
+
+
+if __name__ == '__main__':
+    main()
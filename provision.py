@@ -0,0 +1,27 @@
+"""
+Provisionamento de build: baixa os recursos do NLTK para nltk_data/ e cria os
+diretórios da aplicação, para que o servidor não acesse a rede ao iniciar
+
+Uso:
+    python provision.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+import config
+from nlp_processor import download_resources, missing_resources
+
+
+def main():
+    config.ensure_directories()
+    downloaded = download_resources()
+    missing = missing_resources()
+    if missing:
+        raise SystemExit(f"Recursos do NLTK indisponíveis: {', '.join(missing)}")
+    print(f"Recursos do NLTK prontos ({', '.join(downloaded) or 'já presentes'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,67 +2,241 @@ import imaplib
 import email
 from email.header import decode_header
 import os
+import re
+import metrics
+from imap_pool import PoolTimeout
+from mime_body import extract_body
+
+# Campos de cabeçalho baixados no modo de pré-visualização (inclui os de MIME
+# para que o trecho do corpo possa ser decodificado corretamente)
+PREVIEW_HEADER_FIELDS = "SUBJECT FROM DATE CONTENT-TYPE CONTENT-TRANSFER-ENCODING"
+
+_FETCH_SEQ_RE = re.compile(rb'^(\d+) \(')
+_FETCH_UID_RE = re.compile(rb'UID (\d+)')
+
+
+def _decode_header_value(value):
+    if value is None:
+        return None
+    decoded, encoding = decode_header(value)[0]
+    if isinstance(decoded, bytes):
+        try:
+            decoded = decoded.decode(encoding or "utf-8", errors="replace")
+        except LookupError:
+            # Charset desconhecido no cabeçalho não derruba a busca inteira
+            decoded = decoded.decode("utf-8", errors="replace")
+    return decoded
+
+
+def _group_fetch_response(msg_data):
+    """
+    Agrupa a resposta de um FETCH de vários emails por número de sequência
+
+    Returns:
+        Dicionário {seq: {"header": bytes, "body": bytes, "uid": bytes | None}}
+    """
+    messages = {}
+    current = None
+    for response_part in msg_data:
+        if isinstance(response_part, tuple):
+            descriptor, literal = response_part
+        else:
+            # Itens após o último literal (ex.: " UID 42)") chegam como bytes soltos
+            descriptor, literal = response_part or b"", None
+        match = _FETCH_SEQ_RE.match(descriptor)
+        if match:
+            current = messages.setdefault(match.group(1), {"header": b"", "body": b"", "uid": None})
+        if current is None:
+            continue
+        uid_match = _FETCH_UID_RE.search(descriptor)
+        if uid_match:
+            current["uid"] = uid_match.group(1)
+        if literal is None:
+            continue
+        if b"HEADER" in descriptor.upper():
+            current["header"] = literal
+        else:
+            current["body"] = literal
+    return messages
+
+
+def _fetch_query(preview, preview_bytes):
+    if preview:
+        return f"(BODY.PEEK[HEADER.FIELDS ({PREVIEW_HEADER_FIELDS})] BODY.PEEK[TEXT]<0.{preview_bytes}>)"
+    return "(RFC822)"
+
+
+def _build_email(e_id, parts):
+    msg = email.message_from_bytes(parts["header"] + parts["body"])
+    return {
+        "id": e_id.decode(),
+        "subject": _decode_header_value(msg["Subject"]),
+        "sender": _decode_header_value(msg.get("From")),
+        "text": extract_body(msg),
+        "date": msg.get("Date")
+    }
+
 
 class EmailService:
-    def __init__(self):
+    def __init__(self, pool=None):
+        # Pool opcional de conexões autenticadas (IMAPConnectionPool)
+        self.pool = pool
         self.host = os.getenv("IMAP_HOST", "imap.gmail.com")
+        self.port = int(os.getenv("IMAP_PORT", 993))
+        self.use_ssl = os.getenv("IMAP_SSL", "true").lower() == "true"
         self.user = os.getenv("EMAIL_USER")
         self.password = os.getenv("EMAIL_PASS") # Use App Password para Gmail
 
-    def fetch_latest_emails(self, limit=10):
+    def _connect(self):
+        if self.use_ssl:
+            return imaplib.IMAP4_SSL(self.host, self.port)
+        return imaplib.IMAP4(self.host, self.port)
+
+    def _with_connection(self, operation):
+        """
+        Executa a operação com uma conexão IMAP autenticada
+
+        Com pool, reaproveita sessões da mesma conta e reconecta uma vez de forma
+        transparente se a sessão reaproveitada tiver caído.
+        """
+        if self.pool is None:
+            with metrics.span("imap.connect"):
+                mail = self._connect()
+                mail.login(self.user, self.password)
+            try:
+                with metrics.span("imap.fetch"):
+                    return operation(mail)
+            finally:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
+
+        for attempt in range(2):
+            try:
+                with self.pool.connection(self.host, self.port, self.user, self.password, self.use_ssl) as mail:
+                    with metrics.span("imap.fetch"):
+                        return operation(mail)
+            except PoolTimeout:
+                # Pool esgotado não é conexão quebrada: repetir só dobraria a espera
+                raise
+            except (imaplib.IMAP4.abort, OSError):
+                if attempt == 1:
+                    raise
+
+    def fetch_latest_emails(self, limit=10, preview=False, preview_bytes=4096):
+        """
+        Busca os emails mais recentes da caixa de entrada com um único comando FETCH
+
+        Args:
+            limit: Quantidade de emails
+            preview: Baixa apenas Assunto/Remetente/Data e o início do corpo
+            preview_bytes: Bytes do corpo baixados no modo de pré-visualização
+        """
         if not self.user or not self.password:
             return []
 
         try:
-            # Conecta ao servidor IMAP
-            mail = imaplib.IMAP4_SSL(self.host)
-            mail.login(self.user, self.password)
-            mail.select("inbox")
-
-            # Busca os IDs dos emails mais recentes
-            status, messages = mail.search(None, "ALL")
-            email_ids = messages[0].split()
-            
-            latest_ids = email_ids[-limit:]
-            latest_ids.reverse() # Mais recentes primeiro
-
-            emails_list = []
-            for e_id in latest_ids:
-                res, msg_data = mail.fetch(e_id, "(RFC822)")
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        # Decode Subject
-                        subject, encoding = decode_header(msg["Subject"])[0]
-                        if isinstance(subject, bytes):
-                            subject = subject.decode(encoding or "utf-8")
-                        
-                        # Decode From
-                        from_, encoding = decode_header(msg.get("From"))[0]
-                        if isinstance(from_, bytes):
-                            from_ = from_.decode(encoding or "utf-8")
-
-                        # Extract Body
-                        body = ""
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                if part.get_content_type() == "text/plain":
-                                    body = part.get_payload(decode=True).decode()
-                                    break
-                        else:
-                            body = msg.get_payload(decode=True).decode()
-
-                        emails_list.append({
-                            "id": e_id.decode(),
-                            "subject": subject,
-                            "sender": from_,
-                            "text": body[:5000],
-                            "date": msg.get("Date")
-                        })
-
-            mail.logout()
-            return emails_list
+            return self._with_connection(
+                lambda mail: self._fetch_latest(mail, limit, preview, preview_bytes)
+            )
         except Exception as e:
             print(f"Error fetching emails: {e}")
             return []
+
+    def _fetch_latest(self, mail, limit, preview, preview_bytes):
+        mail.select("inbox")
+
+        # Busca os IDs dos emails mais recentes
+        status, messages = mail.search(None, "ALL")
+        email_ids = messages[0].split()
+
+        latest_ids = email_ids[-limit:] if limit > 0 else []
+        latest_ids.reverse() # Mais recentes primeiro
+
+        if not latest_ids:
+            return []
+
+        # Um único FETCH para todo o conjunto de IDs
+        res, msg_data = mail.fetch(b",".join(latest_ids).decode(), _fetch_query(preview, preview_bytes))
+        fetched = _group_fetch_response(msg_data)
+
+        return [_build_email(e_id, fetched[e_id]) for e_id in latest_ids if e_id in fetched]
+
+    def fetch_new_emails(self, state_store, limit=50, preview=False, preview_bytes=4096, mailbox="inbox"):
+        """
+        Sincronização incremental: busca apenas emails com UID maior que o último já visto
+
+        O checkpoint (UIDVALIDITY, último UID) fica no state_store. Se o UIDVALIDITY
+        da caixa mudar, os UIDs antigos não valem mais e a sincronização recomeça
+        pelos `limit` emails mais recentes.
+
+        Args:
+            state_store: SyncStateStore com os checkpoints
+            limit: Máximo de emails novos retornados (na primeira sincronização, os
+                mais recentes; depois, os mais antigos acima do checkpoint, de modo
+                que chamadas seguidas entregam todos os que chegaram)
+            preview: Baixa apenas Assunto/Remetente/Data e o início do corpo
+            preview_bytes: Bytes do corpo baixados no modo de pré-visualização
+            mailbox: Caixa de email sincronizada
+        """
+        if not self.user or not self.password:
+            return []
+
+        try:
+            return self._with_connection(
+                lambda mail: self._fetch_new(mail, state_store, limit, preview, preview_bytes, mailbox)
+            )
+        except Exception as e:
+            print(f"Error syncing emails: {e}")
+            return []
+
+    def _fetch_new(self, mail, state_store, limit, preview, preview_bytes, mailbox):
+        mail.select(mailbox)
+        _, validity_data = mail.response("UIDVALIDITY")
+        uidvalidity = int(validity_data[-1])
+
+        account = f"{self.user}@{self.host}".lower()
+        state = state_store.get(account, mailbox)
+
+        if state is not None and state[0] == uidvalidity:
+            last_uid = state[1]
+            # "n:*" sempre inclui o último email, mesmo com UID menor que n
+            status, data = mail.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+        else:
+            last_uid = 0
+            status, data = mail.uid("SEARCH", None, "ALL")
+
+        uids = sorted(int(uid) for uid in data[0].split() if int(uid) > last_uid)
+        if limit <= 0:
+            new_uids = []
+        elif state is not None and last_uid > 0:
+            # Com checkpoint, os mais antigos primeiro: o excedente vem nas próximas
+            # chamadas e nenhum email acima do checkpoint é pulado
+            new_uids = uids[:limit]
+        else:
+            # Primeira sincronização (ou UIDVALIDITY nova): só os mais recentes servem de ponto de partida
+            new_uids = uids[-limit:]
+        if not new_uids:
+            state_store.set(account, mailbox, uidvalidity, last_uid)
+            return []
+
+        query = _fetch_query(preview, preview_bytes)
+        res, msg_data = mail.uid("FETCH", ",".join(str(uid) for uid in new_uids), f"(UID {query[1:]}")
+        fetched = {
+            int(parts["uid"]): (seq, parts)
+            for seq, parts in _group_fetch_response(msg_data).items()
+            if parts["uid"] is not None
+        }
+
+        emails_list = []
+        for uid in reversed(new_uids): # Mais recentes primeiro
+            if uid not in fetched:
+                continue
+            seq, parts = fetched[uid]
+            item = _build_email(seq, parts)
+            item["uid"] = uid
+            emails_list.append(item)
+
+        state_store.set(account, mailbox, uidvalidity, max(new_uids))
+        return emails_list
@@ -1,17 +1,182 @@
-from google import genai
-from google.genai import types
 import os
 import json
 import logging
+import re
+import time
+import metrics
+from model_health import ModelHealth, ModelsUnavailable
+from prompt_builder import PromptBuilder, estimate_tokens
+from rate_limiter import RateLimiter, RateLimitExceeded
+from result_cache import create_result_cache, make_cache_key
+from single_flight import AsyncSingleFlight, SingleFlight
 
 # Configuração básica de log para ver o fallback acontecendo
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_CLASSIFICATION_RE = re.compile(r'"classification"\s*:\s*"([^"]*)"')
+_RESPONSE_START_RE = re.compile(r'"suggested_response"\s*:\s*(")?')
+
+# Títulos das visões do email no prompt
+_VIEW_TITLES = {"original": "TEXTO ORIGINAL", "processed": "TEXTO PROCESSADO (NLP)"}
+_BATCH_VIEW_KEYS = {"original": "texto_original", "processed": "texto_processado"}
+
+
+class AnalysisStreamParser:
+    """
+    Lê incrementalmente a resposta JSON em streaming do Gemini, emitindo a
+    classificação assim que ela aparece e o suggested_response aos pedaços
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._classification_sent = False
+        self._response_pos = None
+        self._response_done = False
+
+    def feed(self, text):
+        """
+        Returns:
+            Lista de eventos (tipo, valor): ("classification", str) e ("token", str)
+        """
+        self._buffer += text
+        events = []
+        if not self._classification_sent:
+            match = _CLASSIFICATION_RE.search(self._buffer)
+            if match:
+                self._classification_sent = True
+                events.append(("classification", match.group(1)))
+
+        if self._response_pos is None and not self._response_done:
+            match = _RESPONSE_START_RE.search(self._buffer)
+            # Sem aspas: null (ou ainda incompleto); não há tokens para enviar
+            if match and match.group(1):
+                self._response_pos = match.end()
+            elif match and match.end() < len(self._buffer):
+                self._response_done = True
+
+        if self._response_pos is not None and not self._response_done:
+            piece = self._scan_response()
+            if piece:
+                events.append(("token", piece))
+        return events
+
+    def _scan_response(self):
+        # Avança até a aspa de fechamento ou até um escape ainda incompleto
+        buf, start = self._buffer, self._response_pos
+        i = start
+        while i < len(buf):
+            char = buf[i]
+            if char == '"':
+                self._response_done = True
+                break
+            if char == "\\":
+                if i + 1 >= len(buf):
+                    break
+                size = 2
+                if buf[i + 1] == "u":
+                    # Surrogate alto precisa do par para ser decodificado
+                    size = 12 if buf[i + 2:i + 4].lower() in ("d8", "d9", "da", "db") else 6
+                if i + size > len(buf):
+                    break
+                i += size
+                continue
+            i += 1
+        self._response_pos = i + 1 if self._response_done else i
+        return json.loads('"' + buf[start:i] + '"')
+
+    def result(self):
+        """Resposta completa decodificada (chamar após o fim do streaming)"""
+        return json.loads(self._buffer)
+
+
+class _ModelAttempt:
+    """
+    Uma chamada a um modelo da cadeia de fallback (usar com `with`)
+
+    Registra métricas, saúde do circuito e tokens do prompt. Uma falha
+    (Exception) é registrada e suprimida para que o laço tente o próximo
+    modelo; GeneratorExit (cliente SSE desconectado) ou CancelledError só
+    liberam a requisição de teste do circuito half-open e seguem adiante.
+    """
+
+    def __init__(self, chain, model_name):
+        self.chain = chain
+        self.model_name = model_name
+        self.error = None
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def succeeded(self, response):
+        """Registra o sucesso; `response` é a resposta (ou o último pedaço do streaming)"""
+        service = self.chain.service
+        elapsed = time.perf_counter() - self.started
+        metrics.observe(f"gemini.{self.model_name}", elapsed)
+        service.model_health.record_success(self.model_name, elapsed,
+                                            service._prompt_tokens(response, self.chain.prompt))
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            return False
+        health = self.chain.service.model_health
+        if not issubclass(exc_type, Exception):
+            # Sem resultado registrado, a requisição de teste precisa ser liberada
+            health.release_probe(self.model_name)
+            return False
+        self.error = str(exc)
+        elapsed = time.perf_counter() - self.started
+        metrics.observe(f"gemini.{self.model_name}", elapsed, error=True)
+        health.record_failure(self.model_name, elapsed, self.error)
+        logger.warning(f"Falha com modelo {self.model_name}: {exc}")
+        self.chain.tried_models.append(self.model_name)
+        self.chain.last_error = self.error
+        return True
+
+
+class _FallbackChain:
+    """Percorre os modelos candidatos, produzindo uma _ModelAttempt para cada um"""
+
+    def __init__(self, service, prompt):
+        self.service = service
+        self.prompt = prompt
+        self.tried_models = []
+        self.last_error = None
+
+    def __iter__(self):
+        for model_name in self.service._candidate_models():
+            yield _ModelAttempt(self, model_name)
+
+    def failed(self):
+        """Erro a ser lançado (ou reportado) quando todos os modelos falharam"""
+        return self.service._all_models_failed(self.tried_models, self.last_error)
+
+
 class GeminiService:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache=None):
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
+        # Cache de resultados endereçado pelo conteúdo (evita gastar cota com emails repetidos)
+        self.cache = cache if cache is not None else create_result_cache()
+        # Circuit breaker por modelo: pula modelos que estão falhando até o fim do cooldown
+        self.model_health = ModelHealth(
+            failure_threshold=int(os.getenv('GEMINI_FAILURE_THRESHOLD', 3)),
+            cooldown=float(os.getenv('GEMINI_MODEL_COOLDOWN', 60))
+        )
+        # Limpeza e orçamento de tokens do texto enviado no prompt
+        self.prompt_builder = PromptBuilder(
+            max_tokens=int(os.getenv('GEMINI_PROMPT_MAX_TOKENS', 2000)),
+            views=os.getenv('GEMINI_PROMPT_VIEWS', 'original')
+        )
+        # Requisições concorrentes com o mesmo conteúdo compartilham uma única chamada ao modelo
+        self.flights = SingleFlight()
+        self.async_flights = AsyncSingleFlight()
+        # Token buckets por usuário e global: protegem a cota compartilhada da API
+        self.rate_limiter = RateLimiter.from_env()
         if self.api_key:
+            # SDK importado só quando há chave: o import leva centenas de ms no cold start
+            from google import genai
             self.client = genai.Client(api_key=self.api_key)
             
             # Lista de modelos para fallback em ordem decrescente de preferência
@@ -41,23 +206,132 @@ class GeminiService:
             self.client = None
             self.available_models = []
 
-    def analyze_email(self, processed_text, original_text):
-        if not self.client:
-            return {
-                "classification": "erro",
-                "suggested_response": "Erro: Chave de API do Gemini não configurada."
-            }
+    def _candidate_models(self):
+        """
+        Modelos disponíveis em ordem de preferência, ignorando os com circuito aberto
 
-        prompt = f"""
+        Raises:
+            ModelsUnavailable: Se nenhum modelo estiver fechado ou liberado para teste
+        """
+        yielded = False
+        for model_name in self.available_models:
+            if self.model_health.allow(model_name):
+                yielded = True
+                yield model_name
+            else:
+                logger.info(f"Pulando modelo {model_name} (circuito aberto)")
+        
+        # Todos abertos: falha rápido em vez de chamar um modelo ainda em cooldown
+        if not yielded and self.available_models:
+            raise ModelsUnavailable(self.model_health.cooldown_remaining(self.available_models))
+
+    def get_model_stats(self):
+        """Estatísticas de latência, erros e estado do circuito por modelo"""
+        return self.model_health.stats()
+
+    def _missing_key_error(self):
+        return {
+            "classification": "erro",
+            "suggested_response": "Erro: Chave de API do Gemini não configurada."
+        }
+
+    def _json_config(self):
+        # Configuração para resposta JSON
+        from google.genai import types
+        return types.GenerateContentConfig(response_mime_type="application/json")
+
+    def _all_models_failed(self, tried_models, last_error):
+        # Se saiu do loop, todos falharam
+        error_msg = f"Falha em todos os modelos tentados ({', '.join(tried_models)}). Último erro: {last_error}"
+        logger.error(error_msg)
+        return RuntimeError(error_msg)
+
+    def _prompt_tokens(self, response, prompt):
+        # Contagem real informada pela API; sem ela, a estimativa local
+        usage = getattr(response, "usage_metadata", None)
+        count = getattr(usage, "prompt_token_count", None)
+        if not isinstance(count, int):
+            count = estimate_tokens(prompt)
+        logger.info(f"Prompt com {count} tokens")
+        return count
+
+    def _generate_json(self, prompt):
+        """
+        Envia o prompt percorrendo a cadeia de fallback de modelos
+
+        Returns:
+            Tupla (resposta JSON decodificada, modelo usado)
+
+        Raises:
+            RuntimeError: Se todos os modelos falharem
+            ModelsUnavailable: Se todos os circuitos estiverem abertos
+        """
+        chain = _FallbackChain(self, prompt)
+        for attempt in chain:
+            with attempt:
+                logger.info(f"Tentando analisar com o modelo: {attempt.model_name}")
+                
+                response = self.client.models.generate_content(
+                    model=attempt.model_name,
+                    contents=prompt,
+                    config=self._json_config()
+                )
+                
+                # Se chegou aqui, funcionou
+                result = json.loads(response.text)
+                attempt.succeeded(response)
+                return result, attempt.model_name
+
+        raise chain.failed()
+
+    async def _generate_json_async(self, prompt):
+        """Versão assíncrona de _generate_json, usando o cliente aio do genai"""
+        chain = _FallbackChain(self, prompt)
+        for attempt in chain:
+            with attempt:
+                logger.info(f"Tentando analisar com o modelo: {attempt.model_name}")
+                
+                response = await self.client.aio.models.generate_content(
+                    model=attempt.model_name,
+                    contents=prompt,
+                    config=self._json_config()
+                )
+                
+                result = json.loads(response.text)
+                attempt.succeeded(response)
+                return result, attempt.model_name
+
+        raise chain.failed()
+
+    def _cache_key(self, processed_text, original_text):
+        return make_cache_key(processed_text, original_text, self.available_models,
+                              self.prompt_builder.fingerprint)
+
+    def _cache_lookup(self, processed_text, original_text):
+        """
+        Returns:
+            Tupla (chave do cache, resultado em cache ou None)
+        """
+        if self.cache is None:
+            return None, None
+        cache_key = self._cache_key(processed_text, original_text)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            cached['model_used'] = f"cache:{cached.get('model_used')}"
+        return cache_key, cached
+
+    def _build_prompt(self, processed_text, original_text):
+        # Apenas as visões escolhidas, sem histórico citado e dentro do orçamento de tokens
+        views = self.prompt_builder.build_views(processed_text, original_text)
+        email_sections = "\n\n        ".join(
+            f'{_VIEW_TITLES[name]}:\n        "{text}"' for name, text in views.items()
+        )
+        return f"""
         Você é um assistente de triagem de emails inteligente.
         
         Analise o seguinte email:
         
-        TEXTO ORIGINAL:
-        "{original_text}"
-        
-        TEXTO PROCESSADO (NLP):
-        "{processed_text}"
+        {email_sections}
         
         Tarefa:
         1. Classifique o email como 'produtivo' (requer ação humana, resposta, ou é importante) ou 'improdutivo' (spam, promoções, notificações automáticas, agradecimentos simples sem necessidade de follow-up).
@@ -71,41 +345,310 @@ class GeminiService:
         }}
         """
 
-        last_error = None
-        tried_models = []
+    def _analysis_error(self, error):
+        return {
+            "classification": "erro",
+            "suggested_response": str(error),
+            "reasoning": "Falha de conexão com múltiplos modelos IA"
+        }
 
-        for model_name in self.available_models:
+    def _store_result(self, result, model_name, cache_key):
+        # Adiciona metadados sobre qual modelo foi usado (útil para debug/info)
+        result['model_used'] = model_name
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return result
+
+    def _flight_key(self, cache_key, processed_text, original_text):
+        return cache_key or self._cache_key(processed_text, original_text)
+
+    def _retry_as_leader(self, error, user, attempt):
+        # A chamada compartilhada foi recusada pelo limite de outro usuário: tenta de novo
+        return attempt == 0 and error.scope == "user" and error.user != user
+
+    def analyze_email(self, processed_text, original_text, user=None, acquired=False):
+        """
+        Classifica um email (com cache e coalescência de chamadas idênticas)
+
+        Args:
+            processed_text: Texto processado pelo NLP
+            original_text: Texto original do email
+            user: Usuário da requisição, para o limite de chamadas por usuário
+            acquired: Se o chamador já consumiu a ficha do limite para esta chamada
+                (ex.: item reenviado individualmente pelo analyze_batch)
+
+        Raises:
+            RateLimitExceeded: Se o limite do usuário ou o global for atingido
+            ModelsUnavailable: Se todos os circuitos estiverem abertos
+        """
+        if not self.client:
+            return self._missing_key_error()
+
+        cache_key, cached = self._cache_lookup(processed_text, original_text)
+        if cached is not None:
+            return cached
+
+        def call():
+            if not acquired:
+                self.rate_limiter.acquire(user)
             try:
-                logger.info(f"Tentando analisar com o modelo: {model_name}")
-                
-                # Configuração para resposta JSON
-                response = self.client.models.generate_content(
-                    model=model_name,
+                result, model_name = self._generate_json(self._build_prompt(processed_text, original_text))
+            except RuntimeError as e:
+                return self._analysis_error(e)
+            return self._store_result(result, model_name, cache_key)
+
+        flight_key = self._flight_key(cache_key, processed_text, original_text)
+        for attempt in range(2):
+            try:
+                result, shared = self.flights.do(flight_key, call)
+            except RateLimitExceeded as e:
+                if self._retry_as_leader(e, user, attempt):
+                    continue
+                raise
+            return dict(result) if shared else result
+
+    async def analyze_email_async(self, processed_text, original_text, user=None):
+        """Versão assíncrona de analyze_email (não bloqueia o event loop durante a chamada)"""
+        if not self.client:
+            return self._missing_key_error()
+
+        cache_key, cached = self._cache_lookup(processed_text, original_text)
+        if cached is not None:
+            return cached
+
+        async def call():
+            await self.rate_limiter.acquire_async(user)
+            try:
+                result, model_name = await self._generate_json_async(
+                    self._build_prompt(processed_text, original_text))
+            except RuntimeError as e:
+                return self._analysis_error(e)
+            return self._store_result(result, model_name, cache_key)
+
+        flight_key = self._flight_key(cache_key, processed_text, original_text)
+        for attempt in range(2):
+            try:
+                result, shared = await self.async_flights.do(flight_key, call)
+            except RateLimitExceeded as e:
+                if self._retry_as_leader(e, user, attempt):
+                    continue
+                raise
+            return dict(result) if shared else result
+
+    def _stream_cached(self, cached):
+        yield "classification", cached.get("classification")
+        if cached.get("suggested_response"):
+            yield "token", cached["suggested_response"]
+        yield "done", cached
+
+    def analyze_email_stream(self, processed_text, original_text, user=None):
+        """
+        Versão em streaming de analyze_email (sem coalescência; RateLimitExceeded
+        e ModelsUnavailable saem do primeiro next(), antes de qualquer evento)
+
+        Yields:
+            Tuplas (evento, valor): ("classification", str) assim que a classificação
+            é lida, ("token", str) com pedaços do suggested_response e, por fim,
+            ("done", análise completa) ou ("error", mensagem) se a geração falhar
+            depois de já ter enviado eventos
+        """
+        if not self.client:
+            yield "done", self._missing_key_error()
+            return
+
+        cache_key, cached = self._cache_lookup(processed_text, original_text)
+        if cached is not None:
+            yield from self._stream_cached(cached)
+            return
+
+        self.rate_limiter.acquire(user)
+        prompt = self._build_prompt(processed_text, original_text)
+        chain = _FallbackChain(self, prompt)
+        for attempt in chain:
+            parser = AnalysisStreamParser()
+            emitted = False
+            with attempt:
+                logger.info(f"Tentando analisar (streaming) com o modelo: {attempt.model_name}")
+                chunk = None
+                for chunk in self.client.models.generate_content_stream(
+                    model=attempt.model_name,
                     contents=prompt,
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json"
-                    )
-                )
-                
-                # Se chegou aqui, funcionou
-                result = json.loads(response.text)
-                
-                # Adiciona metadados sobre qual modelo foi usado (útil para debug/info)
-                result['model_used'] = model_name
-                return result
-
-            except Exception as e:
-                last_error = str(e)
-                tried_models.append(model_name)
-                logger.warning(f"Falha com modelo {model_name}: {e}")
+                    config=self._json_config()
+                ):
+                    for event in parser.feed(chunk.text or ""):
+                        emitted = True
+                        yield event
+                result = parser.result()
+                # O uso de tokens vem no último pedaço da resposta
+                attempt.succeeded(chunk)
+
+            if attempt.error is not None:
+                # O cliente já recebeu parte da resposta: não dá para trocar de modelo
+                if emitted:
+                    yield "error", attempt.error
+                    return
                 continue
 
-        # Se saiu do loop, todos falharam
-        error_msg = f"Falha em todos os modelos tentados ({', '.join(tried_models)}). Último erro: {last_error}"
-        logger.error(error_msg)
+            yield "done", self._store_result(result, attempt.model_name, cache_key)
+            return
+
+        yield "done", self._analysis_error(chain.failed())
+
+    async def analyze_email_stream_async(self, processed_text, original_text, user=None):
+        """Versão assíncrona de analyze_email_stream, usada pelo modo ASGI"""
+        if not self.client:
+            yield "done", self._missing_key_error()
+            return
+
+        cache_key, cached = self._cache_lookup(processed_text, original_text)
+        if cached is not None:
+            for event in self._stream_cached(cached):
+                yield event
+            return
+
+        await self.rate_limiter.acquire_async(user)
+        prompt = self._build_prompt(processed_text, original_text)
+        chain = _FallbackChain(self, prompt)
+        for attempt in chain:
+            parser = AnalysisStreamParser()
+            emitted = False
+            with attempt:
+                logger.info(f"Tentando analisar (streaming) com o modelo: {attempt.model_name}")
+                chunk = None
+                async for chunk in self.client.aio.models.generate_content_stream(
+                    model=attempt.model_name,
+                    contents=prompt,
+                    config=self._json_config()
+                ):
+                    for event in parser.feed(chunk.text or ""):
+                        emitted = True
+                        yield event
+                result = parser.result()
+                attempt.succeeded(chunk)
+
+            if attempt.error is not None:
+                # O cliente já recebeu parte da resposta: não dá para trocar de modelo
+                if emitted:
+                    yield "error", attempt.error
+                    return
+                continue
+
+            yield "done", self._store_result(result, attempt.model_name, cache_key)
+            return
+
+        yield "done", self._analysis_error(chain.failed())
+
+    def _chunk_batch(self, entries, max_chars, max_items):
+        """Agrupa os emails em lotes limitados por número de caracteres e de itens"""
+        chunk, chunk_chars = [], 0
+        for entry in entries:
+            size = sum(len(text) for text in entry[3].values())
+            if chunk and (chunk_chars + size > max_chars or len(chunk) >= max_items):
+                yield chunk
+                chunk, chunk_chars = [], 0
+            chunk.append(entry)
+            chunk_chars += size
+        if chunk:
+            yield chunk
+
+    def _analyze_chunk(self, chunk):
+        """
+        Classifica um lote de emails em uma única chamada
+
+        Returns:
+            Dicionário {índice: resultado} com os itens válidos da resposta
+        """
+        payload = [
+            {"id": index, **{_BATCH_VIEW_KEYS[name]: text for name, text in views.items()}}
+            for index, _, _, views in chunk
+        ]
+
+        prompt = f"""
+        Você é um assistente de triagem de emails inteligente.
         
-        return {
-            "classification": "erro",
-            "suggested_response": error_msg,
-            "reasoning": "Falha de conexão com múltiplos modelos IA"
-        }
+        Analise cada email da lista JSON abaixo:
+        {json.dumps(payload, ensure_ascii=False)}
+        
+        Tarefa, para cada email:
+        1. Classifique o email como 'produtivo' (requer ação humana, resposta, ou é importante) ou 'improdutivo' (spam, promoções, notificações automáticas, agradecimentos simples sem necessidade de follow-up).
+        2. Se for 'produtivo', sugira uma resposta profissional e direta. Se for 'improdutivo', a resposta pode ser null ou uma breve justificativa.
+        
+        Retorne EXATAMENTE um array JSON com um objeto por email, mantendo o mesmo "id":
+        [
+            {{
+                "id": Number,
+                "classification": "produtivo" | "improdutivo",
+                "suggested_response": String | null,
+                "reasoning": "Breve explicação da classificação"
+            }}
+        ]
+        """
+
+        response, model_name = self._generate_json(prompt)
+        if not isinstance(response, list):
+            return {}
+
+        expected_ids = {index for index, _, _, _ in chunk}
+        results = {}
+        for item in response:
+            if not isinstance(item, dict) or item.get("id") not in expected_ids:
+                continue
+            if item.get("classification") not in ("produtivo", "improdutivo"):
+                continue
+            results[item["id"]] = {
+                "classification": item["classification"],
+                "suggested_response": item.get("suggested_response"),
+                "reasoning": item.get("reasoning"),
+                "model_used": model_name
+            }
+        return results
+
+    def analyze_batch(self, items, max_chars=None, max_items=None, user=None):
+        """
+        Classifica vários emails agrupando-os em poucas chamadas ao modelo
+
+        Args:
+            items: Lista de tuplas (processed_text, original_text)
+            max_chars: Orçamento de caracteres do texto enviado por chamada
+            max_items: Número máximo de emails por chamada
+            user: Usuário da requisição (cada chamada conta no limite por usuário)
+
+        Returns:
+            Lista de resultados na mesma ordem da entrada
+        """
+        if not self.client:
+            return [self._missing_key_error() for _ in items]
+
+        max_chars = max_chars or int(os.getenv('GEMINI_BATCH_MAX_CHARS', 30000))
+        max_items = max_items or int(os.getenv('GEMINI_BATCH_MAX_ITEMS', 20))
+
+        results = [None] * len(items)
+        cache_keys = [None] * len(items)
+        pending = []
+        for index, (processed_text, original_text) in enumerate(items):
+            cache_keys[index], cached = self._cache_lookup(processed_text, original_text)
+            if cached is not None:
+                results[index] = cached
+                continue
+            pending.append((index, processed_text, original_text,
+                            self.prompt_builder.build_views(processed_text, original_text)))
+
+        for chunk in self._chunk_batch(pending, max_chars, max_items):
+            self.rate_limiter.acquire(user)
+            try:
+                chunk_results = self._analyze_chunk(chunk)
+            except RuntimeError:
+                chunk_results = {}
+
+            for index, processed_text, original_text, _ in chunk:
+                result = chunk_results.get(index)
+                if result is None:
+                    # Resposta do lote malformada ou incompleta: chamada individual, com a ficha do lote
+                    logger.warning(f"Item {index} ausente na resposta do lote, analisando individualmente")
+                    results[index] = self.analyze_email(processed_text, original_text, user, acquired=True)
+                    continue
+                if cache_keys[index] is not None:
+                    self.cache.set(cache_keys[index], result)
+                results[index] = result
+
+        return results
@@ -0,0 +1,212 @@
+"""
+Pool de conexões IMAP autenticadas, reutilizadas entre requisições da mesma conta
+"""
+
+import hashlib
+import imaplib
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+class PoolTimeout(TimeoutError):
+    """Nenhuma conexão do pool ficou livre a tempo (não é uma falha de rede)"""
+
+
+class IMAPConnectionPool:
+    """
+    Mantém sessões IMAP já autenticadas por conta (host, porta, usuário)
+
+    A chave inclui um hash da senha para que uma sessão nunca seja entregue a
+    quem não conhece a senha que a autenticou. Cada acquire varre, no máximo uma
+    vez por sweep_interval, as sessões ociosas expiradas de todas as contas e
+    remove as contas sem sessões, para que contas que não voltam não deixem
+    sockets abertos nem entradas no dicionário.
+    """
+
+    def __init__(self, max_per_account=2, idle_timeout=300, keepalive_interval=60, acquire_timeout=30,
+                 sweep_interval=None):
+        self.max_per_account = max_per_account
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.acquire_timeout = acquire_timeout
+        self.sweep_interval = keepalive_interval if sweep_interval is None else sweep_interval
+        self._lock = threading.Lock()
+        self._accounts = {}
+        self._next_sweep = time.monotonic() + self.sweep_interval
+
+    def _account(self, key):
+        account = self._accounts.get(key)
+        if account is None:
+            account = self._accounts[key] = {
+                "idle": [],
+                "active": 0,
+                "waiting": 0,
+                "available": threading.Condition(self._lock)
+            }
+        return account
+
+    def _discard_if_empty(self, key, account):
+        if not account["idle"] and account["active"] == 0 and account["waiting"] == 0:
+            del self._accounts[key]
+
+    def _sweep(self, now, expired):
+        """Separa as sessões expiradas de todas as contas e remove as contas vazias (com o lock)"""
+        self._next_sweep = now + self.sweep_interval
+        for key, account in list(self._accounts.items()):
+            keep = []
+            for mail, last_used in account["idle"]:
+                if now - last_used > self.idle_timeout:
+                    expired.append(mail)
+                else:
+                    keep.append((mail, last_used))
+            account["idle"] = keep
+            self._discard_if_empty(key, account)
+
+    @staticmethod
+    def _key(host, port, user, password):
+        digest = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return (host, port, user, digest)
+
+    @staticmethod
+    def _open(host, port, user, password, use_ssl):
+        # Só conexões novas contam como imap.connect; sessões reaproveitadas não
+        with metrics.span("imap.connect"):
+            mail = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
+            try:
+                mail.login(user, password)
+            except Exception:
+                IMAPConnectionPool._close(mail)
+                raise
+        return mail
+
+    @staticmethod
+    def _close(mail):
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    def _is_alive(self, mail, idle_for):
+        if idle_for < self.keepalive_interval:
+            return True
+        try:
+            status, _ = mail.noop()
+            return status == "OK"
+        except Exception:
+            return False
+
+    def acquire(self, host, port, user, password, use_ssl=True):
+        key = self._key(host, port, user, password)
+        deadline = time.monotonic() + self.acquire_timeout
+        expired = []
+
+        with self._lock:
+            if time.monotonic() >= self._next_sweep:
+                self._sweep(time.monotonic(), expired)
+            account = self._account(key)
+            while True:
+                now = time.monotonic()
+                while account["idle"]:
+                    mail, last_used = account["idle"].pop()
+                    idle_for = now - last_used
+                    if idle_for > self.idle_timeout:
+                        expired.append(mail)
+                        continue
+                    account["active"] += 1
+                    break
+                else:
+                    mail = None
+
+                if mail is not None:
+                    break
+                if account["active"] < self.max_per_account:
+                    account["active"] += 1
+                    idle_for = None
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise PoolTimeout(f"Nenhuma conexão IMAP disponível para {user}")
+                account["waiting"] += 1
+                try:
+                    notified = account["available"].wait(remaining)
+                finally:
+                    account["waiting"] -= 1
+                if not notified:
+                    raise PoolTimeout(f"Nenhuma conexão IMAP disponível para {user}")
+
+        # Rede fora do lock: encerra as expiradas, keepalive da reaproveitada ou nova conexão
+        for expired_mail in expired:
+            self._close(expired_mail)
+        try:
+            if mail is not None and not self._is_alive(mail, idle_for):
+                self._close(mail)
+                mail = None
+            if mail is None:
+                mail = self._open(host, port, user, password, use_ssl)
+        except Exception:
+            self._release_slot(key)
+            raise
+        return key, mail
+
+    def _release_slot(self, key):
+        with self._lock:
+            account = self._account(key)
+            account["active"] -= 1
+            account["available"].notify()
+            self._discard_if_empty(key, account)
+
+    def release(self, key, mail, broken=False):
+        if broken:
+            self._close(mail)
+            self._release_slot(key)
+            return
+        with self._lock:
+            account = self._account(key)
+            account["active"] -= 1
+            account["idle"].append((mail, time.monotonic()))
+            account["available"].notify()
+
+    @contextmanager
+    def connection(self, host, port, user, password, use_ssl=True):
+        """
+        Empresta uma conexão autenticada. Em caso de erro de rede a conexão
+        é descartada em vez de voltar ao pool.
+        """
+        key, mail = self.acquire(host, port, user, password, use_ssl)
+        broken = False
+        try:
+            yield mail
+        except (imaplib.IMAP4.abort, OSError):
+            broken = True
+            raise
+        finally:
+            self.release(key, mail, broken=broken)
+
+    def close_idle(self, max_idle=None):
+        """Encerra conexões ociosas (todas, ou as ociosas há mais de max_idle segundos)"""
+        now = time.monotonic()
+        to_close = []
+        with self._lock:
+            for key, account in list(self._accounts.items()):
+                keep = []
+                for mail, last_used in account["idle"]:
+                    if max_idle is None or now - last_used > max_idle:
+                        to_close.append(mail)
+                    else:
+                        keep.append((mail, last_used))
+                account["idle"] = keep
+                self._discard_if_empty(key, account)
+        for mail in to_close:
+            self._close(mail)
+        return len(to_close)
+
+    def stats(self):
+        with self._lock:
+            return {
+                f"{host}:{port}/{user}": {"idle": len(account["idle"]), "active": account["active"]}
+                for (host, port, user, _), account in self._accounts.items()
+            }
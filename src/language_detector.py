@@ -0,0 +1,81 @@
+"""
+Detecção rápida do idioma do email (pt, en, es) sem modelos nem NLTK
+Combina a proporção de stopwords de cada idioma com n-gramas de caracteres
+característicos, olhando apenas o início do texto
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable
+
+# Códigos de config.SUPPORTED_LANGUAGES -> nomes usados pelo NLTK
+LANGUAGE_NAMES = {"pt": "portuguese", "en": "english", "es": "spanish"}
+
+# Palavras mais frequentes de cada idioma, sem acentos (palavras em comum contam para ambos)
+STOPWORDS = {
+    "pt": frozenset((
+        "o a os as um uma de do da dos das em no na nos nas por para com que nao e se "
+        "mais como mas ao aos seu sua seus suas voce voces esta estao sao foi pelo pela "
+        "isso este essa ele ela eles tem ja muito obrigado obrigada ola favor segue"
+    ).split()),
+    "en": frozenset((
+        "the and of to in is it you that for on with are this be have not your we at "
+        "from by an or as was will can our if my me please thanks thank hello hi would "
+        "could should there their they what which"
+    ).split()),
+    "es": frozenset((
+        "el la los las un una de del en que y por para con no es se lo al como mas pero "
+        "su sus usted ustedes esta estan son fue muy tambien hay gracias hola favor este "
+        "esto ella ellos tiene ya le les nos"
+    ).split()),
+}
+
+# Sequências típicas de cada idioma, procuradas no texto com acentos
+MARKERS = {
+    "pt": ("ção", "ções", "ão ", "ões", "nh", "lh", "ê", "õ"),
+    "en": ("th", "wh", "ing ", "ght", " i ", "'s "),
+    "es": ("ción", "ñ", "ll", "¿", "¡", "ía ", "ué"),
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _strip_accents(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode("ASCII")
+
+
+def language_scores(text: str, max_chars: int = 1000) -> Dict[str, float]:
+    """
+    Pontuação de cada idioma: proporção de palavras que são stopwords do idioma
+    mais um bônus pelos n-gramas característicos encontrados
+    """
+    sample = text[:max_chars].lower()
+    words = _WORD_RE.findall(_strip_accents(sample))
+    scores = {}
+    for code, stopwords in STOPWORDS.items():
+        ratio = sum(word in stopwords for word in words) / len(words) if words else 0.0
+        markers = sum(sample.count(marker) for marker in MARKERS[code])
+        scores[code] = ratio + 0.02 * markers
+    return scores
+
+
+def detect_language(text: str, default: str = "pt", languages: Iterable[str] = tuple(LANGUAGE_NAMES),
+                    min_score: float = 0.1) -> str:
+    """
+    Args:
+        text: Texto original do email
+        default: Idioma devolvido quando não há sinal suficiente (ou empate)
+        languages: Idiomas considerados
+        min_score: Pontuação mínima para trocar o idioma padrão
+
+    Returns:
+        Código do idioma (pt, en ou es)
+    """
+    scores = language_scores(text)
+    candidates = [code for code in languages if code in scores]
+    if not candidates:
+        return default
+    best = max(candidates, key=lambda code: (scores[code], code == default))
+    if scores[best] < min_score or scores[best] <= scores.get(default, 0.0):
+        return default
+    return best
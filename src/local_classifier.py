@@ -0,0 +1,209 @@
+"""
+Classificador local (TF-IDF com hashing + regressão logística) sobre o stemmed_text
+Decide sozinho os casos óbvios e deixa para o Gemini os incertos ou os que
+precisam de resposta sugerida. A inferência usa apenas NumPy
+"""
+
+import os
+import pickle
+import zlib
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+POSITIVE_LABEL = "produtivo"
+NEGATIVE_LABEL = "improdutivo"
+# Origens de rótulo usadas no treino: modelos do Gemini e correções manuais. Rótulos
+# do próprio classificador ou copiados de quase-duplicatas realimentariam os erros dele
+TRUSTED_LABEL_SOURCES = ("gemini", "human")
+
+
+def trusted_label(model_used: Optional[str]) -> bool:
+    """
+    Se o rótulo veio do Gemini (inclusive via cache) ou de uma correção manual
+
+    Sem origem (None) conta como Gemini: são as análises gravadas antes da
+    coluna model_used, quando ainda não havia classificador local.
+    """
+    if model_used is None:
+        return True
+    source = str(model_used)
+    if source.startswith("cache:"):
+        source = source[len("cache:"):]
+    return source.startswith(TRUSTED_LABEL_SOURCES)
+
+
+class HashedTfidfVectorizer:
+    """
+    TF-IDF sem vocabulário: unigramas e bigramas vão para n_features posições
+    via crc32 (estável entre processos, ao contrário de hash())
+
+    Args:
+        n_features: Tamanho do espaço de features
+        ngram_range: Menor e maior n-grama extraído
+    """
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range: Tuple[int, int] = (1, 2)):
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.idf = np.ones(n_features, dtype=np.float32)
+
+    def _bucket_counts(self, text: str) -> Counter:
+        tokens = text.split()
+        low, high = self.ngram_range
+        counts = Counter()
+        for n in range(low, high + 1):
+            for i in range(len(tokens) - n + 1):
+                gram = " ".join(tokens[i:i + n])
+                counts[zlib.crc32(gram.encode("utf-8")) % self.n_features] += 1
+        return counts
+
+    def fit(self, texts: Iterable[str]) -> "HashedTfidfVectorizer":
+        df = np.zeros(self.n_features, dtype=np.float64)
+        n_docs = 0
+        for text in texts:
+            n_docs += 1
+            df[list(self._bucket_counts(text))] += 1
+        # idf suavizado, como no scikit-learn
+        self.idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tupla (índices, valores) do vetor esparso normalizado (L2)
+        """
+        counts = self._bucket_counts(text)
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        values = (1 + np.log(tf)) * self.idf[indices]
+        norm = np.linalg.norm(values)
+        if norm > 0:
+            values /= norm
+        return indices, values
+
+    def state(self) -> dict:
+        return {"n_features": self.n_features, "ngram_range": self.ngram_range, "idf": self.idf}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "HashedTfidfVectorizer":
+        vectorizer = cls(state["n_features"], state["ngram_range"])
+        vectorizer.idf = state["idf"]
+        return vectorizer
+
+
+class LocalClassifier:
+    """
+    Regressão logística sobre HashedTfidfVectorizer
+
+    Args:
+        vectorizer: Vetorizador já ajustado
+        coef: Pesos por feature
+        intercept: Viés do modelo
+    """
+
+    def __init__(self, vectorizer: HashedTfidfVectorizer, coef: np.ndarray, intercept: float):
+        self.vectorizer = vectorizer
+        self.coef = coef
+        self.intercept = float(intercept)
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str], n_features: int = 2 ** 18,
+              epochs: int = 300, learning_rate: float = 2.0, l2: float = 1e-4) -> "LocalClassifier":
+        """
+        Treina com gradiente descendente em lote completo sobre a matriz esparsa
+
+        Args:
+            texts: Textos já processados (stemmed_text)
+            labels: 'produtivo' ou 'improdutivo' para cada texto
+            n_features: Tamanho do espaço de features
+            epochs: Iterações do gradiente
+            learning_rate: Passo do gradiente
+            l2: Regularização dos pesos
+
+        Returns:
+            Classificador treinado
+        """
+        vectorizer = HashedTfidfVectorizer(n_features).fit(texts)
+        rows = [vectorizer.transform(text) for text in texts]
+        lengths = np.array([len(indices) for indices, _ in rows])
+        indices = np.concatenate([r[0] for r in rows]) if rows else np.zeros(0, dtype=np.int64)
+        data = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0, dtype=np.float32)
+        row_ids = np.repeat(np.arange(len(rows)), lengths)
+
+        y = np.array([label == POSITIVE_LABEL for label in labels], dtype=np.float64)
+        # Pesos por classe: a base costuma ter muito mais de um rótulo que do outro
+        positives = max(y.sum(), 1)
+        negatives = max(len(y) - y.sum(), 1)
+        sample_weight = np.where(y == 1, len(y) / (2 * positives), len(y) / (2 * negatives))
+
+        coef = np.zeros(n_features, dtype=np.float64)
+        intercept = 0.0
+        for _ in range(epochs):
+            scores = np.bincount(row_ids, weights=coef[indices] * data, minlength=len(rows)) + intercept
+            error = (1 / (1 + np.exp(-scores)) - y) * sample_weight / len(y)
+            grad = np.bincount(indices, weights=data * error[row_ids], minlength=n_features) + l2 * coef
+            coef -= learning_rate * grad
+            intercept -= learning_rate * error.sum()
+
+        return cls(vectorizer, coef.astype(np.float32), intercept)
+
+    def predict_proba(self, stemmed_text: str) -> float:
+        """Probabilidade de o email ser 'produtivo'"""
+        indices, values = self.vectorizer.transform(stemmed_text)
+        score = float(np.dot(self.coef[indices], values)) + self.intercept
+        return float(1 / (1 + np.exp(-score)))
+
+    def classify(self, stemmed_text: str) -> Tuple[str, float]:
+        """
+        Returns:
+            Tupla (classificação, confiança entre 0.5 e 1)
+        """
+        proba = self.predict_proba(stemmed_text)
+        if proba >= 0.5:
+            return POSITIVE_LABEL, proba
+        return NEGATIVE_LABEL, 1 - proba
+
+    def decide(self, stemmed_text: str, threshold: float, need_reply: bool = True) -> Optional[dict]:
+        """
+        Análise local no formato do GeminiService, ou None quando o email deve
+        ir para o Gemini (confiança abaixo do limiar ou resposta sugerida necessária)
+        """
+        label, confidence = self.classify(stemmed_text)
+        if confidence < threshold:
+            return None
+        if label == POSITIVE_LABEL and need_reply:
+            return None
+        return {
+            "classification": label,
+            "suggested_response": None,
+            "reasoning": f"Classificado pelo modelo local com confiança {confidence:.2f}.",
+            "confidence": round(confidence, 4),
+            "model_used": "local"
+        }
+
+    def save(self, model_path: str, vectorizer_path: str):
+        for path in (model_path, vectorizer_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        with open(vectorizer_path, "wb") as f:
+            pickle.dump(self.vectorizer.state(), f)
+        with open(model_path, "wb") as f:
+            pickle.dump({"coef": self.coef, "intercept": self.intercept}, f)
+
+    @classmethod
+    def load(cls, model_path: str, vectorizer_path: str) -> Optional["LocalClassifier"]:
+        """Carrega o modelo salvo por train_classifier.py (None se ainda não foi treinado)"""
+        if not (os.path.exists(model_path) and os.path.exists(vectorizer_path)):
+            return None
+        try:
+            with open(vectorizer_path, "rb") as f:
+                vectorizer = HashedTfidfVectorizer.from_state(pickle.load(f))
+            with open(model_path, "rb") as f:
+                model = pickle.load(f)
+            return cls(vectorizer, model["coef"], model["intercept"])
+        except Exception as e:
+            print(f"Erro ao carregar o classificador local: {e}")
+            return None
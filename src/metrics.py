@@ -0,0 +1,192 @@
+"""
+Métricas de latência por etapa no formato de exposição do Prometheus
+Cada etapa (NLP, tentativas no Gemini, Supabase, IMAP, PDF) alimenta um
+histograma e, durante uma requisição, os spans viram o cabeçalho Server-Timing
+
+Os valores são por processo: com vários workers do gunicorn, cada scrape de
+/metrics lê o worker que atendeu a requisição.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Limites dos buckets em segundos (de etapas de NLP a chamadas lentas ao Gemini)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinação de labels: [contagem por bucket, soma, contagem]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return series[2] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {repr(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Texto no formato de exposição do Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "autou_stage_duration_seconds", "Duração de cada etapa do processamento", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "autou_stage_errors_total", "Etapas que terminaram com erro", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "autou_http_request_duration_seconds", "Duração das requisições HTTP", ("method", "endpoint"))
+REQUESTS = REGISTRY.counter(
+    "autou_http_requests_total", "Requisições HTTP por status", ("method", "endpoint", "status"))
+
+# Spans da requisição atual (None fora de uma requisição, ex.: threads em segundo plano)
+_request_spans: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_spans", default=None)
+
+
+def start_request():
+    """Começa a coletar os spans da requisição atual"""
+    _request_spans.set([])
+
+
+def observe(stage: str, seconds: float, error: bool = False):
+    """Registra a duração de uma etapa já medida (no histograma e no Server-Timing)"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if error:
+        STAGE_ERRORS.inc(stage=stage)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Mede o bloco como uma etapa; exceções são contadas e propagadas"""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, error)
+
+
+def server_timing(total: Optional[float] = None) -> str:
+    """
+    Cabeçalho Server-Timing com a soma das durações de cada etapa da requisição
+    (ex.: nlp.clean;dur=0.4, gemini.gemini-2.5-flash;dur=812.3, total;dur=815.0)
+    """
+    durations: Dict[str, float] = {}
+    for stage, seconds in _request_spans.get() or ():
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items())
+
+
+def finish_request(method: str, endpoint: str, status: int, seconds: float) -> str:
+    """Registra a requisição nos contadores e devolve o valor do cabeçalho Server-Timing"""
+    REQUEST_SECONDS.observe(seconds, method=method, endpoint=endpoint)
+    REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+    return server_timing(seconds)
@@ -0,0 +1,124 @@
+"""
+Extração do corpo de emails MIME para classificação
+Escolhe a primeira parte text/plain (ou text/html convertida em texto), ignora
+anexos sem decodificá-los, respeita o charset de cada parte e decodifica
+apenas o trecho necessário para o limite de caracteres
+"""
+
+import binascii
+import codecs
+import html
+import re
+from email.message import Message
+from typing import Optional
+
+# Limite de caracteres do corpo usado na classificação
+DEFAULT_MAX_CHARS = 5000
+# Bytes por caractere no pior caso (UTF-8), para o orçamento de decodificação
+_MAX_BYTES_PER_CHAR = 4
+# HTML tem muito markup por caractere de texto: o orçamento bruto é maior
+_HTML_BUDGET_FACTOR = 8
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_HTML_DROP_RE = re.compile(r"<!--.*?-->|<(script|style|head|title)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_BREAK_RE = re.compile(r"<(?:br|/p|/div|/tr|/li|/h[1-6]|/table|/blockquote)\b[^>]*>", re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r"<[^>]*>")
+_HTML_SPACES_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+_HTML_BLANK_LINES_RE = re.compile(r"\s*\n\s*")
+
+
+def _codec(charset: Optional[str]) -> str:
+    """Codec Python do charset declarado; charsets desconhecidos viram utf-8"""
+    if charset:
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def decode_payload(part: Message, max_bytes: Optional[int] = None) -> str:
+    """
+    Decodifica o conteúdo de uma parte (base64, quoted-printable ou 7bit/8bit)
+    com o charset da parte, processando no máximo ~max_bytes bytes decodificados
+
+    Args:
+        part: Parte MIME não multipart
+        max_bytes: Orçamento de bytes após a decodificação (None decodifica tudo)
+
+    Returns:
+        Texto da parte (bytes inválidos viram U+FFFD)
+    """
+    raw = part.get_payload()
+    if not isinstance(raw, str):
+        return ""
+    encoding = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+
+    if encoding == "base64":
+        if max_bytes is not None:
+            # 4 caracteres base64 para cada 3 bytes, mais as quebras de linha
+            needed = (max_bytes // 3 + 1) * 4
+            raw = raw[:needed + needed // 38 + 8]
+        compact = _WHITESPACE_RE.sub("", raw)
+        compact = compact[:len(compact) // 4 * 4]
+        try:
+            data = binascii.a2b_base64(compact.encode("ascii", "ignore"))
+        except binascii.Error:
+            data = b""
+    elif encoding == "quoted-printable":
+        if max_bytes is not None and len(raw) > max_bytes * 3:
+            raw = raw[:max_bytes * 3]
+            # Não corta uma sequência =XX pela metade
+            cut = raw.rfind("=", len(raw) - 2)
+            if cut != -1:
+                raw = raw[:cut]
+        data = binascii.a2b_qp(raw.encode("utf-8", "surrogateescape"))
+    else:
+        # 7bit/8bit: os bytes originais, sem decodificar com o charset (feito abaixo, só no trecho usado)
+        data = part.get_payload(decode=True) or b""
+
+    if max_bytes is not None:
+        data = data[:max_bytes]
+    return data.decode(_codec(part.get_content_charset()), errors="replace")
+
+
+def html_to_text(markup: str) -> str:
+    """Conversão rápida de HTML em texto: remove scripts, estilos e tags e mantém as quebras de bloco"""
+    text = _HTML_DROP_RE.sub(" ", markup)
+    text = _HTML_BREAK_RE.sub("\n", text)
+    text = _HTML_TAG_RE.sub(" ", text)
+    text = html.unescape(text)
+    text = _HTML_SPACES_RE.sub(" ", text)
+    return _HTML_BLANK_LINES_RE.sub("\n", text).strip()
+
+
+def _is_attachment(part: Message) -> bool:
+    # Só o cabeçalho é lido: o conteúdo do anexo nunca é decodificado
+    return part.get_content_disposition() == "attachment"
+
+
+def extract_body(msg: Message, max_chars: int = DEFAULT_MAX_CHARS) -> str:
+    """
+    Corpo do email em texto: a primeira parte text/plain que não é anexo ou,
+    na falta dela, a primeira text/html convertida em texto
+
+    Args:
+        msg: Mensagem já parseada (email.message_from_bytes)
+        max_chars: Número máximo de caracteres devolvidos
+
+    Returns:
+        Texto com no máximo max_chars caracteres ("" se não houver corpo de texto)
+    """
+    max_bytes = max_chars * _MAX_BYTES_PER_CHAR + _MAX_BYTES_PER_CHAR
+    html_part = None
+    for part in msg.walk():
+        if part.is_multipart() or _is_attachment(part):
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            return decode_payload(part, max_bytes)[:max_chars]
+        if content_type == "text/html" and html_part is None:
+            html_part = part
+    if html_part is not None:
+        return html_to_text(decode_payload(html_part, max_bytes * _HTML_BUDGET_FACTOR))[:max_chars]
+    return ""
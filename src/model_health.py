@@ -0,0 +1,160 @@
+"""
+Circuit breaker por modelo do Gemini
+Mantém o estado de saúde de cada modelo para pular os que estão falhando
+"""
+
+import math
+import threading
+import time
+from typing import Dict, List
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelsUnavailable(Exception):
+    """
+    Todos os modelos estão com o circuito aberto (nenhum fechado nem liberado para teste)
+
+    Args:
+        retry_after: Segundos até o primeiro modelo sair do cooldown
+    """
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Todos os modelos do Gemini estão indisponíveis; tente novamente em "
+                         f"{self.retry_after_seconds}s")
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Valor inteiro para o cabeçalho Retry-After"""
+        return max(1, math.ceil(self.retry_after))
+
+
+class _ModelState:
+    def __init__(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+        self.last_error = None
+        self.prompt_calls = 0
+        self.total_prompt_tokens = 0
+        self.last_prompt_tokens = 0
+
+
+class ModelHealth:
+    """
+    Registra falhas e latência por modelo e decide quais podem ser chamados
+
+    Após `failure_threshold` falhas consecutivas o modelo fica aberto (ignorado)
+    por `cooldown` segundos. Depois disso uma única requisição de teste
+    (half-open) é liberada: sucesso fecha o circuito, falha reabre.
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._models: Dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState()
+        return state
+
+    def allow(self, model: str) -> bool:
+        """Indica se o modelo pode ser chamado agora"""
+        with self._lock:
+            state = self._get(model)
+            if state.state == CLOSED:
+                return True
+            if state.state == OPEN:
+                if time.monotonic() - state.opened_at < self.cooldown:
+                    return False
+                state.state = HALF_OPEN
+                state.probe_in_flight = False
+            # Half-open: apenas uma requisição de teste por vez
+            if state.probe_in_flight:
+                return False
+            state.probe_in_flight = True
+            return True
+
+    def release_probe(self, model: str):
+        """Libera a requisição de teste interrompida sem sucesso nem falha (ex.: cliente desconectado)"""
+        with self._lock:
+            state = self._get(model)
+            if state.state == HALF_OPEN:
+                state.probe_in_flight = False
+
+    def cooldown_remaining(self, models: List[str]) -> float:
+        """Segundos até o primeiro dos modelos sair do cooldown (0 se algum já pode ser testado)"""
+        now = time.monotonic()
+        with self._lock:
+            return min(
+                max(0.0, self.cooldown - (now - state.opened_at)) if state.state == OPEN else 0.0
+                for state in map(self._get, models)
+            )
+
+    def record_success(self, model: str, latency: float, prompt_tokens: int = None):
+        with self._lock:
+            state = self._get(model)
+            if prompt_tokens is not None:
+                state.prompt_calls += 1
+                state.total_prompt_tokens += prompt_tokens
+                state.last_prompt_tokens = prompt_tokens
+            state.calls += 1
+            state.total_latency += latency
+            state.last_latency = latency
+            state.max_latency = max(state.max_latency, latency)
+            state.consecutive_failures = 0
+            state.state = CLOSED
+            state.probe_in_flight = False
+
+    def record_failure(self, model: str, latency: float, error: str = None):
+        with self._lock:
+            state = self._get(model)
+            state.calls += 1
+            state.errors += 1
+            state.total_latency += latency
+            state.last_latency = latency
+            state.max_latency = max(state.max_latency, latency)
+            state.last_error = error
+            state.consecutive_failures += 1
+            state.probe_in_flight = False
+            if state.state == HALF_OPEN or state.consecutive_failures >= self.failure_threshold:
+                state.state = OPEN
+                state.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Estatísticas de latência, erros e tokens de prompt por modelo"""
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for model, state in self._models.items():
+                cooldown_remaining = 0.0
+                if state.state == OPEN:
+                    cooldown_remaining = max(0.0, self.cooldown - (now - state.opened_at))
+                result[model] = {
+                    "state": state.state,
+                    "consecutive_failures": state.consecutive_failures,
+                    "calls": state.calls,
+                    "errors": state.errors,
+                    "error_rate": state.errors / state.calls if state.calls else 0.0,
+                    "avg_latency_ms": 1000 * state.total_latency / state.calls if state.calls else 0.0,
+                    "max_latency_ms": 1000 * state.max_latency,
+                    "last_latency_ms": 1000 * state.last_latency,
+                    "last_error": state.last_error,
+                    "avg_prompt_tokens": state.total_prompt_tokens / state.prompt_calls if state.prompt_calls else 0.0,
+                    "last_prompt_tokens": state.last_prompt_tokens,
+                    "total_prompt_tokens": state.total_prompt_tokens,
+                    "cooldown_remaining_s": round(cooldown_remaining, 3)
+                }
+            return result
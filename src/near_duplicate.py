@@ -0,0 +1,199 @@
+"""
+Índice de quase-duplicatas (SimHash) para reaproveitar análises já feitas
+Newsletters, recibos e alertas chegam em várias cópias quase idênticas, que o
+cache exato não reconhece. Cada email vira uma assinatura de 64 bits calculada
+a partir dos stems; assinaturas a poucos bits de distância apontam para a mesma
+análise. As entradas são separadas por dono: a resposta sugerida e a
+justificativa foram geradas a partir do email de um usuário e nunca são
+entregues a outro
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from sqlite_local import LocalConnections
+
+FINGERPRINT_BITS = 64
+
+
+def _feature_hash(feature: str) -> bytes:
+    # blake2b é estável entre processos (hash() do Python é aleatorizado)
+    return hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+
+
+def simhash(stems: Sequence[str]) -> int:
+    """
+    Assinatura SimHash de 64 bits com stems e bigramas de stems como features,
+    ponderados pela frequência
+    """
+    features = Counter(stems)
+    features.update(f"{a} {b}" for a, b in zip(stems, stems[1:]))
+    if not features:
+        return 0
+    hashes = np.frombuffer(b"".join(_feature_hash(f) for f in features), dtype=np.uint8)
+    bits = np.unpackbits(hashes.reshape(len(features), 8), axis=1).astype(np.int64)
+    weights = np.fromiter(features.values(), dtype=np.int64, count=len(features))
+    scores = weights @ (2 * bits - 1)
+    return int.from_bytes(np.packbits(scores > 0).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _to_signed(fingerprint: int) -> int:
+    # INTEGER do SQLite é de 64 bits com sinal
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+class NearDuplicateIndex:
+    """
+    Busca por assinaturas a até max_distance bits usando bandas: com
+    max_distance + 1 bandas, duas assinaturas tão próximas sempre coincidem em
+    pelo menos uma banda inteira (princípio da casa dos pombos)
+
+    Em emails curtos (dezenas de stems) trocar uma palavra já muda de 4 a 10
+    bits, enquanto emails sem relação ficam perto de 32; por isso o padrão é 8
+
+    Os buckets são chaveados por (dono, banda): lookup só encontra entradas
+    adicionadas com o mesmo owner
+
+    Args:
+        path: Arquivo SQLite para persistir o índice (None mantém só em memória)
+        max_distance: Distância de Hamming máxima para considerar quase-duplicata
+        max_entries: Número máximo de assinaturas mantidas (as mais antigas saem)
+        min_features: Emails com menos stems não são indexados nem buscados
+        sync_interval: Intervalo (s) para ler entradas gravadas por outros workers
+    """
+
+    def __init__(self, path: Optional[str] = None, max_distance: int = 8, max_entries: int = 50000,
+                 min_features: int = 5, sync_interval: float = 5.0):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.min_features = min_features
+        self.sync_interval = sync_interval
+
+        bands = max_distance + 1
+        width = FINGERPRINT_BITS // bands
+        self._bands = [
+            (i * width, (1 << (FINGERPRINT_BITS - i * width if i == bands - 1 else width)) - 1)
+            for i in range(bands)
+        ]
+        self._buckets: List[Dict[tuple, set]] = [{} for _ in self._bands]
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._last_sync = 0.0
+        self._connection = None
+
+        if path:
+            self._connection = LocalConnections(path)
+            conn = self._connection()
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(fingerprints)")}
+            if columns and "owner" not in columns:
+                # Índice anterior à separação por dono: entradas sem dono não podem ser reaproveitadas
+                conn.execute("DROP TABLE IF EXISTS fingerprints")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint INTEGER NOT NULL, "
+                "analysis TEXT NOT NULL, created_at REAL NOT NULL, owner TEXT)"
+            )
+            with self._lock:
+                self._sync()
+
+    def _band_keys(self, fingerprint: int, owner: Optional[str]):
+        return [(owner, (fingerprint >> shift) & mask) for shift, mask in self._bands]
+
+    def _insert(self, entry_id: int, fingerprint: int, owner: Optional[str], analysis: Dict):
+        self._entries[entry_id] = (fingerprint, owner, analysis)
+        for buckets, key in zip(self._buckets, self._band_keys(fingerprint, owner)):
+            buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            old_id, (old_fingerprint, old_owner, _) = self._entries.popitem(last=False)
+            for buckets, key in zip(self._buckets, self._band_keys(old_fingerprint, old_owner)):
+                ids = buckets.get(key)
+                if ids is not None:
+                    ids.discard(old_id)
+                    if not ids:
+                        del buckets[key]
+
+    def _sync(self):
+        """Carrega as entradas gravadas desde a última leitura (inclusive por outros workers)"""
+        self._last_sync = time.monotonic()
+        rows = self._connection().execute(
+            "SELECT id, fingerprint, owner, analysis FROM fingerprints WHERE id >= ? ORDER BY id",
+            (self._next_id,)
+        ).fetchall()
+        for entry_id, fingerprint, owner, analysis in rows:
+            self._insert(entry_id, fingerprint & ((1 << 64) - 1), owner, json.loads(analysis))
+            self._next_id = entry_id + 1
+
+    def _maybe_sync(self):
+        if self.path and time.monotonic() - self._last_sync > self.sync_interval:
+            self._sync()
+
+    def lookup(self, stems: Sequence[str], owner: Optional[str] = None) -> Optional[Dict]:
+        """
+        Args:
+            stems: Stems do email
+            owner: Dono das análises pesquisadas (ex.: o usuário da requisição)
+
+        Returns:
+            Dicionário com id, distance, similarity (1 - distância/64) e analysis
+            da entrada mais próxima, ou None se nenhuma estiver dentro do limite
+        """
+        if len(stems) < self.min_features:
+            return None
+        fingerprint = simhash(stems)
+        with self._lock:
+            self._maybe_sync()
+            candidates = set()
+            for buckets, key in zip(self._buckets, self._band_keys(fingerprint, owner)):
+                candidates.update(buckets.get(key, ()))
+
+            best = None
+            for entry_id in candidates:
+                distance = hamming_distance(fingerprint, self._entries[entry_id][0])
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (entry_id, distance)
+            if best is None:
+                return None
+            entry_id, distance = best
+            return {
+                "id": entry_id,
+                "distance": distance,
+                "similarity": round(1 - distance / FINGERPRINT_BITS, 4),
+                "analysis": dict(self._entries[entry_id][2])
+            }
+
+    def add(self, stems: Sequence[str], analysis: Dict, owner: Optional[str] = None) -> Optional[int]:
+        """Indexa a análise de um email do owner; devolve o id da entrada (None se o email for curto demais)"""
+        if len(stems) < self.min_features:
+            return None
+        fingerprint = simhash(stems)
+        with self._lock:
+            if self.path:
+                self._maybe_sync()
+                conn = self._connection()
+                entry_id = conn.execute(
+                    "INSERT INTO fingerprints (fingerprint, analysis, created_at, owner) VALUES (?, ?, ?, ?)",
+                    (_to_signed(fingerprint), json.dumps(analysis), time.time(), owner)
+                ).lastrowid
+                # Mantém no arquivo apenas as max_entries mais recentes
+                conn.execute("DELETE FROM fingerprints WHERE id <= ?", (entry_id - self.max_entries,))
+            else:
+                entry_id = self._next_id
+            self._next_id = max(self._next_id, entry_id + 1)
+            self._insert(entry_id, fingerprint, owner, analysis)
+            return entry_id
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
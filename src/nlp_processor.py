@@ -3,74 +3,300 @@ Módulo para processamento NLP de textos de email
 Inclui limpeza, tokenização, remoção de stop words e stemming
 """
 
-import nltk
 import re
 import string
 import ssl
 import os
+import threading
 import unicodedata
-from typing import List
-
-# Fix para erro de SSL no download do NLTK (comum em macOS)
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-# Configurar diretório de dados do NLTK local para evitar erro de permissão
-nltk_data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nltk_data')
-if not os.path.exists(nltk_data_dir):
-    os.makedirs(nltk_data_dir)
-nltk.data.path.append(nltk_data_dir)
-
-# Download de recursos necessários do NLTK (será feito na primeira execução)
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    print(f"Baixando NLTK punkt em {nltk_data_dir}...")
-    nltk.download('punkt', download_dir=nltk_data_dir)
-
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    print(f"Baixando NLTK stopwords em {nltk_data_dir}...")
-    nltk.download('stopwords', download_dir=nltk_data_dir)
-
-try:
-    nltk.data.find('stemmers/rslp')
-except LookupError:
-    print(f"Baixando NLTK rslp em {nltk_data_dir}...")
-    nltk.download('rslp', download_dir=nltk_data_dir)
-
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import RSLPStemmer
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional
+
+from language_detector import LANGUAGE_NAMES, STOPWORDS, detect_language
+
+# Diretório local de dados do NLTK (preenchido no build por provision.py)
+NLTK_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'nltk_data')
+
+# Recursos usados pelo processador e seus caminhos no nltk.data
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'rslp': 'stemmers/rslp'
+}
+
+
+@lru_cache(maxsize=None)
+def _nltk():
+    """
+    Importa o NLTK na primeira utilização (e não no import do módulo) e
+    registra o diretório local de dados. Nenhum download é feito aqui, a menos
+    que NLTK_AUTO_DOWNLOAD=true (conveniência para desenvolvimento)
+    """
+    import nltk
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_DIR)
+    if os.getenv('NLTK_AUTO_DOWNLOAD', 'false').lower() == 'true':
+        download_resources()
+    return nltk
+
+
+def missing_resources() -> List[str]:
+    """Recursos do NLTK que ainda não estão disponíveis localmente"""
+    nltk = _nltk()
+    missing = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    return missing
+
+
+def download_resources(download_dir: str = NLTK_DATA_DIR) -> List[str]:
+    """
+    Baixa os recursos ausentes do NLTK (executado no build, fora do caminho das requisições)
+    
+    Returns:
+        Nomes dos recursos baixados
+    """
+    import nltk
+    if download_dir not in nltk.data.path:
+        nltk.data.path.append(download_dir)
+    # Fix para erro de SSL no download do NLTK (comum em macOS)
+    try:
+        _create_unverified_https_context = ssl._create_unverified_context
+    except AttributeError:
+        pass
+    else:
+        ssl._create_default_https_context = _create_unverified_https_context
+    
+    downloaded = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            print(f"Baixando NLTK {name} em {download_dir}...")
+            os.makedirs(download_dir, exist_ok=True)
+            nltk.download(name, download_dir=download_dir, quiet=True)
+            downloaded.append(name)
+    return downloaded
+
+
+def _compact_rslp_rules(stemmer):
+    """
+    Troca as listas de regras do RSLP por tuplas e frozensets: mesma semântica,
+    menos objetos mutáveis e páginas que continuam compartilhadas entre os
+    workers (copy-on-write) depois do fork
+    """
+    model = getattr(stemmer, '_model', None)
+    if model is None:
+        return
+    stemmer._model = tuple(
+        tuple((suffix, min_size, replacement, frozenset(exceptions))
+              for suffix, min_size, replacement, exceptions in step)
+        for step in model
+    )
+
+
+@lru_cache(maxsize=None)
+def _word_tokenize():
+    _nltk()
+    from nltk.tokenize import word_tokenize
+    return word_tokenize
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _map_chunks(function: Callable[[list], list], jobs: Iterable[list], workers: Optional[int]) -> Iterator:
+    """
+    Aplica function a cada lote em um pool de processos, devolvendo os
+    resultados na ordem de entrada. Só workers * 2 lotes ficam em andamento,
+    então entradas grandes (ou geradores) não são carregadas inteiras na memória
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for job in jobs:
+            yield from function(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(function, job))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# Processadores já aquecidos de cada processo do pool (reaproveitados entre lotes)
+_worker_processors: Dict[tuple, Any] = {}
+
+
+def _worker_processor(key: tuple, factory: Callable):
+    processor = _worker_processors.get(key)
+    if processor is None:
+        processor = _worker_processors[key] = factory()
+        processor.warm_up()
+    return processor
+
+
+def _preprocess_chunk(job: tuple) -> List[str]:
+    language, stem_cache_size, remove_stopwords_flag, apply_stemming_flag, texts = job
+    processor = _worker_processor(
+        ('processor', language, stem_cache_size),
+        lambda: NLPProcessor(language, stem_cache_size)
+    )
+    return [processor.preprocess(text, remove_stopwords_flag, apply_stemming_flag) for text in texts]
+
+
+def _process_all_chunk(job: tuple) -> List[Dict]:
+    languages, default, stem_cache_size, texts = job
+    registry = _worker_processor(
+        ('registry', languages, default, stem_cache_size),
+        lambda: NLPRegistry(languages, default, stem_cache_size=stem_cache_size)
+    )
+    return [registry.process_all(text) for text in texts]
+
+# Expressões regulares pré-compiladas usadas na limpeza do texto
+_URL_RE = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+_EMAIL_RE = re.compile(r'\S+@\S+')
+# Caracteres especiais e espaços consecutivos viram um único espaço
+_SEPARATOR_RE = re.compile(r'(?:[^\w\s\.\,\!\?\;\:]|\s)+')
 
 class NLPProcessor:
     """
     Classe responsável pelo processamento de linguagem natural
     """
     
-    def __init__(self, language: str = 'portuguese'):
+    def __init__(self, language: str = 'portuguese', stem_cache_size: int = 10000,
+                 timer: Optional[Callable[[str], ContextManager]] = None):
         self.language = language
-        self.stop_words = set()
-        self._load_stopwords()
-        self.stemmer = RSLPStemmer()
+        # Mede as etapas de process_all: timer(nome_da_etapa) deve devolver um context manager
+        self._timer = timer or (lambda stage: nullcontext())
+        # Stopwords e stemmer são carregados na primeira utilização (ou em warm_up)
+        self._stop_words = None
+        self.stemmer = None
+        # Cache LRU de stems: o vocabulário de emails segue a lei de Zipf,
+        # então as mesmas palavras são reduzidas repetidamente
+        self.stem_cache_size = stem_cache_size
+        self._stem_fn = None
+        self._load_lock = threading.Lock()
+    
+    def _ensure_loaded(self):
+        """Carrega stopwords e stemmer uma única vez, de forma segura entre threads"""
+        if self._stem_fn is not None:
+            return
+        with self._load_lock:
+            if self._stem_fn is not None:
+                return
+            _nltk()
+            self._stop_words = frozenset(self._load_stopwords())
+            # RSLP para português; Snowball (sem dados a baixar) para os demais idiomas
+            if self.language == 'portuguese':
+                from nltk.stem import RSLPStemmer
+                self.stemmer = RSLPStemmer()
+                _compact_rslp_rules(self.stemmer)
+            else:
+                from nltk.stem import SnowballStemmer
+                self.stemmer = SnowballStemmer(self.language)
+            self._stem_fn = lru_cache(maxsize=self.stem_cache_size)(self.stemmer.stem)
     
-    def _load_stopwords(self):
+    @property
+    def stop_words(self) -> frozenset:
+        self._ensure_loaded()
+        return self._stop_words
+    
+    @property
+    def _stem(self):
+        self._ensure_loaded()
+        return self._stem_fn
+    
+    def warm_up(self):
+        """
+        Carrega explicitamente os recursos do NLTK (stopwords, stemmer e o
+        tokenizador punkt), por exemplo antes de aceitar requisições
+        """
+        self._ensure_loaded()
+        _word_tokenize()('aquecimento do tokenizador', language=self.language)
+    
+    def _load_stopwords(self) -> set:
         """Carrega stopwords para o idioma especificado"""
         try:
-            self.stop_words = set(stopwords.words(self.language))
+            from nltk.corpus import stopwords
+            return set(stopwords.words(self.language))
         except:
             # Se não houver stopwords para o idioma, usar lista básica
-            self.stop_words = {
+            codes = {name: code for code, name in LANGUAGE_NAMES.items()}
+            if self.language != 'portuguese' and self.language in codes:
+                return set(STOPWORDS[codes[self.language]])
+            return {
                 'a', 'o', 'e', 'do', 'da', 'em', 'um', 'uma', 'com', 'no', 'na',
                 'por', 'os', 'as', 'dos', 'das', 'ou', 'para', 'é', 'são', 'foi',
                 'era', 'eram', 'este', 'esta', 'estes', 'estas', 'de', 'que'
             }
     
+    def stem_cache_info(self) -> Dict:
+        """
+        Retorna estatísticas do cache de stems
+        
+        Returns:
+            Dicionário com hits, misses, tamanho máximo e tamanho atual
+        """
+        info = self._stem.cache_info()
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "maxsize": info.maxsize,
+            "currsize": info.currsize
+        }
+    
+    def clear_stem_cache(self):
+        """Esvazia o cache de stems e zera os contadores"""
+        self._stem.cache_clear()
+    
+    def warm_stem_cache(self, path: str, limit: Optional[int] = None) -> int:
+        """
+        Pré-aquece o cache de stems a partir de um arquivo de frequência de palavras
+        
+        O arquivo deve ter uma palavra por linha, opcionalmente seguida da sua
+        contagem (separada por espaço ou tab), em ordem decrescente de frequência.
+        Cada palavra passa por clean_text antes do stemming, para que a chave do
+        cache seja a mesma do token que process_all vai gerar (sem acentos).
+        
+        Args:
+            path: Caminho do arquivo de frequências
+            limit: Número máximo de palavras carregadas (padrão: tamanho do cache)
+            
+        Returns:
+            Quantidade de palavras carregadas no cache
+        """
+        if limit is None:
+            limit = self.stem_cache_size
+        
+        loaded = 0
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if limit is not None and loaded >= limit:
+                    break
+                parts = line.split()
+                tokens = self.clean_text(parts[0]).split() if parts else []
+                if not tokens:
+                    continue
+                for token in tokens:
+                    self._stem(token)
+                loaded += 1
+        return loaded
+    
     def clean_text(self, text: str) -> str:
         """
         Limpa o texto removendo caracteres especiais e normalizando
@@ -88,16 +314,13 @@ class NLPProcessor:
         text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
         
         # Remover URLs
-        text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+        text = _URL_RE.sub('', text)
         
         # Remover emails
-        text = re.sub(r'\S+@\S+', '', text)
+        text = _EMAIL_RE.sub('', text)
         
-        # Remover caracteres especiais mas manter pontuação básica
-        text = re.sub(r'[^\w\s\.\,\!\?\;\:]', ' ', text)
-        
-        # Remover espaços extras
-        text = re.sub(r'\s+', ' ', text).strip()
+        # Remover caracteres especiais (mantendo pontuação básica) e espaços extras
+        text = _SEPARATOR_RE.sub(' ', text).strip()
         
         return text
     
@@ -111,7 +334,7 @@ class NLPProcessor:
         Returns:
             Texto sem stopwords
         """
-        tokens = word_tokenize(text, language=self.language)
+        tokens = _word_tokenize()(text, language=self.language)
         filtered_tokens = [token for token in tokens if token.lower() not in self.stop_words]
         return ' '.join(filtered_tokens)
     
@@ -125,10 +348,44 @@ class NLPProcessor:
         Returns:
             Texto com stemming aplicado
         """
-        tokens = word_tokenize(text, language=self.language)
-        stemmed_tokens = [self.stemmer.stem(token) for token in tokens]
+        tokens = _word_tokenize()(text, language=self.language)
+        stemmed_tokens = [self._stem(token) for token in tokens]
         return ' '.join(stemmed_tokens)
     
+    def process_all(self, text: str) -> Dict:
+        """
+        Executa o pipeline completo (limpeza, stopwords e stemming) em uma
+        única passada, tokenizando o texto apenas uma vez.
+        
+        Produz os mesmos campos que a sequência clean_text ->
+        remove_stopwords -> apply_stemming.
+        
+        Args:
+            text: Texto a ser processado
+            
+        Returns:
+            Dicionário com cleaned_text, text_no_stopwords, stemmed_text e stems
+        """
+        timer = self._timer
+        with timer('nlp.clean'):
+            cleaned_text = self.clean_text(text)
+        
+        with timer('nlp.stopwords'):
+            tokens = _word_tokenize()(cleaned_text, language=self.language)
+            stop_words = self.stop_words
+            filtered_tokens = [token for token in tokens if token.lower() not in stop_words]
+        
+        with timer('nlp.stemming'):
+            stem = self._stem
+            stemmed_text = ' '.join([stem(token) for token in filtered_tokens])
+        
+        return {
+            "cleaned_text": cleaned_text,
+            "text_no_stopwords": ' '.join(filtered_tokens),
+            "stemmed_text": stemmed_text,
+            "stems": stemmed_text.split()
+        }
+    
     def preprocess(self, text: str, remove_stopwords_flag: bool = True, apply_stemming_flag: bool = True) -> str:
         """
         Processamento completo do texto
@@ -152,4 +409,115 @@ class NLPProcessor:
         if apply_stemming_flag:
             text = self.apply_stemming(text)
             
-        return text
\ No newline at end of file
+        return text
+    
+    def preprocess_many(self, texts: Iterable[str], workers: Optional[int] = None, chunk_size: int = 256,
+                        remove_stopwords_flag: bool = True, apply_stemming_flag: bool = True) -> Iterator[str]:
+        """
+        preprocess em lote para importações grandes: os textos são divididos em
+        lotes e distribuídos em um pool de processos, cada um com seu próprio
+        processador já aquecido
+        
+        Args:
+            texts: Textos (lista ou gerador)
+            workers: Número de processos (padrão: número de CPUs; 1 processa aqui mesmo)
+            chunk_size: Textos por lote enviado a um processo
+            remove_stopwords_flag: Se deve remover stopwords
+            apply_stemming_flag: Se deve aplicar stemming
+            
+        Returns:
+            Gerador com os textos processados, na mesma ordem da entrada
+        """
+        jobs = ((self.language, self.stem_cache_size, remove_stopwords_flag, apply_stemming_flag, chunk)
+                for chunk in _chunks(texts, chunk_size))
+        return _map_chunks(_preprocess_chunk, jobs, workers)
+
+class NLPRegistry:
+    """
+    Um NLPProcessor por idioma, criado na primeira vez em que o idioma aparece
+    e reaproveitado entre requisições. process_all detecta o idioma de cada
+    email e usa o pipeline correspondente
+    
+    Args:
+        languages: Códigos de idioma suportados (ex.: config.SUPPORTED_LANGUAGES)
+        default: Idioma usado quando a detecção não é conclusiva
+        **processor_kwargs: Repassados a cada NLPProcessor (stem_cache_size, timer)
+    """
+    
+    def __init__(self, languages: Iterable[str] = ('pt', 'en', 'es'), default: str = 'pt', **processor_kwargs):
+        self.languages = tuple(code for code in languages if code in LANGUAGE_NAMES)
+        if default not in self.languages:
+            raise ValueError(f"Idioma padrão não suportado: {default}")
+        self.default = default
+        self._processor_kwargs = processor_kwargs
+        self._processors: Dict[str, NLPProcessor] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, language: str) -> NLPProcessor:
+        """Processador do idioma (código pt/en/es), criado uma única vez"""
+        processor = self._processors.get(language)
+        if processor is not None:
+            return processor
+        if language not in self.languages:
+            raise ValueError(f"Idioma não suportado: {language}")
+        with self._lock:
+            if language not in self._processors:
+                self._processors[language] = NLPProcessor(LANGUAGE_NAMES[language], **self._processor_kwargs)
+            return self._processors[language]
+    
+    def detect(self, text: str) -> str:
+        return detect_language(text, self.default, self.languages)
+    
+    def process_all(self, text: str, language: Optional[str] = None) -> Dict:
+        """
+        Pipeline completo no idioma do email
+        
+        Args:
+            text: Texto a ser processado
+            language: Força o idioma (senão é detectado)
+            
+        Returns:
+            Campos de NLPProcessor.process_all mais language
+        """
+        language = language or self.detect(text)
+        result = self.get(language).process_all(text)
+        result["language"] = language
+        return result
+    
+    def process_many(self, texts: Iterable[str], workers: Optional[int] = None,
+                     chunk_size: int = 256) -> Iterator[Dict]:
+        """
+        process_all em lote, com detecção de idioma, em um pool de processos
+        (ver NLPProcessor.preprocess_many)
+        
+        Returns:
+            Gerador com os resultados de process_all, na mesma ordem da entrada
+        """
+        stem_cache_size = self._processor_kwargs.get('stem_cache_size', 10000)
+        jobs = ((self.languages, self.default, stem_cache_size, chunk) for chunk in _chunks(texts, chunk_size))
+        return _map_chunks(_process_all_chunk, jobs, workers)
+    
+    def warm_up(self):
+        """Carrega os processadores de todos os idiomas (ex.: antes do fork dos workers)"""
+        for language in self.languages:
+            self.get(language).warm_up()
+    
+    def warm_stem_cache(self, path: str, limit: Optional[int] = None) -> int:
+        """
+        Pré-aquece os caches de stems (ver NLPProcessor.warm_stem_cache)
+        
+        Com o marcador {lang} no caminho (ex.: freq_{lang}.txt), cada idioma é
+        aquecido com a sua própria lista e idiomas sem arquivo são ignorados.
+        Sem o marcador, a lista é de um idioma só e aquece apenas o idioma padrão.
+        
+        Returns:
+            Total de palavras carregadas
+        """
+        if '{lang}' not in path:
+            return self.get(self.default).warm_stem_cache(path, limit)
+        loaded = 0
+        for language in self.languages:
+            language_path = path.replace('{lang}', language)
+            if os.path.exists(language_path):
+                loaded += self.get(language).warm_stem_cache(language_path, limit)
+        return loaded
@@ -0,0 +1,156 @@
+"""
+Extração de texto de PDFs em streaming
+Uploads grandes vão para um arquivo temporário e as páginas são extraídas em
+paralelo (pool de processos), sempre entregues em ordem
+"""
+
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Tuple, Union
+
+import PyPDF2
+
+# Uploads até este tamanho ficam em memória e são extraídos sem pool de processos
+SPOOL_MAX_MEMORY = int(os.getenv("PDF_SPOOL_MAX_MEMORY", 1024 * 1024))
+# Só vale a pena distribuir entre processos a partir deste número de páginas
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 8))
+# Páginas extraídas por tarefa enviada ao pool
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 4))
+# Processos do pool de extração
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+
+_CHUNK_SIZE = 64 * 1024
+_executor = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Criado sob demanda (depois do fork dos workers do gunicorn)
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _executor
+
+
+def reset_executor():
+    """Descarta o pool herdado do processo pai (os processos dele não pertencem a este worker)"""
+    global _executor
+    _executor = None
+
+
+def spool_upload(stream, spool_dir: Optional[str] = None,
+                 max_memory: int = SPOOL_MAX_MEMORY) -> Union[bytes, str]:
+    """
+    Lê o upload em blocos. Arquivos pequenos ficam em memória; os grandes são
+    gravados em um arquivo temporário
+
+    Returns:
+        Os bytes do arquivo ou o caminho do arquivo temporário
+    """
+    buffer = io.BytesIO()
+    while buffer.tell() <= max_memory:
+        chunk = stream.read(_CHUNK_SIZE)
+        if not chunk:
+            return buffer.getvalue()
+        buffer.write(chunk)
+
+    if spool_dir:
+        os.makedirs(spool_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=spool_dir)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            spool.write(buffer.getvalue())
+            shutil.copyfileobj(stream, spool, _CHUNK_SIZE)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def discard_spool(source: Union[bytes, str]):
+    """Remove o arquivo temporário criado por spool_upload (se houver); pode ser chamada mais de uma vez"""
+    if isinstance(source, str):
+        try:
+            os.remove(source)
+        except FileNotFoundError:
+            pass
+
+
+def _open_reader(source: Union[bytes, str]) -> PyPDF2.PdfReader:
+    if isinstance(source, str):
+        return PyPDF2.PdfReader(source)
+    return PyPDF2.PdfReader(io.BytesIO(source))
+
+
+def _extract_range(path: str, start: int, end: int):
+    # Executado nos processos do pool: cada um abre o próprio leitor
+    reader = PyPDF2.PdfReader(path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+def _iter_page_texts(source: Union[bytes, str], reader: PyPDF2.PdfReader,
+                     page_count: int) -> Iterator[str]:
+    if not isinstance(source, str) or page_count < PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        for i in range(page_count):
+            yield reader.pages[i].extract_text()
+        return
+
+    executor = _get_executor()
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PAGES_PER_TASK)]
+    # Limita as tarefas em andamento para permitir parada antecipada
+    max_in_flight = PDF_WORKERS * 2
+    pending = []
+    next_range = 0
+    try:
+        while pending or next_range < len(ranges):
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, end = ranges[next_range]
+                pending.append(executor.submit(_extract_range, source, start, end))
+                next_range += 1
+            for text in pending.pop(0).result():
+                yield text
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_pdf_pages(source: Union[bytes, str], max_pages: Optional[int] = None,
+                   max_chars: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Gera o texto de cada página, em ordem, parando ao atingir max_pages ou max_chars
+
+    Args:
+        source: Bytes do PDF ou caminho do arquivo
+        max_pages: Número máximo de páginas extraídas
+        max_chars: Número máximo de caracteres no total
+
+    Yields:
+        Tuplas (número da página começando em 1, texto da página)
+    """
+    reader = _open_reader(source)
+    page_count = len(reader.pages)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+
+    total_chars = 0
+    page_texts = _iter_page_texts(source, reader, page_count)
+    try:
+        for number, text in enumerate(page_texts, 1):
+            page_text = text + "\n"
+            if max_chars is not None and total_chars + len(page_text) >= max_chars:
+                yield number, page_text[:max_chars - total_chars]
+                return
+            total_chars += len(page_text)
+            yield number, page_text
+    finally:
+        # Cancela as páginas ainda pendentes no pool
+        page_texts.close()
+
+
+def extract_pdf_text(source: Union[bytes, str], max_pages: Optional[int] = None,
+                     max_chars: Optional[int] = None) -> str:
+    """Extrai o texto completo do PDF montando o resultado com um único join"""
+    return "".join(text for _, text in iter_pdf_pages(source, max_pages, max_chars))
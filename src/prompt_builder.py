@@ -0,0 +1,125 @@
+"""
+Montagem do texto do email enviado ao Gemini dentro de um orçamento de tokens
+Remove histórico citado, assinaturas e rodapés, corta corpos longos em janelas
+de início e fim e escolhe quais visões do texto (original/processado) enviar
+"""
+
+import math
+import re
+from typing import Dict
+
+# Aproximação usada pelo Gemini para textos em línguas latinas
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "\n[...]\n"
+
+VIEW_MODES = ("original", "processed", "both", "auto")
+
+# Início do histórico de respostas: tudo a partir daqui é descartado
+_REPLY_HEADER_RE = re.compile(
+    r"^(?:"
+    r"(?:Em|On)\s[^\n]*(?:\n[^\n]*)?\s(?:escreveu|wrote)\s*:\s*$"
+    r"|-{2,}\s*(?:Original Message|Mensagem original)\s*-{2,}\s*$"
+    r"|(?:De|From):\s[^\n]*\n(?:Enviad[ao](?: em)?|Sent|Data|Date):"
+    r")",
+    re.IGNORECASE | re.MULTILINE
+)
+# Delimitador padrão de assinatura ("-- ")
+_SIGNATURE_RE = re.compile(r"^--\s*$", re.MULTILINE)
+_MOBILE_FOOTER_RE = re.compile(r"^\s*(?:Enviado do meu|Sent from my|Obter o Outlook para)\b.*$",
+                               re.IGNORECASE | re.MULTILINE)
+# Rodapés de listas e avisos legais: só cortados na segunda metade do email
+_FOOTER_RE = re.compile(
+    r"^.*(?:unsubscribe|descadastr|cancelar (?:a )?inscri[çc][ãa]o|cancele sua inscri"
+    r"|esta mensagem (?:pode conter|[ée] confidencial)|this (?:e-?mail|message) (?:may contain|is confidential)"
+    r"|aviso de confidencialidade|confidentiality notice).*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa de tokens sem chamar a API (cerca de 4 caracteres por token)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def strip_email_noise(text: str) -> str:
+    """
+    Remove histórico citado, assinatura, rodapés de celular, de listas e avisos
+    legais. Se nada sobrar, devolve o texto original
+    """
+    cleaned = text
+    match = _REPLY_HEADER_RE.search(cleaned)
+    if match:
+        cleaned = cleaned[:match.start()]
+    cleaned = _QUOTED_LINE_RE.sub("", cleaned)
+    match = _SIGNATURE_RE.search(cleaned)
+    if match:
+        cleaned = cleaned[:match.start()]
+    cleaned = _MOBILE_FOOTER_RE.sub("", cleaned)
+    for match in _FOOTER_RE.finditer(cleaned):
+        if match.start() > len(cleaned) / 2:
+            cleaned = cleaned[:match.start()]
+            break
+    cleaned = _BLANK_LINES_RE.sub("\n\n", cleaned).strip()
+    return cleaned or text.strip()
+
+
+def truncate_to_budget(text: str, max_tokens: int, head_ratio: float = 0.7) -> str:
+    """Mantém o início e o fim do texto (onde ficam o pedido e o fechamento) dentro do orçamento"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    available = max(max_chars - len(TRUNCATION_MARKER), 0)
+    head_chars = int(available * head_ratio)
+    tail_chars = available - head_chars
+    head = text[:head_chars]
+    # Evita cortar palavras ao meio
+    if " " in head[head_chars // 2:]:
+        head = head[:head.rindex(" ")]
+    tail = text[len(text) - tail_chars:] if tail_chars else ""
+    if " " in tail[:tail_chars // 2]:
+        tail = tail[tail.index(" ") + 1:]
+    return head + TRUNCATION_MARKER + tail
+
+
+class PromptBuilder:
+    """
+    Args:
+        max_tokens: Orçamento de tokens para o texto do email (fora as instruções)
+        views: 'original', 'processed', 'both' ou 'auto' (as duas visões se
+            couberem no orçamento, senão apenas a original)
+    """
+
+    def __init__(self, max_tokens: int = 2000, views: str = "original"):
+        if views not in VIEW_MODES:
+            raise ValueError(f"Modo de visão inválido: {views} (use {', '.join(VIEW_MODES)})")
+        self.max_tokens = max_tokens
+        self.views = views
+
+    @property
+    def fingerprint(self) -> str:
+        """Configuração que muda o texto enviado ao modelo (entra na chave do cache de resultados)"""
+        return f"views={self.views};max_tokens={self.max_tokens}"
+
+    def build_views(self, processed_text: str, original_text: str) -> Dict[str, str]:
+        """
+        Returns:
+            Dicionário com as visões incluídas ('original' e/ou 'processed'), já
+            limpas e cortadas para o orçamento
+        """
+        original = strip_email_noise(original_text)
+        if self.views == "original":
+            return {"original": truncate_to_budget(original, self.max_tokens)}
+        if self.views == "processed":
+            return {"processed": truncate_to_budget(processed_text, self.max_tokens)}
+        if self.views == "auto":
+            if estimate_tokens(original) + estimate_tokens(processed_text) <= self.max_tokens:
+                return {"original": original, "processed": processed_text}
+            return {"original": truncate_to_budget(original, self.max_tokens)}
+        # Duas visões: dois terços do orçamento para o texto original
+        original_budget = self.max_tokens * 2 // 3
+        return {
+            "original": truncate_to_budget(original, original_budget),
+            "processed": truncate_to_budget(processed_text, self.max_tokens - original_budget)
+        }
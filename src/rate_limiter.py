@@ -0,0 +1,162 @@
+"""
+Limite de chamadas ao Gemini com token buckets: um por usuário (email_user) e
+um global, para que um único usuário não esgote a cota compartilhada
+
+Pedidos acima do limite esperam na fila se a espera for curta (até max_wait);
+caso contrário são recusados com RateLimitExceeded, que traz o tempo sugerido
+para o Retry-After. Os buckets são por processo (cada worker tem os seus).
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+class RateLimitExceeded(Exception):
+    """
+    Args:
+        retry_after: Segundos até haver capacidade para o pedido
+        scope: 'user' ou 'global' (qual limite foi atingido)
+        user: Usuário do pedido recusado
+    """
+
+    def __init__(self, retry_after: float, scope: str, user: Optional[str] = None):
+        self.retry_after = retry_after
+        self.scope = scope
+        self.user = user
+        limit = "do usuário" if scope == "user" else "global"
+        super().__init__(f"Limite {limit} de chamadas ao Gemini atingido; tente novamente em "
+                         f"{self.retry_after_seconds}s")
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Valor inteiro para o cabeçalho Retry-After"""
+        return max(1, math.ceil(self.retry_after))
+
+
+class TokenBucket:
+    """
+    Bucket com reserva: o saldo pode ficar negativo, e cada pedido aceito
+    espera o tempo necessário para o saldo voltar a zero (fila em ordem de chegada)
+
+    Args:
+        rate: Fichas repostas por segundo
+        capacity: Rajada máxima (saldo máximo de fichas)
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost: float = 1) -> float:
+        """Espera necessária para o pedido se ele fosse reservado agora"""
+        self._refill()
+        return max(0.0, (cost - self._tokens) / self.rate)
+
+    def take(self, cost: float = 1):
+        self._refill()
+        self._tokens -= cost
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    Args:
+        user_rate: Chamadas por minuto de cada usuário (0 desativa)
+        user_burst: Rajada máxima por usuário
+        global_rate: Chamadas por minuto somando todos os usuários (0 desativa)
+        global_burst: Rajada máxima global
+        max_wait: Espera máxima na fila (s) antes de recusar o pedido
+        max_users: Buckets de usuários mantidos (os cheios e mais antigos são descartados)
+    """
+
+    def __init__(self, user_rate: float = 30, user_burst: float = 10, global_rate: float = 300,
+                 global_burst: float = 50, max_wait: float = 3.0, max_users: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self.max_users = max_users
+        self._clock = clock
+        self._global = TokenBucket(global_rate / 60, global_burst, clock) if global_rate > 0 else None
+        self._users: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        return cls(
+            user_rate=float(os.getenv('GEMINI_RATE_PER_USER', 30)),
+            user_burst=float(os.getenv('GEMINI_BURST_PER_USER', 10)),
+            global_rate=float(os.getenv('GEMINI_RATE_GLOBAL', 300)),
+            global_burst=float(os.getenv('GEMINI_BURST_GLOBAL', 50)),
+            max_wait=float(os.getenv('GEMINI_RATE_MAX_WAIT', 3))
+        )
+
+    def _user_bucket(self, user: Optional[str]) -> Optional[TokenBucket]:
+        if self.user_rate <= 0 or not user:
+            return None
+        bucket = self._users.get(user)
+        if bucket is None:
+            bucket = self._users[user] = TokenBucket(self.user_rate / 60, self.user_burst, self._clock)
+            # Descarta buckets antigos só quando estão cheios (não perdem nenhuma reserva)
+            while len(self._users) > self.max_users:
+                oldest, oldest_bucket = next(iter(self._users.items()))
+                if not oldest_bucket.full:
+                    break
+                del self._users[oldest]
+        else:
+            self._users.move_to_end(user)
+        return bucket
+
+    def reserve(self, user: Optional[str] = None, cost: float = 1) -> float:
+        """
+        Reserva fichas nos buckets do usuário e global
+
+        Returns:
+            Segundos que o chamador deve esperar antes da chamada
+
+        Raises:
+            RateLimitExceeded: Se a espera passar de max_wait (nada é reservado)
+        """
+        with self._lock:
+            user_bucket = self._user_bucket(user)
+            wait = 0.0
+            for scope, bucket in (("user", user_bucket), ("global", self._global)):
+                if bucket is None:
+                    continue
+                bucket_wait = bucket.wait_time(cost)
+                if bucket_wait > self.max_wait:
+                    raise RateLimitExceeded(bucket_wait, scope, user)
+                wait = max(wait, bucket_wait)
+            for bucket in (user_bucket, self._global):
+                if bucket is not None:
+                    bucket.take(cost)
+            return wait
+
+    def acquire(self, user: Optional[str] = None, cost: float = 1):
+        """Reserva e espera na fila (bloqueando a thread) até a vez do pedido"""
+        wait = self.reserve(user, cost)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, user: Optional[str] = None, cost: float = 1):
+        """Versão assíncrona de acquire (espera sem bloquear o event loop)"""
+        wait = self.reserve(user, cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,161 @@
+"""
+Cache de resultados das análises do Gemini, endereçado pelo conteúdo do email
+Backends: memória (por processo) e SQLite (arquivo compartilhado entre workers)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from sqlite_local import LocalConnections
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _normalize(text: Optional[str]) -> str:
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def make_cache_key(processed_text: str, original_text: str, models: List[str], prompt_config: str = '') -> str:
+    """
+    Gera a chave do cache a partir do texto normalizado, da lista de modelos e
+    da configuração do prompt
+
+    Args:
+        processed_text: Texto processado (stemmed_text)
+        original_text: Texto original do email
+        models: Lista de modelos em ordem de preferência
+        prompt_config: Identificação das visões e do orçamento de tokens do prompt
+            (PromptBuilder.fingerprint), para não reaproveitar análises feitas
+            com outro prompt
+
+    Returns:
+        Hash SHA-256 em hexadecimal
+    """
+    digest = hashlib.sha256()
+    for part in (_normalize(processed_text), _normalize(original_text), ','.join(models), prompt_config):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class MemoryResultCache:
+    """
+    Cache LRU em memória com expiração por TTL
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(value)
+
+    def set(self, key: str, value: Dict):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteResultCache:
+    """
+    Cache persistido em um arquivo SQLite, compartilhado entre os workers do gunicorn
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._connection = LocalConnections(path)
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at)")
+        conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Dict):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        # Remove expirados e, se necessário, os registros mais antigos
+        conn.execute("DELETE FROM results WHERE expires_at < ?", (now,))
+        conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM results")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+def create_result_cache(backend: Optional[str] = None):
+    """
+    Cria o cache de resultados a partir das variáveis de ambiente
+
+    GEMINI_CACHE_BACKEND: 'memory' (padrão), 'sqlite' ou 'none'
+    GEMINI_CACHE_TTL: Tempo de vida das entradas em segundos
+    GEMINI_CACHE_MAX_ENTRIES: Número máximo de entradas
+    GEMINI_CACHE_PATH: Arquivo do backend SQLite
+
+    Returns:
+        Instância do cache ou None se desabilitado
+    """
+    backend = (backend or os.getenv('GEMINI_CACHE_BACKEND', 'memory')).lower()
+    ttl = float(os.getenv('GEMINI_CACHE_TTL', 3600))
+    max_entries = int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', 1000))
+
+    if backend == 'none':
+        return None
+    if backend == 'sqlite':
+        path = os.getenv('GEMINI_CACHE_PATH', os.path.join('data', 'gemini_cache.sqlite3'))
+        return SQLiteResultCache(path, ttl=ttl, max_entries=max_entries)
+    return MemoryResultCache(ttl=ttl, max_entries=max_entries)
@@ -0,0 +1,89 @@
+"""
+Coalescência de chamadas concorrentes idênticas (single-flight)
+Enquanto uma chamada com a mesma chave está em andamento, as seguintes esperam
+por ela e recebem o mesmo resultado (ou a mesma exceção), em vez de repetir a
+chamada ao serviço externo
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Versão para threads (rotas do Flask)"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            Tupla (resultado, shared): shared é True quando o resultado veio da
+            chamada de outra thread
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Versão para o event loop (modo ASGI): a chamada roda em uma task própria,
+    então o cancelamento de quem a iniciou (ex.: cliente desconectado) não
+    cancela a chamada para os demais que esperam por ela
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Evita o aviso de exceção não lida quando ninguém mais esperava
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Igual a SingleFlight.do, com uma corrotina no lugar da função"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = self._calls[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # shield: o cancelamento de quem espera não cancela a chamada compartilhada
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        return len(self._calls)
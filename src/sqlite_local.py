@@ -0,0 +1,41 @@
+"""
+Conexões SQLite dos arquivos locais (cache de resultados, checkpoints IMAP,
+índice de quase-duplicatas)
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+
+class LocalConnections:
+    """
+    Uma conexão por thread e por processo para um arquivo SQLite (conexões
+    não sobrevivem ao fork dos workers). Chamar a instância devolve a conexão
+    da thread atual, em autocommit e com WAL
+
+    Args:
+        path: Arquivo SQLite (o diretório é criado se não existir)
+        synchronous: Valor do PRAGMA synchronous, ou None para manter o padrão (FULL)
+    """
+
+    def __init__(self, path: str, synchronous: Optional[str] = "NORMAL"):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if self.synchronous:
+                conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -1,60 +1,410 @@
 import os
-from supabase import create_client, Client
+import atexit
+import base64
+import json
+import threading
+import time
+import metrics
+from write_behind import WriteBehindQueue, journal_has_pending
+
+# Colunas que podem ser pedidas em /api/history?fields=...
+HISTORY_COLUMNS = {
+    "id", "created_at", "subject", "sender", "classification",
+    "suggested_response", "reasoning", "original_text", "analyzed_by", "model_used"
+}
+
+
+# Origem do rótulo (migrations/001_emails_model_used.sql). Em tabelas ainda não
+# migradas a coluna é omitida das gravações em vez de recusar todos os inserts
+LABEL_SOURCE_COLUMN = "model_used"
+
+# Ids por requisição no delete em lote (mantém a URL do filtro in_ curta)
+DELETE_IDS_PER_REQUEST = 200
+
+
+def encode_cursor(row):
+    """Cursor opaco com a posição (created_at, id) do último item da página"""
+    raw = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    return created_at, row_id
+
+
+def journal_path():
+    """Journal SQLite da fila write-behind"""
+    return os.getenv("SUPABASE_JOURNAL_PATH", os.path.join("data", "supabase_journal.sqlite3"))
+
+
+def has_pending_writes():
+    """Se execuções anteriores deixaram análises no journal para reenviar"""
+    return journal_has_pending(journal_path())
+
+
+def is_permanent_error(error):
+    """
+    Erros 4xx do PostgREST que nenhuma nova tentativa resolve: requisição ou
+    schema inválidos (PGRST1xx/PGRST2xx), dados inválidos (22xxx), restrições
+    violadas (23xxx) e colunas ou tabelas inexistentes (42xxx)
+    """
+    code = str(getattr(error, "code", None) or "")
+    return code.startswith(("PGRST1", "PGRST2", "22", "23", "42"))
+
+
+def is_missing_column(error, column):
+    """Erro do PostgREST (PGRST204) ou do Postgres (42703) para uma coluna que não existe"""
+    message = str(getattr(error, "message", None) or error)
+    return getattr(error, "code", None) in ("PGRST204", "42703") and column in message
 
 class SupabaseService:
     def __init__(self):
         url = os.getenv("SUPABASE_URL")
         key = os.getenv("SUPABASE_KEY")
+        self._url, self._key = url, key
+        # Vira False no primeiro insert recusado por falta da coluna model_used
+        self.has_label_source = True
+        # Cliente assíncrono criado sob demanda no event loop do modo ASGI
+        self._async_client = None
         if url and key:
-            self.supabase: Client = create_client(url, key)
+            # Import do cliente (supabase/postgrest/httpx) adiado para fora do import do módulo
+            from supabase import create_client
+            self.supabase = create_client(url, key)
         else:
             self.supabase = None
             print("Supabase credentials not found in environment variables.")
 
+        # Cache curto de páginas do histórico por usuário, invalidado a cada gravação/remoção
+        # (por processo: em vários workers o TTL limita o tempo de dados desatualizados)
+        self.history_cache_ttl = float(os.getenv("HISTORY_CACHE_TTL", 30))
+        self._history_cache = {}
+        self._history_lock = threading.Lock()
+
+        # Fila write-behind: grava o histórico fora do caminho crítico da requisição
+        self.write_queue = None
+        if self.supabase and os.getenv("SUPABASE_WRITE_BEHIND", "true").lower() == "true":
+            self.write_queue = WriteBehindQueue(
+                self._insert_records,
+                journal_path=journal_path(),
+                batch_size=int(os.getenv("SUPABASE_FLUSH_BATCH_SIZE", 50)),
+                flush_interval=float(os.getenv("SUPABASE_FLUSH_INTERVAL", 1.0)),
+                on_flush=self._invalidate_flushed,
+                is_permanent=is_permanent_error,
+                max_journal=int(os.getenv("SUPABASE_JOURNAL_MAX", 10000))
+            )
+            # Reenvia o journal de execuções anteriores já na inicialização
+            self.write_queue.start()
+            atexit.register(self.write_queue.stop)
+
+    def _build_record(self, original_text, analysis_result, user_email):
+        record = {
+            "original_text": original_text,
+            "classification": analysis_result.get("classification"),
+            "suggested_response": analysis_result.get("suggested_response"),
+            "reasoning": analysis_result.get("reasoning"),
+            "subject": analysis_result.get("subject", "No Subject"),
+            "sender": analysis_result.get("sender", "Unknown"),
+            "analyzed_by": user_email
+        }
+        if self.has_label_source:
+            # Origem do rótulo (modelo do Gemini, cache:, local, near_duplicate:): o treino do classificador local a usa
+            record[LABEL_SOURCE_COLUMN] = analysis_result.get("model_used")
+        return record
+
+    def _without_label_source(self, records):
+        if self.has_label_source:
+            self.has_label_source = False
+            print(f"Coluna {LABEL_SOURCE_COLUMN} ausente na tabela emails; gravando sem ela "
+                  f"(aplique migrations/001_emails_model_used.sql)")
+        return [{k: v for k, v in record.items() if k != LABEL_SOURCE_COLUMN} for record in records]
+
+    def _insert(self, records):
+        try:
+            return self.supabase.table("emails").insert(records).execute()
+        except Exception as e:
+            if not is_missing_column(e, LABEL_SOURCE_COLUMN):
+                raise
+            return self.supabase.table("emails").insert(self._without_label_source(records)).execute()
+
+    async def _insert_async(self, client, records):
+        try:
+            return await client.table("emails").insert(records).execute()
+        except Exception as e:
+            if not is_missing_column(e, LABEL_SOURCE_COLUMN):
+                raise
+            return await client.table("emails").insert(self._without_label_source(records)).execute()
+
+    def _invalidate_history(self, user_email=None):
+        with self._history_lock:
+            if user_email is None:
+                self._history_cache.clear()
+            else:
+                self._history_cache.pop(user_email, None)
+
+    def _invalidate_flushed(self, records):
+        for user_email in {record.get("analyzed_by") for record in records}:
+            self._invalidate_history(user_email)
+
+    def _insert_records(self, records):
+        # Usado pela fila write-behind: erros sobem para que o lote seja repetido
+        with metrics.span("supabase.flush"):
+            self._insert(records)
+
+    def enqueue_analysis(self, original_text, analysis_result, user_email):
+        """
+        Agenda a gravação da análise sem bloquear a requisição
+
+        Sem fila configurada, grava de forma síncrona como save_analysis.
+        """
+        if not self.supabase:
+            return None
+        if self.write_queue is None:
+            return self.save_analysis(original_text, analysis_result, user_email)
+        self.write_queue.put(self._build_record(original_text, analysis_result, user_email))
+        return True
+
+    def enqueue_analyses(self, items, user_email):
+        """Versão em lote de enqueue_analysis. items: lista de (original_text, analysis_result)"""
+        if not self.supabase:
+            return None
+        if self.write_queue is None:
+            return self.save_analyses(items, user_email)
+        for original_text, analysis_result in items:
+            self.write_queue.put(self._build_record(original_text, analysis_result, user_email))
+        return True
+
+    def write_queue_stats(self):
+        """Profundidade da fila, do journal e latência dos flushes"""
+        if self.write_queue is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.write_queue.stats()}
+
     def save_analysis(self, original_text, analysis_result, user_email):
         if not self.supabase:
             return None
         
         try:
-            data = {
-                "original_text": original_text,
-                "classification": analysis_result.get("classification"),
-                "suggested_response": analysis_result.get("suggested_response"),
-                "reasoning": analysis_result.get("reasoning"),
-                "subject": analysis_result.get("subject", "No Subject"),
-                "sender": analysis_result.get("sender", "Unknown"),
-                "analyzed_by": user_email
-            }
+            data = self._build_record(original_text, analysis_result, user_email)
             
-            result = self.supabase.table("emails").insert(data).execute()
+            with metrics.span("supabase.save"):
+                result = self._insert([data])
+            self._invalidate_history(user_email)
             return result.data
         except Exception as e:
             print(f"Error saving to Supabase: {e}")
             return None
 
-    def get_history(self, user_email, limit=10):
+    async def _get_async_client(self):
+        if self._async_client is None:
+            from supabase import acreate_client
+            self._async_client = await acreate_client(self._url, self._key)
+        return self._async_client
+
+    async def save_analysis_async(self, original_text, analysis_result, user_email):
+        """Versão assíncrona de save_analysis, usada pelo modo ASGI"""
         if not self.supabase:
-            return []
+            return None
+        
+        try:
+            client = await self._get_async_client()
+            data = self._build_record(original_text, analysis_result, user_email)
+            
+            with metrics.span("supabase.save"):
+                result = await self._insert_async(client, [data])
+            self._invalidate_history(user_email)
+            return result.data
+        except Exception as e:
+            print(f"Error saving to Supabase: {e}")
+            return None
+
+    def save_analyses(self, items, user_email):
+        """Salva várias análises com um único insert. items: lista de (original_text, analysis_result)"""
+        if not self.supabase or not items:
+            return None
         
         try:
-            result = self.supabase.table("emails")\
-                .select("*")\
-                .eq("analyzed_by", user_email)\
-                .order("created_at", desc=True)\
-                .limit(limit)\
-                .execute()
+            data = [self._build_record(original_text, analysis_result, user_email)
+                    for original_text, analysis_result in items]
+            
+            with metrics.span("supabase.save"):
+                result = self._insert(data)
+            self._invalidate_history(user_email)
             return result.data
+        except Exception as e:
+            print(f"Error saving batch to Supabase: {e}")
+            return None
+
+    def iter_labeled_analyses(self, labels, page_size=1000):
+        """
+        Percorre todas as análises com as classificações dadas, em ordem de id
+
+        Returns:
+            Gerador de tuplas (original_text, classification, model_used); model_used
+            é None nas linhas antigas e quando a tabela ainda não tem a coluna
+        """
+        columns = f"original_text,classification,{LABEL_SOURCE_COLUMN}"
+        start = 0
+        while True:
+            try:
+                result = self.supabase.table("emails")\
+                    .select(columns)\
+                    .in_("classification", list(labels))\
+                    .order("id")\
+                    .range(start, start + page_size - 1)\
+                    .execute()
+            except Exception as e:
+                if LABEL_SOURCE_COLUMN not in columns or not is_missing_column(e, LABEL_SOURCE_COLUMN):
+                    raise
+                # Tabela não migrada: todas as linhas são anteriores à coluna
+                columns = "original_text,classification"
+                continue
+            for row in result.data:
+                yield row["original_text"], row["classification"], row.get(LABEL_SOURCE_COLUMN)
+            if len(result.data) < page_size:
+                return
+            start += page_size
+
+    def get_history(self, user_email, limit=10):
+        return self.get_history_page(user_email, limit=limit)["items"]
+
+    def get_history_page(self, user_email, limit=10, cursor=None, fields=None,
+                         classification=None, date_from=None, date_to=None):
+        """
+        Página do histórico com paginação por chave (created_at, id)
+
+        Args:
+            user_email: Usuário dono das análises
+            limit: Itens por página
+            cursor: Cursor opaco devolvido pela página anterior
+            fields: Colunas retornadas (id e created_at são sempre incluídos)
+            classification: Filtra por classificação
+            date_from: Data/hora ISO mínima de created_at
+            date_to: Data/hora ISO máxima de created_at
+
+        Returns:
+            Dicionário com items e next_cursor (None na última página)
+        """
+        empty = {"items": [], "next_cursor": None}
+        if not self.supabase:
+            return empty
+        
+        columns = "*"
+        if fields:
+            selected = [f for f in fields if f in HISTORY_COLUMNS
+                        and (f != LABEL_SOURCE_COLUMN or self.has_label_source)]
+            columns = ",".join(dict.fromkeys(["id", "created_at", *selected]))
+        
+        cache_key = (limit, cursor, columns, classification, date_from, date_to)
+        now = time.monotonic()
+        with self._history_lock:
+            cached = self._history_cache.get(user_email, {}).get(cache_key)
+            if cached and cached[0] > now:
+                return cached[1]
+        
+        try:
+            query = self.supabase.table("emails")\
+                .select(columns)\
+                .eq("analyzed_by", user_email)
+            if classification:
+                query = query.eq("classification", classification)
+            if date_from:
+                query = query.gte("created_at", date_from)
+            if date_to:
+                query = query.lte("created_at", date_to)
+            if cursor:
+                created_at, row_id = decode_cursor(cursor)
+                query = query.or_(
+                    f'created_at.lt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.lt."{row_id}")'
+                )
+            
+            # Um item a mais indica se existe próxima página
+            with metrics.span("supabase.history"):
+                result = query\
+                    .order("created_at", desc=True)\
+                    .order("id", desc=True)\
+                    .limit(limit + 1)\
+                    .execute()
+            
+            items = result.data[:limit]
+            next_cursor = encode_cursor(items[-1]) if len(result.data) > limit else None
+            page = {"items": items, "next_cursor": next_cursor}
         except Exception as e:
             print(f"Error fetching from Supabase: {e}")
-            return []
+            return empty
+        
+        with self._history_lock:
+            user_cache = self._history_cache.setdefault(user_email, {})
+            for key in [k for k, (expires, _) in user_cache.items() if expires <= now]:
+                del user_cache[key]
+            user_cache[cache_key] = (now + self.history_cache_ttl, page)
+        return page
+
+    def _delete_query(self):
+        # Conta as linhas removidas sem devolvê-las (evita trafegar original_text)
+        from postgrest.types import CountMethod, ReturnMethod
+        return self.supabase.table("emails")\
+            .delete(count=CountMethod.exact, returning=ReturnMethod.minimal)
 
     def delete_analysis(self, analysis_id):
+        """
+        Returns:
+            True se a análise foi removida, False se nenhuma linha corresponde
+            ao id e None em caso de erro
+        """
+        if not self.supabase:
+            return None
+        
+        try:
+            result = self._delete_query().eq("id", analysis_id).execute()
+            self._invalidate_history()
+            return bool(result.count)
+        except Exception as e:
+            print(f"Error deleting from Supabase: {e}")
+            return None
+
+    def delete_analyses(self, user_email, ids=None, sender=None, classification=None, older_than=None):
+        """
+        Remove várias análises do usuário com um único delete por lote de ids
+
+        Args:
+            user_email: Usuário dono das análises (analyzed_by)
+            ids: Lista de ids a remover
+            sender: Remove apenas análises deste remetente
+            classification: Remove apenas análises com esta classificação
+            older_than: Data/hora ISO; remove análises criadas antes dela
+
+        Returns:
+            Número de linhas removidas ou None em caso de erro
+        """
         if not self.supabase:
-            return False
+            return None
+        if ids is not None and not ids:
+            return 0
         
         try:
-            self.supabase.table("emails").delete().eq("id", analysis_id).execute()
-            return True
+            def build():
+                query = self._delete_query().eq("analyzed_by", user_email)
+                if sender:
+                    query = query.eq("sender", sender)
+                if classification:
+                    query = query.eq("classification", classification)
+                if older_than:
+                    query = query.lt("created_at", older_than)
+                return query
+            
+            if ids is None:
+                deleted = build().execute().count or 0
+            else:
+                deleted = 0
+                for start in range(0, len(ids), DELETE_IDS_PER_REQUEST):
+                    chunk = ids[start:start + DELETE_IDS_PER_REQUEST]
+                    deleted += build().in_("id", chunk).execute().count or 0
+            
+            self._invalidate_history(user_email)
+            return deleted
         except Exception as e:
             print(f"Error deleting from Supabase: {e}")
-            return False
+            return None
@@ -0,0 +1,50 @@
+"""
+Checkpoints de sincronização incremental IMAP (UIDVALIDITY e último UID por caixa)
+Armazenados em um pequeno arquivo SQLite local
+"""
+
+from sqlite_local import LocalConnections
+
+
+class SyncStateStore:
+    """
+    Guarda, por conta e caixa de email, o UIDVALIDITY e o maior UID já entregue
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Checkpoints com synchronous=FULL: perder o último UID reentregaria emails
+        self._connection = LocalConnections(path, synchronous=None)
+
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS mailbox_state ("
+            "account TEXT NOT NULL, mailbox TEXT NOT NULL, "
+            "uidvalidity INTEGER NOT NULL, last_uid INTEGER NOT NULL, "
+            "PRIMARY KEY (account, mailbox))"
+        )
+
+    def get(self, account, mailbox):
+        """
+        Returns:
+            Tupla (uidvalidity, last_uid) ou None se a caixa nunca foi sincronizada
+        """
+        row = self._connection().execute(
+            "SELECT uidvalidity, last_uid FROM mailbox_state WHERE account = ? AND mailbox = ?",
+            (account, mailbox)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, account, mailbox, uidvalidity, last_uid):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO mailbox_state (account, mailbox, uidvalidity, last_uid) "
+            "VALUES (?, ?, ?, ?)",
+            (account, mailbox, uidvalidity, last_uid)
+        )
+
+    def reset(self, account, mailbox=None):
+        if mailbox is None:
+            self._connection().execute("DELETE FROM mailbox_state WHERE account = ?", (account,))
+        else:
+            self._connection().execute(
+                "DELETE FROM mailbox_state WHERE account = ? AND mailbox = ?", (account, mailbox)
+            )
@@ -0,0 +1,297 @@
+"""
+Fila de gravação em segundo plano (write-behind) para o histórico no Supabase
+Agrupa inserts por tamanho e tempo, tenta novamente com backoff e, se o
+Supabase estiver fora do ar, guarda os registros em um journal SQLite local
+que é reenviado depois (inclusive na inicialização). Registros recusados de
+forma definitiva (ex.: 4xx do PostgREST) vão para a tabela dead_letter do mesmo
+arquivo em vez de voltar ao journal
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def journal_has_pending(journal_path):
+    """Se o journal tem registros a reenviar (sem criar o arquivo nem a fila)"""
+    if not os.path.exists(journal_path):
+        return False
+    try:
+        conn = sqlite3.connect(journal_path, timeout=10)
+        try:
+            return conn.execute("SELECT EXISTS (SELECT 1 FROM pending)").fetchone()[0] == 1
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+class WriteBehindQueue:
+    """
+    Args:
+        flush_fn: Função que grava uma lista de registros (deve lançar exceção em caso de falha)
+        journal_path: Arquivo SQLite usado quando o destino está indisponível
+        batch_size: Registros por insert
+        flush_interval: Tempo máximo (s) que um registro espera na fila
+        max_retries: Tentativas por lote antes de ir para o journal
+        backoff: Espera inicial (s) entre tentativas, dobrada a cada falha
+        on_flush: Callback opcional chamado com os registros gravados
+        is_permanent: Diz se uma exceção de flush_fn nunca vai se resolver com
+            novas tentativas (o lote é regravado registro a registro e os
+            recusados vão para dead_letter)
+        max_journal: Registros mantidos no journal e no dead_letter (os mais
+            antigos são descartados)
+    """
+
+    def __init__(self, flush_fn, journal_path, batch_size=50, flush_interval=1.0,
+                 max_retries=3, backoff=0.5, on_flush=None, is_permanent=None, max_journal=10000):
+        self.flush_fn = flush_fn
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_flush = on_flush
+        self.is_permanent = is_permanent or (lambda error: False)
+        self.max_journal = max_journal
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "flush_batches": 0,
+            "failed_attempts": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "dead_lettered": 0,
+            "dropped": 0,
+            "last_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+
+        directory = os.path.dirname(journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._journal() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letter ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, "
+                "error TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _journal(self, autocommit=False):
+        conn = sqlite3.connect(self.journal_path, timeout=10,
+                               isolation_level=None if autocommit else "")
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+            if not autocommit:
+                conn.commit()
+        finally:
+            conn.close()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def start(self):
+        """Inicia a thread de gravação (uma por processo, seguro após fork)"""
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Processo filho: a fila herdada pertence ao processo pai
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def put(self, record):
+        self.start()
+        self._count("enqueued")
+        self._queue.put(record)
+
+    def _run(self):
+        # Reenvia o que ficou no journal de execuções anteriores
+        self._replay_journal()
+        last_replay = time.monotonic()
+
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            if time.monotonic() - last_replay > max(self.flush_interval, 5):
+                self._replay_journal()
+                last_replay = time.monotonic()
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _try_flush(self, batch):
+        """
+        Returns:
+            Registros não gravados por falhas transitórias (lista vazia se todos
+            foram gravados ou descartados como definitivamente inválidos)
+        """
+        delay = self.backoff
+        for attempt in range(self.max_retries):
+            started = time.perf_counter()
+            try:
+                self.flush_fn(batch)
+            except Exception as e:
+                self._count("failed_attempts")
+                if self.is_permanent(e):
+                    return self._isolate_rejected(batch, e)
+                logger.warning(f"Falha ao gravar lote de {len(batch)} registros (tentativa {attempt + 1}): {e}")
+                if attempt + 1 < self.max_retries:
+                    self._stop.wait(delay)
+                    delay *= 2
+                continue
+
+            elapsed_ms = 1000 * (time.perf_counter() - started)
+            with self._stats_lock:
+                self._stats["flushed"] += len(batch)
+                self._stats["flush_batches"] += 1
+                self._stats["last_flush_ms"] = elapsed_ms
+                self._stats["total_flush_ms"] += elapsed_ms
+            if self.on_flush:
+                self.on_flush(batch)
+            return []
+        return batch
+
+    def _isolate_rejected(self, batch, error):
+        # Um registro inválido recusa o insert inteiro: regrava um a um para salvar os demais
+        if len(batch) == 1:
+            self._dead_letter(batch, error)
+            return []
+        failed = []
+        for record in batch:
+            failed.extend(self._try_flush([record]))
+        return failed
+
+    def _flush(self, batch):
+        failed = self._try_flush(batch)
+        if failed:
+            self._spill(failed)
+
+    def _trim(self, conn, table):
+        # Limita o tamanho do arquivo: descarta os registros mais antigos além de max_journal
+        excess = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.max_journal
+        if excess > 0:
+            conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} ORDER BY id LIMIT ?)", (excess,))
+            self._count("dropped", excess)
+            logger.error(f"{excess} registros antigos descartados de {table} (limite {self.max_journal})")
+
+    def _spill(self, batch):
+        with self._journal() as conn:
+            conn.executemany(
+                "INSERT INTO pending (payload) VALUES (?)",
+                [(json.dumps(record),) for record in batch]
+            )
+            self._trim(conn, "pending")
+        self._count("spilled", len(batch))
+        logger.error(f"{len(batch)} registros gravados no journal local")
+
+    def _dead_letter(self, batch, error):
+        with self._journal() as conn:
+            conn.executemany(
+                "INSERT INTO dead_letter (payload, error, created_at) VALUES (?, ?, ?)",
+                [(json.dumps(record), str(error), time.time()) for record in batch]
+            )
+            self._trim(conn, "dead_letter")
+        self._count("dead_lettered", len(batch))
+        logger.error(f"{len(batch)} registros recusados definitivamente, movidos para dead_letter: {error}")
+
+    def _claim_journal_batch(self):
+        # Retira um lote do journal de forma atômica (vários workers podem compartilhá-lo)
+        with self._journal(autocommit=True) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, payload FROM pending ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    f"DELETE FROM pending WHERE id IN ({','.join('?' * len(rows))})",
+                    [row[0] for row in rows]
+                )
+            conn.execute("COMMIT")
+        return [json.loads(payload) for _, payload in rows]
+
+    def _replay_journal(self):
+        while not self._stop.is_set():
+            batch = self._claim_journal_batch()
+            if not batch:
+                return
+            failed = self._try_flush(batch)
+            if failed:
+                self._spill(failed)
+                return
+            self._count("replayed", len(batch))
+
+    def stop(self, timeout=5):
+        """Grava o que estiver na fila (ou envia ao journal) e encerra a thread"""
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if pending:
+            self._spill(pending)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def journal_depth(self):
+        with self._journal() as conn:
+            return conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def dead_letter_depth(self):
+        with self._journal() as conn:
+            return conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats.pop("flush_batches")
+        total_ms = stats.pop("total_flush_ms")
+        stats["flush_batches"] = batches
+        stats["avg_flush_ms"] = total_ms / batches if batches else 0.0
+        stats["queue_depth"] = self.depth()
+        stats["journal_depth"] = self.journal_depth()
+        stats["dead_letter_depth"] = self.dead_letter_depth()
+        return stats
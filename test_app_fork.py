@@ -0,0 +1,53 @@
+import sys
+sys.path.append('src')
+import app
+import pdf_extractor
+from gemini_service import GeminiService
+from supabase_service import SupabaseService
+
+
+def test_reset_after_fork_rebuilds_per_process_services(monkeypatch, tmp_path):
+    monkeypatch.setenv("GEMINI_API_KEY", "")
+    monkeypatch.setenv("SUPABASE_URL", "")
+    monkeypatch.setenv("SUPABASE_JOURNAL_PATH", str(tmp_path / "journal.sqlite3"))
+    monkeypatch.setattr(app, "_services_lock", app._services_lock)
+    monkeypatch.setattr(pdf_extractor, "_executor", object())
+
+    # Serviços criados no master antes do fork
+    inherited = {name: object() for name in app._PER_PROCESS_SERVICES}
+    inherited["gemini"] = GeminiService()
+    shared = {"nlp": object(), "local_classifier": object()}
+    for name, service in {**inherited, **shared}.items():
+        monkeypatch.setitem(app._services, name, service)
+    lock = app._services_lock
+
+    app.reset_after_fork()
+
+    assert app._services_lock is not lock
+    assert all(name not in app._services for name in app._PER_PROCESS_SERVICES)
+    # Estado somente leitura continua compartilhado por copy-on-write
+    assert app._services["nlp"] is shared["nlp"]
+    assert app._services["local_classifier"] is shared["local_classifier"]
+    assert pdf_extractor._executor is None
+
+    # Recriados no primeiro uso, com cache, limites e coalescência próprios do worker
+    gemini = app.get_gemini()
+    assert isinstance(gemini, GeminiService) and gemini is not inherited["gemini"]
+    assert gemini.cache is not inherited["gemini"].cache
+    assert gemini.flights is not inherited["gemini"].flights
+    assert gemini.rate_limiter is not inherited["gemini"].rate_limiter
+
+
+def test_reset_after_fork_replays_pending_journal(monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "")
+    monkeypatch.setattr(app, "_services_lock", app._services_lock)
+    monkeypatch.setitem(app._services, "supabase", object())
+
+    monkeypatch.setattr(app, "has_pending_writes", lambda: False)
+    app.reset_after_fork()
+    assert "supabase" not in app._services
+
+    # Journal com análises pendentes: o worker cria o serviço para reenviá-las
+    monkeypatch.setattr(app, "has_pending_writes", lambda: True)
+    app.reset_after_fork()
+    assert isinstance(app._services["supabase"], SupabaseService)
@@ -0,0 +1,62 @@
+import io
+import json
+import sys
+import pytest
+sys.path.append('src')
+import app
+import config
+from test_pdf_extractor import make_pdf
+
+
+@pytest.fixture
+def client(app_services):
+    return app.app.test_client()
+
+
+def test_oversized_body_is_rejected(client, monkeypatch):
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 100)
+    response = client.post('/api/process', json={"text": "x" * 200, "email_user": "ana@example.com"})
+    assert response.status_code == 413
+    assert "excede o limite" in response.get_json()["error"]
+
+
+def test_process_truncates_long_text(client, app_services, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_TEXT_LENGTH', 20)
+    response = client.post('/api/process', json={"text": "a" * 15 + " " + "b" * 15,
+                                                 "email_user": "ana@example.com"})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body["truncated"] is True
+    assert body["original_text"] == "a" * 15 + " " + "b" * 4
+    # Gemini e histórico recebem apenas o texto cortado
+    assert app_services["gemini"].texts == [body["original_text"]]
+    assert app_services["supabase"].saved[0][0] == body["original_text"]
+
+    short = client.post('/api/process', json={"text": "Reunião amanhã", "email_user": "ana@example.com"})
+    assert short.get_json()["truncated"] is False
+
+
+def test_process_file_reports_truncation(client, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_TEXT_LENGTH', 30)
+    data = make_pdf(["Pagina 1 do relatorio", "Pagina 2 do relatorio"])
+
+    def upload(query=''):
+        return client.post('/api/process-file' + query, data={"file": (io.BytesIO(data), "relatorio.pdf")},
+                           content_type='multipart/form-data')
+
+    body = upload().get_json()
+    assert body["truncated"] is True
+    assert len(body["text"]) == 30
+
+    lines = [json.loads(line) for line in upload('?stream=true').get_data(as_text=True).splitlines()]
+    assert "".join(line.get("text", "") for line in lines) == body["text"]
+    assert lines[-1] == {"done": True, "pages": 2, "truncated": True}
+
+    # O limite exato do texto não conta como corte
+    monkeypatch.setattr(config, 'MAX_TEXT_LENGTH', 1000)
+    full = upload().get_json()
+    assert full["truncated"] is False
+    monkeypatch.setattr(config, 'MAX_TEXT_LENGTH', len(full["text"]))
+    exact = upload().get_json()
+    assert exact["text"] == full["text"]
+    assert exact["truncated"] is False
@@ -0,0 +1,69 @@
+import json
+import sys
+import pytest
+from starlette.testclient import TestClient
+sys.path.append('src')
+import asgi
+import config
+
+USER = "ana@example.com"
+
+
+@pytest.fixture
+def client(app_services):
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+def test_process_returns_analysis_and_queues_history(client, app_services):
+    response = client.post('/api/process', json={"text": "Reunião amanhã", "email_user": USER})
+    body = response.json()
+    assert response.status_code == 200
+    assert body["gemini_analysis"]["classification"] == "produtivo"
+    assert body["truncated"] is False
+    assert "Server-Timing" in response.headers
+    assert app_services["supabase"].saved == [("Reunião amanhã", {**body["gemini_analysis"],
+                                               "subject": "Manual Input", "sender": "User"}, USER)]
+
+
+def test_process_stream_sends_sse_events(client, app_services):
+    response = client.post('/api/process?stream=true', json={"text": "Reunião amanhã", "email_user": USER})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: classification", "event: token", "event: done"]
+    done = json.loads(events[-1][1][len("data: "):])
+    assert done["gemini_analysis"]["suggested_response"] == "Ok"
+    assert len(app_services["supabase"].saved) == 1
+
+
+def test_invalid_json_is_rejected(client):
+    response = client.post('/api/process', content=b"{nao e json", headers={"content-type": "application/json"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "Invalid JSON"}
+
+
+def test_body_size_limit(client, monkeypatch):
+    monkeypatch.setattr(config, 'MAX_FILE_SIZE', 100)
+    body = json.dumps({"text": "x" * 200, "email_user": USER}).encode()
+
+    declared = client.post('/api/process', content=body)
+    assert declared.status_code == 413
+
+    # Sem Content-Length (chunked): o corpo é cortado durante a leitura
+    streamed = client.post('/api/process', content=iter([body[:80], body[80:]]))
+    assert streamed.status_code == 413
+
+
+def test_invalid_content_length_is_rejected(client):
+    response = client.post('/api/process', content=b'{"text": "oi"}', headers={"content-length": "abc"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "Invalid Content-Length"}
+
+
+def test_flask_routes_are_mounted(client, app_services):
+    health = client.get('/health')
+    assert health.status_code == 200
+
+    batch = client.post('/api/process-batch', json={"emails": [{"text": "Reunião amanhã"}], "email_user": USER})
+    assert batch.status_code == 200
+    assert batch.json()[0]["gemini_analysis"]["model_used"] == "fake"
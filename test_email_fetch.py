@@ -0,0 +1,153 @@
+import sys
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import pytest
+sys.path.append('src')
+from email_service import EmailService
+from imap_pool import IMAPConnectionPool, PoolTimeout
+from sync_state import SyncStateStore
+from fake_imap_server import FakeIMAPServer
+
+
+def make_email(index, attachment_size=0):
+    msg = MIMEMultipart()
+    msg["Subject"] = f"Assunto {index}"
+    msg["From"] = f"remetente{index}@example.com"
+    msg["Date"] = "Mon, 01 Jan 2024 10:00:00 +0000"
+    msg.attach(MIMEText(f"Corpo do email número {index}. Reunião às 14h.", "plain", "utf-8"))
+    if attachment_size:
+        msg.attach(MIMEApplication(b"\0" * attachment_size, Name="anexo.bin"))
+    return msg.as_bytes().replace(b"\n", b"\r\n")
+
+
+def make_service(server, pool=None):
+    srv = EmailService(pool=pool)
+    srv.host, srv.port, srv.use_ssl = server.host, server.port, False
+    srv.user, srv.password = server.user, server.password
+    return srv
+
+
+def test_fetch_uses_single_fetch_command():
+    with FakeIMAPServer([make_email(i) for i in range(1, 6)]) as server:
+        emails = make_service(server).fetch_latest_emails(limit=3)
+
+    assert server.fetch_commands == 1
+    assert [e["id"] for e in emails] == ["5", "4", "3"]
+    assert emails[0]["subject"] == "Assunto 5"
+    assert emails[0]["sender"] == "remetente5@example.com"
+    assert "Corpo do email número 5" in emails[0]["text"]
+
+
+def test_preview_mode_skips_attachments():
+    with FakeIMAPServer([make_email(1, attachment_size=200000)]) as server:
+        full = make_service(server).fetch_latest_emails(limit=1)
+        preview = make_service(server).fetch_latest_emails(limit=1, preview=True, preview_bytes=2048)
+
+    fetch_commands = [c for c in server.commands if c.upper().startswith("FETCH")]
+    assert "RFC822" in fetch_commands[0]
+    assert "BODY.PEEK[TEXT]<0.2048>" in fetch_commands[1]
+    assert preview[0]["subject"] == full[0]["subject"]
+    assert preview[0]["date"] == full[0]["date"]
+    assert preview[0]["text"] == full[0]["text"]
+
+
+def test_pool_reuses_authenticated_session():
+    pool = IMAPConnectionPool(max_per_account=1)
+    with FakeIMAPServer([make_email(1), make_email(2)]) as server:
+        first = make_service(server, pool).fetch_latest_emails(limit=2)
+        second = make_service(server, pool).fetch_latest_emails(limit=2)
+
+        # Senha diferente nunca recebe a sessão já autenticada
+        intruder = make_service(server, pool)
+        intruder.password = "wrong"
+        assert intruder.fetch_latest_emails(limit=2) == []
+
+        logins = [c for c in server.commands if c.upper().startswith("LOGIN")]
+        assert len(logins) == 2
+        assert server.connections == 2
+        assert first == second
+        pool.close_idle()
+
+
+def test_pool_reconnects_dropped_session():
+    pool = IMAPConnectionPool()
+    with FakeIMAPServer([make_email(1)]) as server:
+        srv = make_service(server, pool)
+        assert len(srv.fetch_latest_emails(limit=1)) == 1
+
+        # Derruba a conexão ociosa; a próxima chamada reconecta sozinha
+        for idle in pool._accounts.values():
+            for mail, _ in idle["idle"]:
+                mail.shutdown()
+
+        assert len(srv.fetch_latest_emails(limit=1)) == 1
+        assert server.connections == 2
+        pool.close_idle()
+
+
+def test_pool_sweeps_expired_sessions_of_other_accounts():
+    pool = IMAPConnectionPool(idle_timeout=0, sweep_interval=0)
+    with FakeIMAPServer([make_email(1)]) as server:
+        assert len(make_service(server, pool).fetch_latest_emails(limit=1)) == 1
+        assert len(pool._accounts) == 1
+
+        # Outra conta usa o pool: a sessão expirada da primeira é encerrada e a entrada removida
+        other = make_service(server, pool)
+        other.password = "wrong"
+        assert other.fetch_latest_emails(limit=1) == []
+        assert pool._accounts == {}
+        assert any(c.upper().startswith("LOGOUT") for c in server.commands)
+
+
+def test_pool_timeout_is_not_retried():
+    pool = IMAPConnectionPool(max_per_account=1, acquire_timeout=0.1)
+    acquires = []
+    acquire = pool.acquire
+    pool.acquire = lambda *args: acquires.append(args) or acquire(*args)
+    with FakeIMAPServer([make_email(1)]) as server:
+        srv = make_service(server, pool)
+        key, mail = acquire(srv.host, srv.port, srv.user, srv.password, srv.use_ssl)
+        try:
+            with pytest.raises(PoolTimeout):
+                srv._with_connection(lambda m: m.noop())
+        finally:
+            pool.release(key, mail)
+        assert len(acquires) == 1
+        pool.close_idle()
+
+
+def test_incremental_sync_fetches_only_new_messages(tmp_path):
+    store = SyncStateStore(str(tmp_path / "sync.sqlite3"))
+    with FakeIMAPServer([make_email(i) for i in range(1, 4)]) as server:
+        srv = make_service(server)
+        first = srv.fetch_new_emails(store, limit=10)
+        assert [e["uid"] for e in first] == [3, 2, 1]
+
+        assert srv.fetch_new_emails(store, limit=10) == []
+
+        server.mailbox.append(make_email(4))
+        server.mailbox.append(make_email(5))
+        new = srv.fetch_new_emails(store, limit=10)
+        assert [e["subject"] for e in new] == ["Assunto 5", "Assunto 4"]
+
+        uid_fetches = [c for c in server.commands if c.upper().startswith("UID FETCH")]
+        assert uid_fetches[-1].startswith("UID FETCH 4,5 ")
+
+        # UIDVALIDITY mudou: os checkpoints antigos são descartados
+        server.mailbox.uidvalidity = 2
+        resynced = srv.fetch_new_emails(store, limit=2)
+        assert [e["uid"] for e in resynced] == [5, 4]
+
+
+def test_incremental_sync_pages_through_backlog_larger_than_limit(tmp_path):
+    store = SyncStateStore(str(tmp_path / "sync.sqlite3"))
+    with FakeIMAPServer([make_email(1)]) as server:
+        srv = make_service(server)
+        assert [e["uid"] for e in srv.fetch_new_emails(store, limit=2)] == [1]
+
+        for i in range(2, 7):
+            server.mailbox.append(make_email(i))
+        # Mais emails que o limite entre duas sincronizações: nenhum é pulado
+        polls = [[e["uid"] for e in srv.fetch_new_emails(store, limit=2)] for _ in range(4)]
+        assert polls == [[3, 2], [5, 4], [6], []]
@@ -0,0 +1,56 @@
+import json
+import sys
+import pytest
+sys.path.append('src')
+from rate_limiter import RateLimiter, RateLimitExceeded
+
+
+def batch_reply(malformed=False):
+    def reply(contents):
+        if '"id"' not in contents:
+            return '{"classification": "produtivo", "suggested_response": "Ok", "reasoning": "Individual"}'
+        if malformed:
+            return '{"classification": "produtivo"}'
+        start = contents.index('[{')
+        payload, _ = json.JSONDecoder().raw_decode(contents[start:])
+        return json.dumps([
+            {"id": item["id"], "classification": "improdutivo", "suggested_response": None, "reasoning": "Lote"}
+            for item in payload
+        ])
+    return reply
+
+
+def test_batch_packs_emails_into_chunks(make_gemini):
+    gemini = make_gemini(reply=batch_reply())
+    items = [(f"promoca {i}", f"Promoção número {i}") for i in range(5)]
+
+    # O orçamento conta apenas o texto enviado (visão original): dois emails por chamada
+    results = gemini.analyze_batch(items, max_chars=40, max_items=10)
+
+    assert len(gemini.client.models.prompts) == 3
+    assert [r["reasoning"] for r in results] == ["Lote"] * 5
+    assert all(r["model_used"] == "gemini-2.5-flash" for r in results)
+
+    # Repetir o lote usa o cache e não chama o modelo
+    cached = gemini.analyze_batch(items)
+    assert len(gemini.client.models.prompts) == 3
+    assert cached[0]["model_used"] == "cache:gemini-2.5-flash"
+
+
+def test_malformed_batch_falls_back_to_single_calls(make_gemini):
+    gemini = make_gemini(reply=batch_reply(malformed=True))
+    results = gemini.analyze_batch([("a", "Email A"), ("b", "Email B")])
+
+    assert len(gemini.client.models.prompts) == 3
+    assert [r["reasoning"] for r in results] == ["Individual", "Individual"]
+
+
+def test_single_call_fallback_reuses_chunk_token(make_gemini):
+    gemini = make_gemini(reply=batch_reply(malformed=True))
+    gemini.rate_limiter = RateLimiter(user_rate=1, user_burst=1, global_rate=0, max_wait=0)
+
+    # Uma ficha para o lote: as chamadas individuais do fallback não consomem outra
+    results = gemini.analyze_batch([("a", "Email A"), ("b", "Email B")], user="ana@example.com")
+    assert [r["reasoning"] for r in results] == ["Individual", "Individual"]
+    with pytest.raises(RateLimitExceeded):
+        gemini.analyze_email("c", "Email C", user="ana@example.com")
@@ -0,0 +1,50 @@
+import json
+import sys
+sys.path.append('src')
+from gemini_service import AnalysisStreamParser
+
+ANSWER = json.dumps({
+    "classification": "produtivo",
+    "suggested_response": "Olá, \"Ana\"!\nSegue o relatório 😀",
+    "reasoning": "Pedido de ação"
+}, ensure_ascii=True)
+
+
+def test_parser_handles_escapes_split_across_chunks():
+    parser = AnalysisStreamParser()
+    events = []
+    # Um caractere por vez: escapes e surrogates chegam partidos
+    for char in ANSWER:
+        events.extend(parser.feed(char))
+
+    assert events[0] == ("classification", "produtivo")
+    tokens = "".join(value for kind, value in events if kind == "token")
+    assert tokens == json.loads(ANSWER)["suggested_response"]
+    assert parser.result() == json.loads(ANSWER)
+
+
+def test_parser_null_response_emits_no_tokens():
+    parser = AnalysisStreamParser()
+    events = parser.feed('{"classification": "improdutivo", "suggested_response": null, "reasoning": "Spam"}')
+    assert events == [("classification", "improdutivo")]
+
+
+def test_stream_emits_classification_before_done_and_caches(make_gemini):
+    gemini = make_gemini(reply=ANSWER)
+    events = list(gemini.analyze_email_stream("relatori", "Relatório"))
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "classification"
+    assert kinds[-1] == "done"
+    assert events[-1][1]["model_used"] == "gemini-2.5-flash"
+
+    cached = list(gemini.analyze_email_stream("relatori", "Relatório"))
+    assert cached[-1][1]["model_used"] == "cache:gemini-2.5-flash"
+    assert len(gemini.client.models.calls) == 1
+
+
+def test_stream_failure_after_first_event_reports_error(make_gemini):
+    gemini = make_gemini(reply=ANSWER, fail_after=60)
+    events = list(gemini.analyze_email_stream("relatori", "Relatório"))
+    assert events[0] == ("classification", "produtivo")
+    assert events[-1][0] == "error"
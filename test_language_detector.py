@@ -0,0 +1,39 @@
+import sys
+sys.path.append('src')
+import pytest
+from language_detector import detect_language
+from nlp_processor import NLPRegistry
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("Olá equipe, podem confirmar a reunião de amanhã e enviar o relatório atualizado?", "pt"),
+    ("Hi team, could you please confirm tomorrow's meeting and send the updated report?", "en"),
+    ("Hola equipo, ¿pueden confirmar la reunión de mañana y enviar el informe actualizado?", "es"),
+    ("Adjunto la factura correspondiente al pedido 123, quedo atento a sus comentarios.", "es"),
+])
+def test_detect_language(text, expected):
+    assert detect_language(text) == expected
+
+
+def test_detect_language_falls_back_to_default():
+    assert detect_language("12345 !!!") == "pt"
+    assert detect_language("Hi team, please send the report", languages=("pt", "es")) == "pt"
+
+
+def test_registry_builds_one_processor_per_language():
+    registry = NLPRegistry(("pt", "en", "es"))
+    assert registry.get("en") is registry.get("en")
+    assert registry.get("en").language == "english"
+    assert registry.get("es") is not registry.get("en")
+    assert registry.detect("Could you please send the invoice?") == "en"
+    with pytest.raises(ValueError):
+        registry.get("fr")
+
+
+def registry_stem(language, word):
+    return NLPRegistry().get(language)._stem(word)
+
+
+def test_snowball_stemmers_for_english_and_spanish():
+    assert registry_stem("en", "meetings") == "meet"
+    assert registry_stem("es", "reuniones") == "reunion"
@@ -0,0 +1,64 @@
+import sys
+sys.path.append('src')
+from local_classifier import LocalClassifier, trusted_label
+
+PRODUTIVO = [
+    "precis relatori reuniao amanh",
+    "pod envi contrat assin hoj",
+    "problem acess sistem preciso ajud",
+    "confirm reuniao client sext",
+    "envi propost atualiz client",
+    "erro pagament fatur verific urgent",
+]
+IMPRODUTIVO = [
+    "promoca imperdivel desconto compr agor",
+    "newslett semanal ofert exclusiv",
+    "obrig mensag feliz nat",
+    "desconto black friday ofert",
+    "notificaca automat nao respond",
+    "ganh cupom desconto promoca",
+]
+
+
+def train():
+    texts = PRODUTIVO + IMPRODUTIVO
+    labels = ["produtivo"] * len(PRODUTIVO) + ["improdutivo"] * len(IMPRODUTIVO)
+    return LocalClassifier.train(texts, labels, n_features=2 ** 12)
+
+
+def test_separates_training_classes():
+    model = train()
+    assert model.classify("desconto promoca ofert")[0] == "improdutivo"
+    assert model.classify("reuniao client relatori")[0] == "produtivo"
+
+
+def test_decide_escalates_uncertain_and_reply_cases():
+    model = train()
+    # Fora do vocabulário: probabilidade perto de 0.5, vai para o Gemini
+    assert model.decide("xyz abc", threshold=0.9) is None
+
+    label, confidence = model.classify("reuniao client relatori")
+    assert model.decide("reuniao client relatori", threshold=confidence - 0.01) is None
+    local = model.decide("reuniao client relatori", threshold=confidence - 0.01, need_reply=False)
+    assert local["classification"] == "produtivo"
+    assert local["model_used"] == "local"
+
+
+def test_save_and_load(tmp_path):
+    model = train()
+    model_path, vectorizer_path = str(tmp_path / "clf.pkl"), str(tmp_path / "vec.pkl")
+    model.save(model_path, vectorizer_path)
+
+    loaded = LocalClassifier.load(model_path, vectorizer_path)
+    assert abs(loaded.predict_proba("promoca desconto") - model.predict_proba("promoca desconto")) < 1e-6
+    assert LocalClassifier.load(str(tmp_path / "missing.pkl"), vectorizer_path) is None
+
+
+def test_training_uses_only_gemini_or_human_labels():
+    assert trusted_label("gemini-2.5-flash")
+    assert trusted_label("cache:gemini-2.5-flash")
+    assert trusted_label("human")
+    assert not trusted_label("local")
+    assert not trusted_label("near_duplicate:gemini-2.5-flash")
+    # Linhas gravadas antes da coluna model_used: só o Gemini classificava
+    assert trusted_label(None)
@@ -0,0 +1,36 @@
+import sys
+sys.path.append('src')
+import pytest
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram("test_seconds", "Teste", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, stage="nlp")
+
+    text = registry.render()
+    assert 'test_seconds_bucket{stage="nlp",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="nlp",le="1"} 2' in text
+    assert 'test_seconds_bucket{stage="nlp",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="nlp"} 3' in text
+
+
+def test_spans_feed_server_timing_and_error_counter():
+    metrics.start_request()
+    errors_before = metrics.STAGE_ERRORS.value(stage="test.fail")
+
+    with metrics.span("test.ok"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.span("test.fail"):
+            raise ValueError("falha")
+    metrics.observe("test.ok", 0.002)
+
+    header = metrics.server_timing(total=0.01)
+    assert header.startswith("test.ok;dur=")
+    assert "test.fail;dur=" in header
+    assert header.endswith("total;dur=10.0")
+    assert metrics.STAGE_ERRORS.value(stage="test.fail") == errors_before + 1
+    assert metrics.STAGE_SECONDS.count(stage="test.ok") >= 2
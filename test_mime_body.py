@@ -0,0 +1,44 @@
+import email
+import glob
+import os
+import sys
+sys.path.append('src')
+import pytest
+from email.header import decode_header, make_header
+from mime_body import decode_payload, extract_body, html_to_text
+
+CORPUS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'samples', 'eml', '*.eml')))
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return email.message_from_bytes(f.read())
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=os.path.basename)
+def test_extracts_expected_text_from_corpus(path):
+    msg = load(path)
+    # Cada arquivo do corpus traz no cabeçalho X-Expected-Text um trecho do corpo esperado
+    expected = str(make_header(decode_header(msg["X-Expected-Text"])))
+    body = extract_body(msg)
+    assert expected in body
+    assert "<" not in body and "�" not in body
+    assert len(body) <= 5000
+
+
+def test_long_body_is_cut_at_budget():
+    msg = load(os.path.join(os.path.dirname(__file__), 'samples', 'eml', 'long_base64.eml'))
+    assert len(extract_body(msg)) == 5000
+    assert len(extract_body(msg, max_chars=100)) == 100
+    # Decodificação limitada: mesmo prefixo que a decodificação completa
+    full = decode_payload(msg)
+    assert full.startswith(decode_payload(msg, max_bytes=1000)[:990])
+
+
+def test_plain_text_attachment_is_not_the_body():
+    msg = load(os.path.join(os.path.dirname(__file__), 'samples', 'eml', 'html_with_attachments.eml'))
+    assert "ERRO 500" not in extract_body(msg)
+
+
+def test_html_to_text():
+    assert html_to_text("<style>p{}</style><p>Olá&nbsp;<b>mundo</b></p><p>fim</p>") == "Olá mundo\nfim"
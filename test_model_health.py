@@ -0,0 +1,86 @@
+import asyncio
+import sys
+import pytest
+sys.path.append('src')
+from model_health import ModelHealth, ModelsUnavailable
+
+
+def test_circuit_opens_and_half_opens():
+    health = ModelHealth(failure_threshold=2, cooldown=0)
+    health.record_failure("m", 0.1, "erro")
+    assert health.allow("m")
+    health.record_failure("m", 0.1, "erro")
+    assert health.stats()["m"]["state"] == "open"
+
+    # Cooldown expirado: libera apenas uma requisição de teste
+    assert health.allow("m")
+    assert not health.allow("m")
+    health.record_success("m", 0.05)
+    assert health.stats()["m"]["state"] == "closed"
+
+
+def test_open_model_is_skipped(make_gemini):
+    gemini = make_gemini(available_models=["gemini-3-pro-preview", "gemini-2.5-flash"],
+                         failing={"gemini-3-pro-preview"})
+    gemini.model_health = ModelHealth(failure_threshold=1, cooldown=60)
+
+    first = gemini.analyze_email("reuniao amanh", "Reunião amanhã")
+    second = gemini.analyze_email("relatori", "Relatório")
+
+    assert first["model_used"] == "gemini-2.5-flash"
+    assert second["model_used"] == "gemini-2.5-flash"
+    assert gemini.client.models.calls == ["gemini-3-pro-preview", "gemini-2.5-flash", "gemini-2.5-flash"]
+
+    stats = gemini.get_model_stats()
+    assert stats["gemini-3-pro-preview"]["errors"] == 1
+    assert stats["gemini-2.5-flash"]["calls"] == 2
+
+
+def test_disconnected_stream_releases_half_open_probe(make_gemini):
+    gemini = make_gemini(available_models=["m"])
+    gemini.model_health = ModelHealth(failure_threshold=1, cooldown=0)
+    gemini.model_health.record_failure("m", 0.1, "erro")
+
+    # Cliente SSE desconecta no meio da requisição de teste (half-open)
+    events = gemini.analyze_email_stream("reuniao", "Reunião")
+    assert next(events) == ("classification", "produtivo")
+    events.close()
+
+    assert gemini.model_health.allow("m")
+
+
+def test_all_circuits_open_fails_fast(make_gemini):
+    gemini = make_gemini(available_models=["gemini-3-pro-preview", "gemini-2.5-flash"])
+    gemini.model_health = ModelHealth(failure_threshold=1, cooldown=30)
+    for model in gemini.available_models:
+        gemini.model_health.record_failure(model, 0.1, "erro")
+
+    # Nenhum modelo fechado nem liberado para teste: nenhuma chamada ao Gemini
+    with pytest.raises(ModelsUnavailable) as excinfo:
+        gemini.analyze_email("reuniao", "Reunião")
+    assert gemini.client.models.calls == []
+    assert 29 < excinfo.value.retry_after <= 30
+    assert excinfo.value.retry_after_seconds == 30
+
+    with pytest.raises(ModelsUnavailable):
+        next(gemini.analyze_email_stream("reuniao", "Reunião"))
+
+
+def test_async_paths_share_attempt_bookkeeping(make_gemini):
+    gemini = make_gemini(available_models=["ruim", "bom"], failing={"ruim"})
+    gemini.model_health = ModelHealth(failure_threshold=2, cooldown=0)
+
+    async def main():
+        analysis = await gemini.analyze_email_async("aviso", "Aviso")
+        events = gemini.analyze_email_stream_async("reuniao", "Reunião")
+        first = await anext(events)
+        await events.aclose()
+        return analysis, first
+
+    analysis, first = asyncio.run(main())
+    assert analysis["model_used"] == "bom"
+    assert first == ("classification", "produtivo")
+
+    stats = gemini.get_model_stats()
+    assert stats["ruim"]["errors"] == 2 and stats["ruim"]["state"] == "open"
+    assert stats["bom"]["calls"] == 1 and stats["bom"]["errors"] == 0
@@ -0,0 +1,68 @@
+import sys
+sys.path.append('src')
+from near_duplicate import NearDuplicateIndex, hamming_distance, simhash
+
+NEWSLETTER = (
+    "ola client sua fatur mes outubr esta disponivel acess port consult valor "
+    "vencimento pagament pod ser feit boleto pix cartao credit dav duvid entr "
+    "contat centr atend horari comercial segund sext equip agradec preferenc "
+    "continu acompanh novidad servic ofert exclusiv assin plan anual descont"
+).split()
+ANALYSIS = {"classification": "improdutivo", "suggested_response": None,
+            "reasoning": "Notificação automática", "model_used": "gemini-2.5-flash"}
+
+
+def variant(stems, position, word):
+    return stems[:position] + [word] + stems[position + 1:]
+
+
+def test_simhash_is_stable_and_close_for_small_edits():
+    assert simhash(NEWSLETTER) == simhash(list(NEWSLETTER))
+    assert hamming_distance(simhash(NEWSLETTER), simhash(variant(NEWSLETTER, 6, "novembr"))) <= 8
+
+
+def test_lookup_finds_near_duplicate_only():
+    index = NearDuplicateIndex()
+    entry_id = index.add(NEWSLETTER, ANALYSIS)
+
+    match = index.lookup(variant(NEWSLETTER, 6, "novembr"))
+    assert match["id"] == entry_id
+    assert match["similarity"] >= 1 - 8 / 64
+    assert match["analysis"] == ANALYSIS
+
+    assert index.lookup("precis relatori reuniao amanh client envi contrat assin".split()) is None
+
+
+def test_short_emails_are_ignored():
+    index = NearDuplicateIndex(min_features=5)
+    assert index.add(["ok", "obrig"], ANALYSIS) is None
+    assert index.lookup(["ok", "obrig"]) is None
+    assert len(index) == 0
+
+
+def test_persists_and_evicts(tmp_path):
+    path = str(tmp_path / "near.sqlite3")
+    index = NearDuplicateIndex(path=path, max_entries=2)
+    index.add(NEWSLETTER, ANALYSIS)
+    index.add(variant(NEWSLETTER, 0, "prezad"), ANALYSIS)
+    index.add("precis relatori reuniao amanh client envi contrat assin".split(), ANALYSIS)
+    assert len(index) == 2
+
+    # Outro processo (ou worker) lê as entradas já gravadas
+    reopened = NearDuplicateIndex(path=path, max_entries=2)
+    assert len(reopened) == 2
+    assert reopened.lookup("precis relatori reuniao amanh client envi contrat assin".split()) is not None
+
+
+def test_lookup_is_scoped_by_owner(tmp_path):
+    index = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"))
+    index.add(NEWSLETTER, ANALYSIS, owner="a@example.com")
+
+    # A resposta e a justificativa vêm do email de outro usuário: nunca são entregues
+    assert index.lookup(NEWSLETTER, owner="b@example.com") is None
+    assert index.lookup(NEWSLETTER) is None
+    assert index.lookup(NEWSLETTER, owner="a@example.com")["analysis"] == ANALYSIS
+
+    reopened = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"))
+    assert reopened.lookup(NEWSLETTER, owner="b@example.com") is None
+    assert reopened.lookup(NEWSLETTER, owner="a@example.com") is not None
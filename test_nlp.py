@@ -1,4 +1,7 @@
-from src.nlp_processor import NLPProcessor
+import sys
+sys.path.append('src')
+from nltk.stem import RSLPStemmer
+from src.nlp_processor import NLPProcessor, NLPRegistry, _chunks, _compact_rslp_rules, _map_chunks
 
 def test_nlp():
     print("Iniciando teste de NLP...")
@@ -39,5 +42,100 @@ def test_nlp():
     
     print("\nTeste concluído com sucesso!")
 
+
+def test_process_all_matches_pipeline():
+    processor = NLPProcessor()
+    sample_text = """
+    Prezados, segue em anexo o relatório financeiro do trimestre.
+    Aguardo retorno até sexta-feira: https://example.com/relatorio?id=1
+    Obrigado! contato@example.com
+    """
+
+    cleaned = processor.clean_text(sample_text)
+    no_stopwords = processor.remove_stopwords(cleaned)
+    stemmed = processor.apply_stemming(no_stopwords)
+
+    result = processor.process_all(sample_text)
+    assert result["cleaned_text"] == cleaned
+    assert result["text_no_stopwords"] == no_stopwords
+    assert result["stemmed_text"] == stemmed
+    assert result["stems"] == stemmed.split()
+
+
+def test_stem_cache_counts_hits(tmp_path):
+    processor = NLPProcessor(stem_cache_size=2)
+    processor.apply_stemming("reunião reunião reunião")
+    info = processor.stem_cache_info()
+    assert info["misses"] == 1
+    assert info["hits"] == 2
+
+    # Palavras novas expulsam as menos usadas quando o limite é atingido
+    processor.apply_stemming("projeto relatório")
+    assert processor.stem_cache_info()["currsize"] == 2
+
+    freq_file = tmp_path / "freq.txt"
+    freq_file.write_text("projeto 120\nreunião 80\nrelatório 30\n", encoding="utf-8")
+    processor.clear_stem_cache()
+    assert processor.warm_stem_cache(str(freq_file)) == 2
+    processor.apply_stemming("projeto")
+    assert processor.stem_cache_info()["hits"] == 1
+
+
+def test_warm_stem_cache_matches_process_all_tokens(tmp_path):
+    freq_file = tmp_path / "freq.txt"
+    freq_file.write_text("Reunião 80\nrelatório 30\nAprovação 10\n", encoding="utf-8")
+    processor = NLPProcessor()
+    assert processor.warm_stem_cache(str(freq_file)) == 3
+
+    # As palavras aquecidas são as mesmas (sem acento, minúsculas) que o pipeline gera
+    processor.process_all("Reunião relatório aprovação")
+    info = processor.stem_cache_info()
+    assert info["misses"] == 3
+    assert info["hits"] == 3
+
+
+def test_registry_warms_each_language_from_its_own_file(tmp_path):
+    (tmp_path / "freq_pt.txt").write_text("reunião\nrelatório\n", encoding="utf-8")
+    (tmp_path / "freq_en.txt").write_text("meeting\n", encoding="utf-8")
+    registry = NLPRegistry(('pt', 'en', 'es'))
+    assert registry.warm_stem_cache(str(tmp_path / "freq_{lang}.txt")) == 3
+    assert registry.get('pt').stem_cache_info()["currsize"] == 2
+    assert registry.get('en').stem_cache_info()["currsize"] == 1
+    assert 'es' not in registry._processors
+
+
+def test_compact_rslp_rules_keep_stems():
+    # Tabela reduzida no formato lido pelo RSLPStemmer (sem depender do nltk_data)
+    stemmer = RSLPStemmer.__new__(RSLPStemmer)
+    stemmer._model = [[["s", 1, "", ["lápis", "pires"]]], [["a", 3, "o", ["casa"]]]] + \
+        [[["mente", 4, "", ["experimente"]], ["ção", 3, "", [""]]]] * 5
+    words = ["reuniões", "lápis", "gata", "casa", "rapidamente", "experimente", "ação", "relação"]
+    expected = [stemmer.stem(word) for word in words]
+
+    _compact_rslp_rules(stemmer)
+
+    assert isinstance(stemmer._model, tuple)
+    assert isinstance(stemmer._model[0][0][3], frozenset)
+    assert [stemmer.stem(word) for word in words] == expected
+
+
+def _square_chunk(chunk):
+    return [n * n for n in chunk]
+
+
+def test_map_chunks_keeps_input_order():
+    numbers = range(1000)
+    expected = [n * n for n in numbers]
+    assert list(_map_chunks(_square_chunk, _chunks(iter(numbers), 7), workers=3)) == expected
+    assert list(_map_chunks(_square_chunk, _chunks(numbers, 7), workers=1)) == expected
+
+
+def test_preprocess_many_matches_preprocess():
+    processor = NLPProcessor()
+    texts = [f"Podem enviar o relatório {i} da reunião de amanhã?" for i in range(50)]
+    assert list(processor.preprocess_many(texts, workers=2, chunk_size=8)) == \
+        [processor.preprocess(text) for text in texts]
+
+
 if __name__ == "__main__":
-    test_nlp()
\ No newline at end of file
+    test_nlp()
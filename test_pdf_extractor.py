@@ -0,0 +1,68 @@
+import io
+import os
+import sys
+import PyPDF2
+sys.path.append('src')
+import pdf_extractor
+from pdf_extractor import discard_spool, extract_pdf_text, iter_pdf_pages, spool_upload
+
+
+def make_pdf(page_texts):
+    """Gera um PDF mínimo com uma linha de texto por página"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def legacy_extract(data):
+    text = ""
+    for page in PyPDF2.PdfReader(io.BytesIO(data)).pages:
+        text += page.extract_text() + "\n"
+    return text
+
+
+def test_extract_matches_legacy_output():
+    data = make_pdf([f"Pagina {i} do relatorio" for i in range(1, 4)])
+    assert extract_pdf_text(data) == legacy_extract(data)
+
+
+def test_large_upload_is_spooled_and_extracted_in_parallel(monkeypatch):
+    monkeypatch.setattr(pdf_extractor, "PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(pdf_extractor, "PAGES_PER_TASK", 3)
+    monkeypatch.setattr(pdf_extractor, "PDF_WORKERS", 2)
+    data = make_pdf([f"Pagina {i}" for i in range(1, 11)])
+
+    source = spool_upload(io.BytesIO(data), max_memory=100)
+    try:
+        assert isinstance(source, str)
+        assert extract_pdf_text(source) == legacy_extract(data)
+    finally:
+        discard_spool(source)
+    assert not os.path.exists(source)
+    # A rota de streaming descarta o arquivo no gerador e no fechamento da resposta
+    discard_spool(source)
+
+
+def test_early_stop_limits():
+    data = make_pdf([f"Pagina {i}" for i in range(1, 6)])
+    assert [n for n, _ in iter_pdf_pages(data, max_pages=2)] == [1, 2]
+    assert len(extract_pdf_text(data, max_chars=12)) == 12
@@ -0,0 +1,42 @@
+import sys
+sys.path.append('src')
+from prompt_builder import PromptBuilder, estimate_tokens, strip_email_noise, truncate_to_budget
+
+REPLY = """Oi Ana, pode me enviar o contrato assinado até sexta?
+
+Obrigado,
+--
+Carlos Souza
+Gerente Comercial
+
+Em seg., 3 de jun. de 2024 às 10:00, Ana <ana@empresa.com>
+escreveu:
+> Segue a proposta revisada.
+> Abraços"""
+
+
+def test_strip_removes_signature_and_quoted_history():
+    cleaned = strip_email_noise(REPLY)
+    assert cleaned == "Oi Ana, pode me enviar o contrato assinado até sexta?\n\nObrigado,"
+
+
+def test_strip_keeps_text_that_is_only_quotes():
+    assert strip_email_noise("> apenas citação") == "> apenas citação"
+
+
+def test_truncate_keeps_head_and_tail_within_budget():
+    text = " ".join(f"palavra{i}" for i in range(2000))
+    truncated = truncate_to_budget(text, max_tokens=100)
+
+    assert estimate_tokens(truncated) <= 100
+    assert truncated.startswith("palavra0 ")
+    assert truncated.endswith("palavra1999")
+    assert "[...]" in truncated
+
+
+def test_views_modes():
+    assert list(PromptBuilder(views="original").build_views("stem", REPLY)) == ["original"]
+    assert list(PromptBuilder(views="auto").build_views("stem", REPLY)) == ["original", "processed"]
+    # Sem espaço para as duas visões, "auto" envia apenas o original
+    long_text = "texto " * 1000
+    assert list(PromptBuilder(max_tokens=200, views="auto").build_views(long_text, long_text)) == ["original"]
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+sys.path.append('src')
+import pytest
+from rate_limiter import RateLimiter, RateLimitExceeded
+from single_flight import AsyncSingleFlight, SingleFlight
+
+SPAM = json.dumps({"classification": "improdutivo", "suggested_response": None, "reasoning": "Spam"})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_user_bucket_queues_then_rejects():
+    clock = FakeClock()
+    limiter = RateLimiter(user_rate=60, user_burst=2, global_rate=0, max_wait=1.5, clock=clock)
+    assert limiter.reserve("ana@example.com") == 0
+    assert limiter.reserve("ana@example.com") == 0
+    # Sem fichas: espera na fila (1 ficha por segundo)
+    assert limiter.reserve("ana@example.com") == pytest.approx(1.0)
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.reserve("ana@example.com")
+    assert excinfo.value.scope == "user"
+    assert excinfo.value.retry_after_seconds == 2
+    # Outro usuário não é afetado
+    assert limiter.reserve("bia@example.com") == 0
+
+    clock.now += 3
+    assert limiter.reserve("ana@example.com") == 0
+
+
+def test_global_bucket_limits_all_users():
+    limiter = RateLimiter(user_rate=600, user_burst=10, global_rate=60, global_burst=1, max_wait=0,
+                          clock=FakeClock())
+    limiter.reserve("ana@example.com")
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.reserve("bia@example.com")
+    assert excinfo.value.scope == "global"
+
+
+def test_single_flight_shares_concurrent_calls():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"classification": "produtivo"}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do("k", slow))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    # Dá tempo para os seguidores entrarem na espera antes de liberar o líder
+    time.sleep(0.1)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert flights.in_flight() == 0
+
+
+def test_async_single_flight_shares_concurrent_calls():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(flights.do("k", slow) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["ok"] * 5
+
+
+
+def test_async_single_flight_survives_leader_cancellation():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("k", slow))
+        await asyncio.sleep(0.01)
+        # Cliente do líder desconectou: o seguidor ainda recebe o resultado
+        leader.cancel()
+        result = await follower
+        assert leader.cancelled()
+        return result
+
+    assert asyncio.run(main()) == ("ok", True)
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+
+def test_analyze_email_coalesces_identical_requests(make_gemini):
+    gemini = make_gemini(reply=SPAM, delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gemini.analyze_email("promoca", "Promoção!")))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert len(gemini.client.models.calls) == 1
+    assert len(results) == 4
+    assert all(r["classification"] == "improdutivo" for r in results)
+
+
+def test_analyze_email_raises_when_user_limit_is_hit(make_gemini):
+    gemini = make_gemini(reply=SPAM)
+    gemini.rate_limiter = RateLimiter(user_rate=1, user_burst=1, global_rate=0, max_wait=0)
+    gemini.analyze_email("a", "Primeiro email", user="ana@example.com")
+    with pytest.raises(RateLimitExceeded):
+        gemini.analyze_email("b", "Segundo email", user="ana@example.com")
+    # Resultado em cache não consome o limite
+    assert gemini.analyze_email("a", "Primeiro email", user="ana@example.com")["model_used"].startswith("cache:")
@@ -0,0 +1,65 @@
+import sys
+sys.path.append('src')
+from result_cache import MemoryResultCache, SQLiteResultCache, make_cache_key
+
+
+NEWSLETTER = '{"classification": "improdutivo", "suggested_response": null, "reasoning": "Newsletter"}'
+
+
+def test_cache_key_normalizes_whitespace():
+    models = ['gemini-2.5-flash']
+    assert make_cache_key("ola  mund", " Olá\n mundo ", models) == make_cache_key("ola mund", "Olá mundo", models)
+    assert make_cache_key("ola mund", "Olá mundo", models) != make_cache_key("ola mund", "Olá mundo", ['gemini-2.0-flash'])
+
+
+def test_memory_cache_ttl_and_size():
+    cache = MemoryResultCache(ttl=60, max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.get("a")
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+
+    expired = MemoryResultCache(ttl=-1)
+    expired.set("a", {"v": 1})
+    assert expired.get("a") is None
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteResultCache(path, max_entries=2).set("a", {"classification": "produtivo"})
+    other = SQLiteResultCache(path, max_entries=2)
+    assert other.get("a") == {"classification": "produtivo"}
+
+    other.set("b", {"v": 2})
+    other.set("c", {"v": 3})
+    assert len(other) == 2
+
+
+def test_analyze_email_uses_cache(make_gemini):
+    gemini = make_gemini(reply=NEWSLETTER)
+
+    first = gemini.analyze_email("newslett seman", "Newsletter semanal")
+    second = gemini.analyze_email("newslett seman", "Newsletter semanal")
+
+    assert len(gemini.client.models.calls) == 1
+    assert first["model_used"] == "gemini-2.5-flash"
+    assert second["model_used"] == "cache:gemini-2.5-flash"
+    assert second["classification"] == "improdutivo"
+
+
+def test_prompt_config_change_misses_cache(make_gemini):
+    cache = MemoryResultCache()
+    gemini = make_gemini(cache=cache, reply=NEWSLETTER)
+    gemini.analyze_email("newslett seman", "Newsletter semanal")
+
+    # Outras visões ou outro orçamento de tokens geram outro prompt: a análise não é reaproveitada
+    other = make_gemini(cache=cache, reply=NEWSLETTER)
+    other.prompt_builder.views = "both"
+    other.analyze_email("newslett seman", "Newsletter semanal")
+    assert len(other.client.models.calls) == 1
+
+    other.prompt_builder.views = gemini.prompt_builder.views
+    assert other.analyze_email("newslett seman", "Newsletter semanal")["model_used"].startswith("cache:")
+    assert len(other.client.models.calls) == 1
@@ -0,0 +1,22 @@
+import sys
+import threading
+sys.path.append('src')
+from sqlite_local import LocalConnections
+
+
+def test_one_connection_per_thread(tmp_path):
+    connections = LocalConnections(str(tmp_path / "sub" / "local.sqlite3"))
+    main = connections()
+    assert connections() is main
+    assert main.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert main.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections()))
+    thread.start()
+    thread.join()
+    assert other[0] is not main
+
+    # Sem synchronous explícito: mantém o padrão do SQLite (FULL)
+    durable = LocalConnections(str(tmp_path / "sub" / "local.sqlite3"), synchronous=None)
+    assert durable().execute("PRAGMA synchronous").fetchone()[0] == 2
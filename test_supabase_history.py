@@ -0,0 +1,196 @@
+import sys
+from postgrest.exceptions import APIError
+sys.path.append('src')
+from local_classifier import trusted_label
+from supabase_service import SupabaseService, decode_cursor, encode_cursor, is_permanent_error
+
+
+class FakeResult:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Imita o query builder do postgrest aplicando filtros sobre uma lista"""
+
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+        self.calls = []
+        self.action = "select"
+        self.columns = "*"
+        self.limit_value = None
+
+    def select(self, columns):
+        self.calls.append(("select", columns))
+        self.columns = columns
+        return self
+
+    def insert(self, data):
+        self.action = "insert"
+        self.payload = data if isinstance(data, list) else [data]
+        return self
+
+    def delete(self, count=None, returning=None):
+        self.action = "delete"
+        return self
+
+    def in_(self, column, values):
+        self.rows = [r for r in self.rows if r[column] in values]
+        return self
+
+    def lt(self, column, value):
+        self.rows = [r for r in self.rows if r[column] < value]
+        return self
+
+    def eq(self, column, value):
+        self.calls.append(("eq", column, value))
+        self.rows = [r for r in self.rows if r[column] == value]
+        return self
+
+    def or_(self, expression):
+        self.calls.append(("or", expression))
+        created_at, row_id = self.client.cursor
+        self.rows = [r for r in self.rows if (r["created_at"], r["id"]) < (created_at, row_id)]
+        return self
+
+    def order(self, column, desc=False):
+        self.rows = sorted(self.rows, key=lambda r: r[column], reverse=desc)
+        return self
+
+    def limit(self, value):
+        self.limit_value = value
+        return self
+
+    def range(self, start, end):
+        self.rows = self.rows[start:end + 1]
+        return self
+
+    def execute(self):
+        self.client.executions += 1
+        if self.action == "insert":
+            missing = [c for record in self.payload for c in record if c in self.client.missing_columns]
+            if missing:
+                raise APIError({"code": "PGRST204",
+                                "message": f"Could not find the '{missing[0]}' column of 'emails' in the schema cache"})
+            for record in self.payload:
+                record = {"id": len(self.client.rows) + 1, "created_at": "2024-06-01", **record}
+                self.client.rows.append(record)
+            return FakeResult(self.payload)
+        if self.action == "delete":
+            self.client.rows = [r for r in self.client.rows if r not in self.rows]
+            return FakeResult([], count=len(self.rows))
+        missing = [c for c in self.columns.split(",") if c in self.client.missing_columns]
+        if missing:
+            raise APIError({"code": "42703", "message": f"column emails.{missing[0]} does not exist"})
+        return FakeResult(self.rows[:self.limit_value])
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executions = 0
+        self.cursor = None
+        self.missing_columns = set()
+
+    def table(self, name):
+        return FakeQuery(self, list(self.rows))
+
+
+def make_service(monkeypatch, rows):
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    srv = SupabaseService()
+    srv.supabase = FakeClient(rows)
+    return srv
+
+
+def test_cursor_roundtrip():
+    cursor = encode_cursor({"created_at": "2024-05-01T10:00:00+00:00", "id": 42})
+    assert decode_cursor(cursor) == ("2024-05-01T10:00:00+00:00", 42)
+
+
+def test_keyset_pages_and_projection(monkeypatch):
+    rows = [{"id": i, "created_at": f"2024-05-{i:02d}", "analyzed_by": "a@b", "classification": "produtivo"}
+            for i in range(1, 6)]
+    srv = make_service(monkeypatch, rows)
+
+    first = srv.get_history_page("a@b", limit=2, fields=["subject", "original_text"])
+    assert [r["id"] for r in first["items"]] == [5, 4]
+    assert first["next_cursor"]
+
+    srv.supabase.cursor = decode_cursor(first["next_cursor"])
+    second = srv.get_history_page("a@b", limit=2, cursor=first["next_cursor"])
+    assert [r["id"] for r in second["items"]] == [3, 2]
+
+
+def test_history_cache_is_invalidated_on_save(monkeypatch):
+    rows = [{"id": 1, "created_at": "2024-05-01", "analyzed_by": "a@b", "classification": "produtivo"}]
+    srv = make_service(monkeypatch, rows)
+
+    srv.get_history_page("a@b")
+    srv.get_history_page("a@b")
+    assert srv.supabase.executions == 1
+
+    srv.save_analysis("Texto", {"classification": "improdutivo"}, "a@b")
+    srv.get_history_page("a@b")
+    assert srv.supabase.executions == 3
+
+
+def test_saved_record_keeps_label_source(monkeypatch):
+    rows = []
+    srv = make_service(monkeypatch, rows)
+    srv.save_analysis("Texto", {"classification": "improdutivo", "model_used": "cache:gemini-2.5-flash"}, "a@b")
+    assert rows[-1]["model_used"] == "cache:gemini-2.5-flash"
+
+
+def test_unmigrated_table_saves_without_label_source(monkeypatch):
+    rows = []
+    srv = make_service(monkeypatch, rows)
+    srv.supabase.missing_columns = {"model_used"}
+
+    srv._insert_records([srv._build_record("Texto", {"classification": "produtivo", "model_used": "local"}, "a@b")])
+    srv.save_analysis("Outro", {"classification": "improdutivo", "model_used": "gemini-2.5-flash"}, "a@b")
+
+    assert [r["original_text"] for r in rows] == ["Texto", "Outro"]
+    assert not any("model_used" in r for r in rows)
+    # Depois da primeira recusa a coluna deixa de ser enviada
+    assert srv.supabase.executions == 3
+
+
+def test_training_rows_keep_gemini_and_legacy_labels(monkeypatch):
+    sources = [None, "gemini-2.5-flash", "local", "cache:gemini-2.0-flash", "near_duplicate:gemini-2.5-flash", "human"]
+    rows = [{"id": i, "original_text": f"Email {i}", "classification": "produtivo", "model_used": source}
+            for i, source in enumerate(sources, 1)]
+    rows.append({"id": 7, "original_text": "Erro", "classification": "erro", "model_used": None})
+    srv = make_service(monkeypatch, rows)
+
+    labeled = list(srv.iter_labeled_analyses(("produtivo", "improdutivo"), page_size=2))
+    assert len(labeled) == 6
+    trusted = [text for text, _, model_used in labeled if trusted_label(model_used)]
+    assert trusted == ["Email 1", "Email 2", "Email 4", "Email 6"]
+
+    # Tabela sem a coluna: as linhas vêm sem origem e todas contam como rótulos do Gemini
+    legacy = make_service(monkeypatch, [{k: v for k, v in row.items() if k != "model_used"} for row in rows])
+    legacy.supabase.missing_columns = {"model_used"}
+    assert [model_used for _, _, model_used in legacy.iter_labeled_analyses(("produtivo",))] == [None] * 6
+
+
+def test_only_client_errors_are_permanent():
+    assert is_permanent_error(APIError({"code": "23502", "message": "null value in column violates not-null"}))
+    assert is_permanent_error(APIError({"code": "PGRST204", "message": "Could not find the column"}))
+    assert not is_permanent_error(APIError({"code": "PGRST000", "message": "Could not connect"}))
+    assert not is_permanent_error(APIError({"code": "57014", "message": "canceling statement"}))
+    assert not is_permanent_error(ConnectionError("timeout"))
+
+
+def test_bulk_delete_is_scoped_to_user(monkeypatch):
+    rows = [{"id": i, "created_at": f"2024-05-{i:02d}", "analyzed_by": "a@b" if i % 2 else "c@d",
+             "classification": "improdutivo"} for i in range(1, 7)]
+    srv = make_service(monkeypatch, rows)
+
+    assert srv.delete_analyses("a@b", ids=[1, 2, 3, 99]) == 2
+    assert [r["id"] for r in srv.supabase.rows] == [2, 4, 5, 6]
+
+    assert srv.delete_analyses("c@d", older_than="2024-05-05") == 2
+    assert srv.delete_analysis(2) is False
@@ -0,0 +1,100 @@
+import sys
+import time
+sys.path.append('src')
+from write_behind import WriteBehindQueue
+
+
+class FlakySink:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def __call__(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Supabase indisponível")
+        self.batches.append(list(records))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_records_are_batched(tmp_path):
+    sink = FlakySink()
+    writer = WriteBehindQueue(sink, str(tmp_path / "journal.sqlite3"), batch_size=3, flush_interval=0.2)
+    for i in range(7):
+        writer.put({"id": i})
+
+    assert wait_for(lambda: sum(len(b) for b in sink.batches) == 7)
+    assert max(len(b) for b in sink.batches) <= 3
+    assert writer.stats()["flushed"] == 7
+    writer.stop()
+
+
+def test_failed_batch_is_retried(tmp_path):
+    sink = FlakySink(failures=1)
+    writer = WriteBehindQueue(sink, str(tmp_path / "journal.sqlite3"), flush_interval=0.05, backoff=0.01)
+    writer.put({"id": 1})
+
+    assert wait_for(lambda: sink.batches == [[{"id": 1}]])
+    assert writer.stats()["failed_attempts"] == 1
+    writer.stop()
+
+
+def test_journal_is_replayed_on_startup(tmp_path):
+    journal = str(tmp_path / "journal.sqlite3")
+    offline = WriteBehindQueue(FlakySink(failures=100), journal, flush_interval=0.05, max_retries=1)
+    offline.put({"id": 1})
+    offline.put({"id": 2})
+    assert wait_for(lambda: offline.journal_depth() == 2)
+    offline.stop()
+
+    sink = FlakySink()
+    online = WriteBehindQueue(sink, journal, flush_interval=0.05)
+    online.start()
+    assert wait_for(lambda: sink.batches == [[{"id": 1}, {"id": 2}]])
+    assert online.journal_depth() == 0
+    assert online.stats()["replayed"] == 2
+    online.stop()
+
+
+class RejectingSink:
+    """Recusa (como um 4xx) qualquer lote que contenha um registro inválido"""
+
+    def __init__(self):
+        self.batches = []
+        self.calls = 0
+
+    def __call__(self, records):
+        self.calls += 1
+        if any(record.get("invalid") for record in records):
+            raise ValueError("violates check constraint")
+        self.batches.append(list(records))
+
+
+def test_permanent_error_goes_to_dead_letter(tmp_path):
+    sink = RejectingSink()
+    writer = WriteBehindQueue(sink, str(tmp_path / "journal.sqlite3"), batch_size=3, flush_interval=0.2,
+                              backoff=0.01, is_permanent=lambda e: isinstance(e, ValueError))
+    for record in ({"id": 1}, {"id": 2, "invalid": True}, {"id": 3}):
+        writer.put(record)
+
+    # Os registros válidos do lote são gravados; o inválido não volta ao journal
+    assert wait_for(lambda: writer.stats()["dead_lettered"] == 1)
+    assert sorted(r["id"] for batch in sink.batches for r in batch) == [1, 3]
+    assert writer.journal_depth() == 0
+    assert writer.dead_letter_depth() == 1
+    assert sink.calls == 4
+    writer.stop()
+
+
+def test_journal_is_capped(tmp_path):
+    writer = WriteBehindQueue(FlakySink(failures=100), str(tmp_path / "journal.sqlite3"), max_journal=3)
+    writer._spill([{"id": i} for i in range(5)])
+    assert writer.journal_depth() == 3
+    assert writer.stats()["dropped"] == 2
+    assert [r["id"] for r in writer._claim_journal_batch()] == [2, 3, 4]
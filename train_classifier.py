@@ -0,0 +1,100 @@
+"""
+Treina o classificador local a partir do histórico de análises do Supabase
+
+Uso:
+    python train_classifier.py
+    python train_classifier.py --input emails.jsonl   # linhas com text/original_text e classification
+
+Só entram no treino rótulos do Gemini (inclusive via cache e as linhas antigas,
+sem model_used) ou correções manuais (model_used começando com "human"); os do
+próprio classificador local e os copiados de quase-duplicatas são ignorados.
+
+O modelo é salvo em config.CLASSIFIER_MODEL_PATH e config.VECTORIZER_PATH e é
+carregado pelo app na inicialização.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+import config
+from local_classifier import LocalClassifier, NEGATIVE_LABEL, POSITIVE_LABEL, trusted_label
+from nlp_processor import NLPRegistry
+
+LABELS = (POSITIVE_LABEL, NEGATIVE_LABEL)
+
+
+def fetch_from_supabase(page_size=1000):
+    from supabase_service import SupabaseService
+
+    # Sem a fila write-behind: o script só lê
+    os.environ["SUPABASE_WRITE_BEHIND"] = "false"
+    service = SupabaseService()
+    if not service.supabase:
+        raise SystemExit("Credenciais do Supabase não configuradas.")
+
+    for text, label, model_used in service.iter_labeled_analyses(LABELS, page_size):
+        # Rótulos do próprio classificador local e de quase-duplicatas ficam de fora
+        if trusted_label(model_used):
+            yield text, label
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                # Arquivos rotulados à mão não precisam de model_used; com ele, vale o mesmo filtro do Supabase
+                if "model_used" in row and not trusted_label(row["model_used"]):
+                    continue
+                yield row.get("text") or row.get("original_text"), row.get("classification")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina o classificador local de emails")
+    parser.add_argument("--input", help="Arquivo JSONL em vez do histórico do Supabase")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fração separada para avaliação")
+    parser.add_argument("--threshold", type=float,
+                        default=float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", 0.9)),
+                        help="Limiar de confiança usado no relatório")
+    parser.add_argument("--epochs", type=int, default=300)
+    args = parser.parse_args()
+
+    rows = read_jsonl(args.input) if args.input else fetch_from_supabase()
+    # Mesmo pipeline por idioma usado pelo app
+    nlp = NLPRegistry(config.SUPPORTED_LANGUAGES)
+    samples = [(nlp.process_all(text)["stemmed_text"], label)
+               for text, label in rows if text and label in LABELS]
+    if len(samples) < 10:
+        raise SystemExit(f"Poucos exemplos para treinar ({len(samples)}).")
+
+    random.Random(42).shuffle(samples)
+    split = int(len(samples) * (1 - args.holdout))
+    train, holdout = samples[:split], samples[split:]
+
+    model = LocalClassifier.train([t for t, _ in train], [l for _, l in train], epochs=args.epochs)
+
+    if holdout:
+        decided = correct = 0
+        for text, label in holdout:
+            predicted, confidence = model.classify(text)
+            if confidence >= args.threshold:
+                decided += 1
+                correct += predicted == label
+        print(f"Avaliação em {len(holdout)} exemplos: {decided} decididos localmente "
+              f"(limiar {args.threshold}), acurácia {correct / decided if decided else 0:.3f}")
+
+    # Modelo final com todos os exemplos
+    model = LocalClassifier.train([t for t, _ in samples], [l for _, l in samples], epochs=args.epochs)
+    model.save(config.CLASSIFIER_MODEL_PATH, config.VECTORIZER_PATH)
+    print(f"Modelo treinado com {len(samples)} exemplos e salvo em {config.CLASSIFIER_MODEL_PATH}")
+
+
+if __name__ == '__main__':
+    main()